@@ -0,0 +1,412 @@
+"""\
+Benchmarks for the package build pipeline.
+
+Synthetic projects are generated with a configurable number of
+distributions and files per distribution; some distributions include
+extension modules, entry points and excisable content, and the project
+includes payloads and hook scripts.  External tools (``pipenv``,
+``dpkg-deb``, ``fakeroot``, ``dpkg-architecture``, ``lsb_release``) are
+replaced with local stand-ins, so only the work done by appackager
+itself is measured.
+
+Each stage of ``Build.run()`` is timed for each project size, and the
+results are written as JSON so runs from different commits can be
+compared::
+
+    python benchmarks/build_pipeline.py --sizes 20x20,100x20,400x20 \\
+        --output results.json
+
+The reported scaling exponent for each stage is computed from the
+smallest and largest projects; values much larger than 1 indicate
+worse-than-linear behavior.
+
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), 'src'))
+
+import tomli  # noqa: E402
+
+import kt.appackager.build  # noqa: E402
+import kt.appackager.cli  # noqa: E402
+
+
+DEFAULT_SIZES = '20x20,100x20,400x20'
+
+# Every N-th distribution includes an extension module, provides a
+# console script, or is excised from the build.
+EXTENSION_EVERY = 5
+SCRIPT_EVERY = 25
+EXCISE_EVERY = 10
+
+# Stages smaller than this (in seconds) are too noisy to judge scaling.
+SCALING_THRESHOLD = 0.05
+
+PYTHONDIR = 'python%d.%d' % sys.version_info[:2]
+
+MODULE_TEMPLATE = '''\
+"""Synthetic module {index} of {dist}."""
+
+import os
+
+
+CONSTANT_{index} = {index}
+
+
+def function_{index}(value):
+    """Return something computed from *value*."""
+    return os.path.join(str(value), {dist!r}) * CONSTANT_{index}
+
+
+class Class{index}(object):
+    """A synthetic class."""
+
+    def method(self):
+        return function_{index}(self)
+'''
+
+PIPENV_STANDIN = '''\
+#!{python}
+import os, shutil, sys
+venv = os.environ['BENCH_VENV']
+site = os.path.join(venv, 'lib', {pythondir!r}, 'site-packages')
+args = sys.argv[1:]
+if args == ['--venv']:
+    if os.path.isdir(venv):
+        print(venv)
+        sys.exit(0)
+    sys.exit(1)
+elif 'sync' in args:
+    os.makedirs(os.path.dirname(site))
+    shutil.copytree(os.environ['BENCH_SITE'], site, symlinks=True)
+elif args[:2] == ['run', 'python']:
+    print(os.path.join(site, 'pip', '__init__.py'))
+else:
+    sys.exit('unsupported pipenv invocation: %r' % (args,))
+'''
+
+DPKG_DEB_STANDIN = '''\
+#!{python}
+import subprocess, sys
+args = [arg for arg in sys.argv[1:] if not arg.startswith('-Z')
+        and not arg.startswith('-z')]
+assert args[0] == '-b', args
+directory = args[1].rstrip('/')
+output = args[2] if len(args) > 2 else directory + '.deb'
+subprocess.check_call(['tar', 'czf', output, '-C', directory, '.'])
+'''
+
+SIMPLE_STANDINS = {
+    'fakeroot': '#!/bin/sh\nexec "$@"\n',
+    'dpkg-architecture': '#!/bin/sh\necho amd64\n',
+    'lsb_release': ('#!/bin/sh\ncase "$1" in\n'
+                    '  --id) echo Benchmark;;\n'
+                    '  *) echo 1.0;;\nesac\n'),
+}
+
+EXTENSION_SOURCE = '''\
+double synthetic_compute(double value) { return value * 2.0; }
+'''
+
+
+def write(path, content, mode=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def record_line(site_packages, path):
+    with open(os.path.join(site_packages, path), 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    size = os.path.getsize(os.path.join(site_packages, path))
+    return f'{path},sha256={digest},{size}\n'
+
+
+def install_standins(bindir):
+    python = sys.executable
+    write(os.path.join(bindir, 'pipenv'),
+          PIPENV_STANDIN.format(python=python, pythondir=PYTHONDIR), 0o755)
+    write(os.path.join(bindir, 'dpkg-deb'),
+          DPKG_DEB_STANDIN.format(python=python), 0o755)
+    for name, content in SIMPLE_STANDINS.items():
+        write(os.path.join(bindir, name), content, 0o755)
+
+
+def compile_extension(directory):
+    compiler = shutil.which(os.environ.get('CC', 'cc'))
+    if compiler is None:
+        return None
+    source = os.path.join(directory, 'extension.c')
+    target = os.path.join(directory, 'extension.so')
+    write(source, EXTENSION_SOURCE)
+    subprocess.check_call(
+        [compiler, '-g', '-shared', '-fPIC', '-o', target, source])
+    return target
+
+
+def generate_site_packages(site_packages, dists, files, extension):
+    """Generate a synthetic site-packages tree.
+
+    Returns the names of the distributions to excise and a mapping of
+    script names to entry points.
+
+    """
+    excise = []
+    scripts = {}
+    write(os.path.join(site_packages, 'pip', '__init__.py'), '')
+    for i in range(dists):
+        dist = f'synth{i:05d}'
+        paths = []
+        for j in range(files):
+            # Spread files over nested subpackages of 10 files each.
+            subdir = os.path.join(dist, *(f'sub{k}' for k in range(j // 10)))
+            if j % 10 == 0:
+                path = os.path.join(subdir, '__init__.py')
+                write(os.path.join(site_packages, path), '')
+            elif j % 10 == 9:
+                path = os.path.join(subdir, f'data{j}.json')
+                write(os.path.join(site_packages, path),
+                      json.dumps({'dist': dist, 'index': j}) + '\n')
+            else:
+                path = os.path.join(subdir, f'module{j}.py')
+                write(os.path.join(site_packages, path),
+                      MODULE_TEMPLATE.format(dist=dist, index=j))
+            paths.append(path)
+        if extension and i % EXTENSION_EVERY == 0:
+            path = os.path.join(
+                dist, f'_speedups.cpython-{PYTHONDIR[6:].replace(".", "")}'
+                      f'-x86_64-linux-gnu.so')
+            shutil.copy(extension, os.path.join(site_packages, path))
+            paths.append(path)
+
+        distinfo = f'{dist}-1.0.dist-info'
+        metadata = os.path.join(distinfo, 'METADATA')
+        write(os.path.join(site_packages, metadata),
+              f'Metadata-Version: 2.1\nName: {dist}\nVersion: 1.0\n')
+        wheel = os.path.join(distinfo, 'WHEEL')
+        write(os.path.join(site_packages, wheel),
+              'Wheel-Version: 1.0\nRoot-Is-Purelib: true\n'
+              'Tag: py3-none-any\n')
+        paths.extend([metadata, wheel])
+        if i % SCRIPT_EVERY == 0:
+            script = f'tool{i:05d}'
+            entry_points = os.path.join(distinfo, 'entry_points.txt')
+            write(os.path.join(site_packages, entry_points),
+                  f'[console_scripts]\n{script} = {dist}:main\n')
+            paths.append(entry_points)
+            scripts[script] = f'{dist}:{script}'
+        if i % EXCISE_EVERY == EXCISE_EVERY - 1:
+            excise.append(dist)
+
+        with open(os.path.join(site_packages, distinfo, 'RECORD'), 'w') as f:
+            for path in paths:
+                f.write(record_line(site_packages, path))
+            f.write(f'../../../bin/{dist},,\n')
+            f.write(f'{distinfo}/RECORD,,\n')
+    return excise, scripts
+
+
+def generate_project(project, dists, excise, scripts):
+    os.makedirs(project)
+    packages = {f'synth{i:05d}': {'version': '==1.0'} for i in range(dists)}
+    write(os.path.join(project, 'Pipfile.lock'),
+          json.dumps({'default': packages, 'develop': {}}, indent=4))
+    write(os.path.join(project, 'debian', 'postinst'),
+          '#!/bin/sh\nexit 0\n', 0o755)
+    for i in range(20):
+        write(os.path.join(project, 'payload', 'etc', f'config{i}.conf'),
+              f'setting = {i}\n')
+    write(os.path.join(project, 'README.txt'), 'Synthetic project.\n')
+
+    config = [
+        '[package]',
+        'name = "synthetic"',
+        'maintainer = "Benchmark"',
+        '',
+        '[dependencies]',
+        'requires = []',
+        '',
+        '[installation]',
+        'directory = "/opt/synthetic"',
+        f'python = {json.dumps(sys.executable)}',
+        f'excise-packages = {json.dumps(excise)}',
+        '',
+        '[payload.etc]',
+        'source = "payload/etc"',
+        'destination = "etc"',
+        '',
+        '[payload.readme]',
+        'source = "README.txt"',
+        'destination = "share/README.txt"',
+        '',
+    ]
+    for script, entrypoint in sorted(scripts.items()):
+        config.extend([f'[script.{script}]',
+                       f'entry-point = "{entrypoint}"', ''])
+    write(os.path.join(project, 'appackager.toml'), '\n'.join(config))
+
+    for command in (['git', 'init', '-q'],
+                    ['git', 'add', '-A'],
+                    ['git', '-c', 'user.name=Benchmark',
+                     '-c', 'user.email=benchmark@example.com',
+                     'commit', '-q', '-m', 'Synthetic project.'],
+                    ['git', 'tag', 'v1.0.0']):
+        subprocess.check_call(command, cwd=project)
+
+
+def run_build(project):
+    with open(os.path.join(project, 'appackager.toml'), 'rb') as f:
+        config = kt.appackager.cli.Configuration(tomli.load(f))
+    config.set_version = None
+    workdir = os.getcwd()
+    output = io.StringIO()
+    os.chdir(project)
+    try:
+        build = kt.appackager.build.Build(config)
+        with contextlib.redirect_stdout(output):
+            start = time.perf_counter()
+            build.run()
+            total = time.perf_counter() - start
+    finally:
+        os.chdir(workdir)
+    return total, build.timings
+
+
+def benchmark(dists, files, workdir, extension):
+    sizedir = os.path.join(workdir, f'{dists}x{files}')
+    site_packages = os.path.join(sizedir, 'site-packages')
+    project = os.path.join(sizedir, 'project')
+    excise, scripts = generate_site_packages(
+        site_packages, dists, files, extension)
+    generate_project(project, dists, excise, scripts)
+
+    os.environ['BENCH_SITE'] = site_packages
+    os.environ['BENCH_VENV'] = os.path.join(sizedir, 'venv')
+    # Start with an empty cache for each size:
+    os.environ['XDG_CACHE_HOME'] = os.path.join(sizedir, 'cache')
+
+    total, timings = run_build(project)
+    return {
+        'dists': dists,
+        'files_per_dist': files,
+        'files': dists * files,
+        'total': round(total, 4),
+        'stages': {name: round(seconds, 4)
+                   for name, seconds in sorted(timings.items())},
+    }
+
+
+def scaling(runs):
+    # Exponent k such that time grows as size**k between the smallest
+    # and the largest runs.
+    if len(runs) < 2:
+        return {}
+    first, last = runs[0], runs[-1]
+    ratio = last['files'] / first['files']
+    if ratio <= 1:
+        return {}
+    exponents = {}
+    for stage, seconds in last['stages'].items():
+        base = first['stages'].get(stage)
+        if base and seconds >= SCALING_THRESHOLD:
+            exponents[stage] = round(
+                math.log(seconds / base) / math.log(ratio), 2)
+    return exponents
+
+
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(','):
+        dists, sep, files = part.strip().partition('x')
+        sizes.append((int(dists), int(files or 10)))
+    return sorted(sizes, key=lambda size: size[0] * size[1])
+
+
+def report(results, stream):
+    stages = sorted({stage for run in results['runs']
+                     for stage in run['stages']})
+    header = ['size', 'total'] + stages
+    print('  '.join(f'{column:>10}' for column in header), file=stream)
+    for run in results['runs']:
+        row = [f'{run["dists"]}x{run["files_per_dist"]}',
+               f'{run["total"]:.3f}']
+        row.extend(f'{run["stages"].get(stage, 0.0):.3f}'
+                   for stage in stages)
+        print('  '.join(f'{column:>10}' for column in row), file=stream)
+    for stage, exponent in sorted(results['scaling'].items()):
+        if exponent > 1.5:
+            print(f'warning: {stage} scales as size**{exponent}',
+                  file=stream)
+
+
+def revision():
+    cp = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here,
+                        capture_output=True, encoding='utf-8')
+    return cp.stdout.strip() if not cp.returncode else None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma-separated DISTSxFILES project sizes')
+    parser.add_argument('--output', '-o',
+                        help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep the generated projects')
+    settings = parser.parse_args(args)
+
+    workdir = tempfile.mkdtemp(prefix='appackager-bench-')
+    bindir = os.path.join(workdir, 'bin')
+    install_standins(bindir)
+    environ = dict(os.environ)
+    os.environ['PATH'] = bindir + os.pathsep + os.environ.get('PATH', '')
+    try:
+        extension = compile_extension(os.path.join(workdir, 'extension'))
+        if extension is None:
+            print('no C compiler; extension modules will not be included',
+                  file=sys.stderr)
+        runs = [benchmark(dists, files, workdir, extension)
+                for dists, files in parse_sizes(settings.sizes)]
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+        if settings.keep:
+            print(f'generated projects kept in {workdir}', file=sys.stderr)
+        else:
+            subprocess.call(['chmod', '-R', 'u+w', workdir])
+            shutil.rmtree(workdir)
+
+    results = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': runs,
+        'scaling': scaling(runs),
+    }
+    report(results, sys.stderr)
+    text = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if settings.output:
+        with open(settings.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
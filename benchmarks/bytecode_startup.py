@@ -0,0 +1,184 @@
+"""\
+Benchmarks for interpreter startup with each byte-code flavour.
+
+A synthetic package with many modules (with docstrings and assertions)
+is compiled the way appackager compiles installed trees, once for each
+supported flavour of byte-code.  A fresh interpreter, started with the
+flags the generated scripts would use, imports the package repeatedly;
+the median wall-clock time and peak RSS are reported as JSON::
+
+    python benchmarks/bytecode_startup.py --modules 2000 --output results.json
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), 'src'))
+
+import kt.appackager.bytecode  # noqa: E402
+import kt.appackager.cli  # noqa: E402
+
+
+DEFAULT_MODULES = 2000
+DEFAULT_REPEAT = 15
+
+FLAVOURS = {
+    'timestamp': kt.appackager.cli.Bytecode(),
+    'unchecked-hash': kt.appackager.cli.Bytecode('unchecked-hash'),
+    'unchecked-hash-O': kt.appackager.cli.Bytecode('unchecked-hash', 1),
+    'unchecked-hash-OO': kt.appackager.cli.Bytecode('unchecked-hash', 2),
+    'sourceless-OO': kt.appackager.cli.Bytecode('unchecked-hash', 2, True),
+}
+
+MODULE_TEMPLATE = '''\
+"""Module {index}.
+
+{filler}
+"""
+
+
+class Thing{index}(object):
+    """A class with a docstring.
+
+    {filler}
+    """
+
+    def method(self, value):
+        """Return *value*, after checking it.
+
+        {filler}
+        """
+        assert value is not None, 'value required'
+        return value
+
+
+def function{index}(value):
+    """Return *value* doubled.
+
+    {filler}
+    """
+    assert isinstance(value, int)
+    return value * 2
+'''
+
+FILLER = ' '.join(['Lorem ipsum dolor sit amet.'] * 20)
+
+# Run by the measured interpreter:
+PROBE = '''\
+import resource
+import benchpkg
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def generate_package(directory, modules):
+    package = os.path.join(directory, 'benchpkg')
+    os.makedirs(package)
+    imports = []
+    for index in range(modules):
+        with open(os.path.join(package, f'mod{index}.py'), 'w') as f:
+            f.write(MODULE_TEMPLATE.format(index=index, filler=FILLER))
+        imports.append(f'from . import mod{index}\n')
+    with open(os.path.join(package, '__init__.py'), 'w') as f:
+        f.write('"""Benchmark package."""\n')
+        f.writelines(imports)
+
+
+def prepare(source, directory, bytecode):
+    shutil.copytree(source, directory)
+    subprocess.check_call(
+        kt.appackager.bytecode.compile_command(
+            sys.executable, '/opt/bench/lib', bytecode),
+        cwd=directory)
+    if bytecode.sourceless:
+        kt.appackager.bytecode.remove_sources(directory)
+    # Installed trees are read-only:
+    subprocess.check_call(['chmod', '-R', 'a-w', directory])
+
+
+def measure(directory, bytecode, repeat):
+    flags = kt.appackager.bytecode.interpreter_flags(bytecode)
+    command = [sys.executable, '-Es' + flags, '-c', PROBE]
+    times = []
+    rss = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        stdout = subprocess.check_output(command, cwd=directory)
+        times.append(time.perf_counter() - start)
+        rss.append(int(stdout))
+    return {
+        'flags': '-Es' + flags,
+        'startup': round(statistics.median(times), 4),
+        'max_rss_kb': statistics.median(rss),
+    }
+
+
+def report(results, stream):
+    base = results['flavours']['timestamp']
+    print(f'{"flavour":>20}  {"startup":>8}  {"change":>7}'
+          f'  {"RSS (kB)":>9}  {"change":>7}', file=stream)
+    for name, run in results['flavours'].items():
+        time_change = run['startup'] / base['startup'] - 1
+        rss_change = run['max_rss_kb'] / base['max_rss_kb'] - 1
+        print(f'{name:>20}  {run["startup"]:8.4f}  {time_change:+7.1%}'
+              f'  {run["max_rss_kb"]:9.0f}  {rss_change:+7.1%}',
+              file=stream)
+
+
+def revision():
+    cp = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=here,
+                        capture_output=True, encoding='utf-8')
+    return cp.stdout.strip() if not cp.returncode else None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--modules', type=int, default=DEFAULT_MODULES,
+                        help='number of modules in the package')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of interpreter starts per flavour')
+    parser.add_argument('--output', '-o',
+                        help='write JSON results to this file')
+    settings = parser.parse_args(args)
+
+    workdir = tempfile.mkdtemp(prefix='appackager-bench-')
+    try:
+        source = os.path.join(workdir, 'source')
+        generate_package(source, settings.modules)
+        flavours = {}
+        for name, bytecode in FLAVOURS.items():
+            directory = os.path.join(workdir, name)
+            prepare(source, directory, bytecode)
+            flavours[name] = measure(directory, bytecode, settings.repeat)
+    finally:
+        subprocess.call(['chmod', '-R', 'u+w', workdir])
+        shutil.rmtree(workdir)
+
+    results = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'modules': settings.modules,
+        'flavours': flavours,
+    }
+    report(results, sys.stderr)
+    text = json.dumps(results, indent=2) + '\n'
+    if settings.output:
+        with open(settings.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,7 @@ import distutils.version
 import email
 import fnmatch
 import glob
+import hashlib
 import json
 import logging
 import os
@@ -18,14 +19,26 @@ import subprocess
 import sys
 import tempfile
 import textwrap
+import threading
 
-import tomli
-
+import kt.appackager.bytecode
+import kt.appackager.cache
+import kt.appackager.checkpoint
 import kt.appackager.cli
+import kt.appackager.elf
+import kt.appackager.excise
+import kt.appackager.fingerprint
+import kt.appackager.footprint
+import kt.appackager.local
+import kt.appackager.profiling
+import kt.appackager.shaking
+import kt.appackager.stages
+import kt.appackager.strip
+import kt.appackager.verify
 
 
 SCRIPT_TEMPLATE = '''\
-#!{executable} -Es
+#!{executable} -Es{flags}
 
 import os
 import sys
@@ -51,22 +64,34 @@ sys.path[:] = [p for p in sys.path
 
 # Add in the directory containing our application packages:
 sys.path.insert(0, os.path.join(lib_dir, {pythondir!r}))
-
+{runtime}
 version = {version!r}
 
-{initialization}
+{profiling}{initialization}
 import {module}
 
 if __name__ == "__main__":
-    sys.exit({module}.{object}())
+    sys.exit({call})
 '''
 
+# Groups of stages with results that can be picked up again when a
+# failed build is resumed, in order.  The checkpoint is recorded when
+# the last stage of the group completes.
+CHECKPOINTS = (
+    ('environment', ('sync', 'local', 'excise')),
+    ('tree', ('staging', 'strip', 'shake', 'compile')),
+)
+
 logger = logging.getLogger(__name__)
 
 
 def main():
+    if sys.argv[1:2] == ['verify']:
+        sys.exit(kt.appackager.verify.main(sys.argv[2:]))
     parser = kt.appackager.cli.ArgumentParser()
     settings = parser.parse_args()
+    if settings.verbose:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
     Build(settings.config).run()
 
 
@@ -77,264 +102,1126 @@ class Build(object):
     def __init__(self, config):
         self.config = config
         self.console_scripts = {}
+        self.distinfos = None
         self._local_package = None
+        self._pipfile_lock = None
+        # Stage name --> seconds spent in the stage.  Stages can run
+        # concurrently, so these can add up to more than the total.
+        self.timings = {}
+        self.timing_prefix = ''
+        # Name of the virtual environment used for this build, if not
+        # the default for the project.
+        self.venv_name = None
+        self.footprints = []
+        self.runtime_libdir = None
 
         self._mask = os.umask(2)
         os.umask(self._mask)
 
     def run(self):
-        workdir = os.getcwd()
+        self.workdir = os.getcwd()
+
+        if isinstance(self.config.analyze, str):
+            # Only reporting on an existing package.
+            self.report_footprints(self.analyze_package(self.config.analyze))
+            return
+
+        self.index = kt.appackager.fingerprint.ArtifactIndex(
+            os.path.join(self.workdir, 'packages'))
+        # Pipfile.lock is rewritten while virtual environments are being
+        # built; that can't be done independently for each target.
+        self.pipfile_lock = _SharedContext(self.sync_pipfile_lock)
+        self.debnames_claimed = _Claims()
+
+        builds = [self.target_build(target)
+                  for target in self.config.targets]
+        if len(builds) > 1:
+            for index, build in enumerate(builds):
+                label = f'{build.config.name}:{index}'
+                build.timing_prefix = label + '/'
+                build.venv_name = (
+                    f'{os.path.basename(self.workdir)}-appackager-{index}')
+
+        # Work shared by all targets:
+        stages = [
+            ('version', self.compute_version, ()),
+            ('platform', self.probe_platform, ()),
+        ]
+        fingerprint_requires = ()
+        local_scripts = [script for script in self.config.scripts
+                         if not script.entrypoint.rpartition(':')[0]]
+        if local_scripts:
+            local_requires = ()
+            if os.path.exists('setup.py'):
+                # Running setup.py can write *.egg-info into the project,
+                # which git would report while the version is computed.
+                local_requires = ('version',)
+                fingerprint_requires = ('local-dist',)
+            stages.append(
+                ('local-dist',
+                 lambda: self.get_local_dist(local_scripts[0]),
+                 local_requires))
+        # Fingerprints cover the lock, so they're all computed before
+        # any target rewrites it for syncing.
+        stages.extend(
+            (build.timing_prefix + 'fingerprint', build.compute_fingerprint,
+             fingerprint_requires)
+            for build in builds)
+        self.run_stages(stages)
+
+        for build in builds:
+            self.share_results(build)
+        if len(builds) == 1:
+            build, = builds
+            build.build_target()
+        else:
+            self.run_stages([
+                (build.timing_prefix[:-1], build.build_target, ())
+                for build in builds
+            ])
+
+        # On success, remember what we built:
+        for build in builds:
+            self.index.record(build.fingerprint, self.version,
+                              build.debnames)
+        self.commit_version()
+
+        if self.config.analyze:
+            self.report_footprints(
+                [footprint for build in builds
+                 for footprint in build.footprints])
+
+    def target_build(self, target):
+        # Build for a single target, sharing the state used by all
+        # targets.
+        build = Build(self.config.for_target(target))
+        build.workdir = self.workdir
+        build.timings = self.timings
+        build.index = self.index
+        build.pipfile_lock = self.pipfile_lock
+        build.debnames_claimed = self.debnames_claimed
+        return build
+
+    def share_results(self, build):
+        # Pass on the results of the work that doesn't depend on the
+        # target.
+        for name in ('version', 'deb_version', 'build_arch', 'distro',
+                     'platform_error', '_local_package'):
+            setattr(build, name, getattr(self, name))
+        if build.config.distro:
+            build.distro = build.config.distro
+
+    def build_target(self):
+        installation = self.config.directory
+        assert installation.startswith('/')
+
+        entry = self.index.lookup(self.fingerprint)
+        if entry is not None:
+            if self.config.force:
+                print(f'{self.config.name}: inputs match an existing'
+                      f' package; building anyway (--force).')
+            else:
+                results = self.run_stages([
+                    ('reuse', lambda: self.reuse_packages(entry), ()),
+                ])
+                self.debnames = results['reuse']
+                if self.config.analyze:
+                    self.footprints = self.analyze_package(
+                        os.path.join('packages', self.debnames[0]))
+                return
+
+        runtime = self.config.runtime
+        if runtime:
+            self.prepare_runtime()
+
+        # Work is done in a persistent directory, so a failed build can
+        # be resumed.
+        builddir = self.build_directory()
+        self.checkpoints = kt.appackager.checkpoint.Checkpoints(
+            builddir, resume=self.config.resume)
+        self.tmpdir = builddir
+        self.topdir = os.path.join(builddir, 'package')
+        self.debdir = os.path.join(self.topdir, 'DEBIAN')
+
+        print(f'Building package: {self.config.name}')
+        print(f'Installation directory: {installation}')
+        print(f'Python: {self.config.python}')
+        if runtime:
+            print(f'Runtime package: {self.runtime_package}')
+            print(f'Runtime directory: {self.runtime_directory}')
+
+        self.compute_checkpoint_digests()
+        environment = self.checkpoints.lookup(
+            'environment', self.checkpoint_digests['environment'])
+        try:
+            with SavedPipenvVenv(self.pipenv_environment(),
+                                 restore=environment and environment['venv']
+                                 ) as venv:
+                self.venv = venv
+                self.restore_checkpoints(environment)
+                stages = self.build_stages()
+                # A failure in other stages doesn't keep the stages
+                # leading to checkpoints from completing.
+                self.run_stages(stages, finish=_requirements(
+                    stages, [member for name, members in CHECKPOINTS
+                             for member in members]))
+        except BaseException:
+            recorded = self.checkpoints.recorded()
+            if recorded:
+                print(f'Build state for {self.config.name} saved in'
+                      f' {builddir} with results from'
+                      f' {", ".join(recorded)} stages;'
+                      f' use --resume to continue.', file=sys.stderr)
+            raise
+
+        for debname in self.debnames:
+            subprocess.check_call(
+                ['chmod', 'a-w', os.path.join('packages', debname)])
+        self.checkpoints.discard()
+
+    def build_directory(self):
+        key = kt.appackager.checkpoint.digest(
+            self.workdir, self.config.name, self.config.distro)
+        return kt.appackager.cache.cache_directory(
+            'builds', f'{self.config.name}-{key[:16]}')
+
+    def compute_checkpoint_digests(self):
+        # Each digest covers the inputs to the stages in the checkpoint,
+        # and the digest of the checkpoint before it.
+        environment = kt.appackager.checkpoint.digest(
+            self.read_pipfile_lock(), self.config.python, self.venv_name,
+            self.local_source_digests(), self.config.packages_to_excise,
+            kt.appackager.fingerprint.appackager_version())
+        bytecode = self.config.bytecode
+        shaking = self.config.tree_shaking
+        tree = kt.appackager.checkpoint.digest(
+            environment, self.config.directory, bool(self.config.runtime),
+            self.config.strip, self.config.debug_package,
+            bytecode and [bytecode.invalidation, bytecode.optimize,
+                          bytecode.sourceless],
+            # What's removed by tree shaking depends on the scripts:
+            shaking and [shaking.remove, shaking.keep, shaking.exercise,
+                         [[script.name, script.entrypoint,
+                           script.initialization]
+                          for script in self.config.scripts]],
+            # These determine the name of the debug package:
+            self.config.arch_specific, self.build_arch, self.distro,
+            self.deb_version)
+        self.checkpoint_digests = {
+            'environment': environment,
+            'tree': tree,
+        }
+
+    def restore_checkpoints(self, environment):
+        # Pick up the results of checkpointed stages from a failed build,
+        # as long as their inputs are unchanged.  Anything else left in
+        # the build directory is removed.  The virtual environment is
+        # only restored if the environment checkpoint matched.
+        self.restored = []
+        keep = [kt.appackager.checkpoint.FILENAME]
+        if environment and self.venv.restored:
+            self.site_packages = environment['site_packages']
+            self.pythondir = environment['pythondir']
+            self.libpython = (self.config.directory + '/lib/'
+                              + self.pythondir)
+            self.restored.append('environment')
+            tree = self.checkpoints.lookup(
+                'tree', self.checkpoint_digests['tree'])
+            if tree is not None:
+                self.dbgpkgdirname = tree['debug_directory']
+                if self.config.runtime:
+                    self.local_files = self.local_package_files()
+                keep.append(os.path.relpath(self.topdir + self.libpython,
+                                            self.tmpdir))
+                if self.dbgpkgdirname:
+                    keep.append(self.dbgpkgdirname)
+                self.restored.append('tree')
+        self.checkpoints.retain(self.restored)
+        kt.appackager.checkpoint.prune(self.tmpdir, keep)
+        if self.restored:
+            print(f'{self.config.name}: resuming with saved results from'
+                  f' {", ".join(self.restored)} stages')
+
+    def checkpoint_state(self, name):
+        if name == 'environment':
+            return {
+                'venv': self.venv.locate(),
+                'site_packages': self.site_packages,
+                'pythondir': self.pythondir,
+            }
+        return {'debug_directory': self.dbgpkgdirname}
+
+    def record_checkpoint(self, name, function):
+        def run():
+            function()
+            self.checkpoints.complete(
+                name, self.checkpoint_digests[name],
+                self.checkpoint_state(name))
+        return run
+
+    def build_stages(self):
+        # Stages are started as soon as the stages they require are
+        # complete, so anything that doesn't depend on the virtual
+        # environment is done while that's being built.
+        #
+        installation = self.config.directory
+        stages = [
+            ('prepare', self.prepare_tree, ()),
+            ('hooks', lambda: self.copy_hook_scripts(self.debdir),
+             ('prepare',)),
+            ('payloads',
+             lambda: self.copy_payloads(self.topdir + installation),
+             ('prepare',)),
+            ('sync', self.sync, ()),
+            ('local', self.install_local_packages, ('sync',)),
+            ('excise', self.excise_packages, ('local',)),
+            ('analysis', self.analyze_shared_objects, ('excise',)),
+            ('architecture', self.determine_architecture, ('analysis',)),
+            ('staging', self.stage_tree, ('analysis', 'prepare')),
+            ('strip', self.strip_package, ('staging', 'architecture')),
+            ('control', self.write_package_control, ('architecture',)),
+        ]
+        if self.config.tree_shaking:
+            # Before compiling, so unused modules aren't compiled.
+            stages.append(('shake', self.shake_tree, ('strip',)))
+            stages.append(('compile', self.compile_package, ('shake',)))
+        else:
+            stages.append(('compile', self.compile_package, ('strip',)))
+        pack_requires = ['hooks', 'payloads', 'compile', 'control']
+
+        if self.config.scripts:
+            stages.append(
+                ('scripts', self.make_scripts, ('excise', 'prepare')))
+            pack_requires.append('scripts')
+
+        if self.config.manifest:
+            # Everything in the installation directory has to be in
+            # place before the manifest is written.
+            manifest_requires = ['payloads', 'compile']
+            if self.config.scripts:
+                manifest_requires.append('scripts')
+            stages.append(
+                ('manifest', self.write_package_manifest, manifest_requires))
+            pack_requires.append('manifest')
+
+        if self.config.runtime and self.runtime_debname is None:
+            stages.append(
+                ('runtime', self.build_runtime, ('staging', 'architecture')))
+            pack_requires.append('runtime')
+
+        if self.config.analyze:
+            # Imports are measured in the staged trees, so this needs to
+            # be done before they're packaged.
+            footprint_requires = ['compile']
+            if 'runtime' in pack_requires:
+                footprint_requires.append('runtime')
+            stages.append(
+                ('footprint', self.analyze_footprint, footprint_requires))
+            pack_requires.append('footprint')
+
+        stages.append(('pack', self.pack, pack_requires))
+
+        # Stages with results saved by a failed build have nothing left
+        # to do; the last stage of each other checkpoint records it.
+        restored = set()
+        for name, members in CHECKPOINTS:
+            if name in self.restored:
+                restored.update(members)
+                continue
+            stages = [
+                (stage, self.record_checkpoint(name, function), requires)
+                if stage == members[-1] else (stage, function, requires)
+                for stage, function, requires in stages
+            ]
+        return [(stage, _nothing if stage in restored else function, requires)
+                for stage, function, requires in stages]
+
+    def run_stages(self, stages, finish=()):
+        scheduler = kt.appackager.stages.Scheduler()
+        for name, function, requires in stages:
+            scheduler.add(name, function, requires)
+        try:
+            return scheduler.run(finish=finish)
+        finally:
+            self.timings.update(
+                (self.timing_prefix + name, duration)
+                for name, duration in scheduler.durations.items())
+
+    def analyze_footprint(self):
+        flags = kt.appackager.bytecode.interpreter_flags(self.config.bytecode)
+        # Modules from the application can import from the runtime, but
+        # not the other way around.
+        path = [self.site_packages] if self.config.runtime else []
+        trees = [(self.config.name, self.topdir + self.libpython,
+                  self.libpython, path)]
+        if self.runtime_libdir:
+            trees.append((self.runtime_package, self.runtime_libdir,
+                          self.runtime_directory + '/lib/' + self.pythondir,
+                          []))
+        for package, libdir, libpython, path in trees:
+            footprint = kt.appackager.footprint.analyze_tree(
+                libdir, label=f'{package}: {libpython}')
+            kt.appackager.footprint.measure_imports(
+                footprint, self.config.python, path, flags)
+            self.footprints.append(footprint)
+
+    def analyze_package(self, debpath):
+        # Report on an existing package file.  Packages it depends on
+        # that are also in packages/ (such as the runtime) are extracted
+        # so their modules can be imported.
+        if not os.path.isfile(debpath):
+            error(f'package file {debpath} does not exist')
+        fields = subprocess.check_output(
+            ['dpkg-deb', '-f', debpath, 'Package', 'Depends'])
+        fields = email.message_from_string(str(fields, 'utf-8'))
+        package = fields['Package']
+        config = self.config
+        for target in self.config.targets:
+            if target.name == package:
+                config = self.config.for_target(target)
+
+        footprints = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            topdir = os.path.join(tmpdir, package)
+            subprocess.check_call(['dpkg-deb', '-x', debpath, topdir])
+            path = []
+            for dependency in (fields['Depends'] or '').split(','):
+                name = _dependency_name(dependency)
+                debnames = sorted(glob.glob(os.path.join(
+                    self.workdir, 'packages', f'{name}_*.deb')))
+                if name and debnames:
+                    deptopdir = os.path.join(tmpdir, name)
+                    subprocess.check_call(
+                        ['dpkg-deb', '-x', debnames[-1], deptopdir])
+                    path.extend(_python_libdirs(deptopdir))
+
+            libdirs = _python_libdirs(topdir)
+            if not libdirs:
+                error(f'no Python library directory in {debpath}')
+            flags = kt.appackager.bytecode.interpreter_flags(config.bytecode)
+            for libdir in libdirs:
+                libpython = '/' + os.path.relpath(libdir, topdir)
+                footprint = kt.appackager.footprint.analyze_tree(
+                    libdir, label=f'{package}: {libpython}')
+                kt.appackager.footprint.measure_imports(
+                    footprint, config.python, path, flags)
+                footprints.append(footprint)
+            subprocess.check_call(['chmod', '-R', 'u+w', tmpdir])
+        return footprints
+
+    def report_footprints(self, footprints):
+        for footprint in footprints:
+            print()
+            footprint.report(sys.stdout)
+        if self.config.analyze_json:
+            kt.appackager.footprint.write_json(
+                footprints, self.config.analyze_json)
+
+    def pipenv_environment(self):
+        if self.venv_name is None:
+            return None
+        return dict(os.environ, PIPENV_CUSTOM_VENV_NAME=self.venv_name)
+
+    def compute_version(self):
         version = self.version = self.next_version()
-
-        deb_version = version
+        self.deb_version = version
         if 'a' in version:
-            deb_version = version.replace('a', '~a')
+            self.deb_version = version.replace('a', '~a')
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            installation = self.config.directory
-            assert installation.startswith('/')
+    def compute_fingerprint(self):
+        self.fingerprint = kt.appackager.fingerprint.compute(
+            self.config, self.workdir, self.read_pipfile_lock(),
+            local_sources=self.local_source_digests())
 
-            print(f'Building package: {self.config.name}')
-            print(f'Installation directory: {installation}')
+    def probe_platform(self):
+        # Only needed for architecture-specific packages, but cheap
+        # enough to do while other work is in progress.  Failures are
+        # only reported if the results are needed.
+        #
+        self.build_arch = self.distro = self.platform_error = None
+        try:
+            arch = subprocess.check_output(
+                ['dpkg-architecture', '-q', 'DEB_BUILD_ARCH'])
+            self.build_arch = str(arch, 'utf-8').strip()
+
+            distro_name = subprocess.check_output(
+                ['lsb_release', '--id', '--short'])
+            distro_name = str(distro_name, 'utf-8').strip()
+
+            distro_version = subprocess.check_output(
+                ['lsb_release', '--release', '--short'])
+            distro_version = str(distro_version, 'utf-8').strip()
+
+            self.distro = distro_name.lower() + distro_version
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.platform_error = str(e)
+
+    def prepare_tree(self):
+        os.makedirs(self.debdir)
+        os.makedirs(self.topdir + self.config.directory, exist_ok=True)
+
+    def sync(self):
+        environment = self.pipenv_environment()
+        with self.pipfile_lock:
+            subprocess.check_output(
+                ['pipenv', '--bare', 'sync',
+                 '--python', self.config.python],
+                env=environment)
+
+            # Determine where site-packages is, because we need that
+            # to locate the *.dist-info directories, so we can make
+            # use of the entry point metadata.
+            #
+            pip_init = subprocess.check_output(
+                ['pipenv', 'run', 'python', '-c',
+                 'import os, pip\n'
+                 'print(os.path.abspath(pip.__file__))'],
+                env=environment)
+            pip_init = str(pip_init, 'utf-8').strip()
+
+        # We no longer need to build using pipenv; that should
+        # only happen inside the context above.
+
+        self.site_packages = os.path.dirname(os.path.dirname(pip_init))
+        assert self.site_packages.endswith('/site-packages')
+        self.pythondir = os.path.basename(
+            os.path.dirname(self.site_packages))
+        self.libpython = self.config.directory + '/lib/' + self.pythondir
+
+    def determine_architecture(self):
+        # Need to determine whether any installed packages are
+        # platform-specific.  We look at the wheel tags in the
+        # *.dist-info directories, and at the content of all files,
+        # since "pure" wheels can still include shared objects.
+        #
+        # This affects the arch_specific flag and computed package
+        # version and file name.
+
+        arch_specific = self.config.arch_specific
+        if self.analysis.arch_specific:
+            if arch_specific is None:
+                arch_specific = True
+            elif arch_specific is False:
+                # Configuration says false, but we have
+                # arch-specific packages in the build.
+                print('Including architecture specific components in'
+                      ' build, but configuration says the package is'
+                      ' architecture independent.')
+        else:
+            arch_specific = False
+        assert isinstance(arch_specific, bool)
+
+        self.build = '1'
+        if arch_specific:
+            self.arch = self.detected_architecture()
+            if self.distro is None:
+                error(f'Could not identify distribution:'
+                      f' {self.platform_error}')
+        else:
+            self.arch = 'all'
+        # Targets that differ only in their distro labels need the
+        # labels to keep their packages apart, even when they aren't
+        # architecture-specific.
+        if arch_specific or self.config.distro:
+            self.build += self.distro
+
+        self.pkgversion = f'{self.deb_version}-{self.build}'
+        self.debname = f'{self.config.name}_{self.pkgversion}_{self.arch}.deb'
+        self.claim_debname()
+
+    def claim_debname(self):
+        # Packages from different targets must not overwrite each other;
+        # that's checked before anything is packed.
+        label = self.timing_prefix[:-1] or self.config.name
+        other = self.debnames_claimed.claim(self.debname, label)
+        if other is not None:
+            error(f'Targets {other} and {label} would both build'
+                  f' {self.debname}; set different names or distro'
+                  f' labels for them.')
+
+    def stage_tree(self):
+        libdir = self.topdir + self.libpython
+        os.makedirs(libdir)
+        if self.config.runtime:
+            # Only the local packages go into the application
+            # package; everything else lands in the runtime.
+            self.local_files = self.local_package_files()
+            self.copy_site_packages(libdir, files=self.local_files)
+        else:
+            self.copy_site_packages(libdir)
+
+    def strip_package(self):
+        self.dbgpkgdirname = self.strip_tree(
+            self.topdir + self.libpython, self.config.name,
+            self.pkgversion, self.arch)
+
+    def shake_tree(self):
+        shaking = self.config.tree_shaking
+        libdir = self.topdir + self.libpython
+        path = [libdir]
+        if self.config.runtime:
+            # The runtime is shared, so only the application tree is
+            # shaken; modules from the runtime are loaded from the
+            # build environment.
+            path.append(self.site_packages)
+        runs = []
+        scripts = {}
+        for script in self.config.scripts:
+            module, object = self.script_entry_point(script)
+            scripts[script.name] = script, module, object
+            runs.append(kt.appackager.shaking.Run(
+                [script.name], module, object, script.initialization))
+        for argv in shaking.exercise:
+            script, module, object = scripts[argv[0]]
+            runs.append(kt.appackager.shaking.Run(
+                argv, module, object, script.initialization, call=True))
+        bytecode = self.config.bytecode
+        result = kt.appackager.shaking.shake(
+            self.config.python, libdir, path, runs,
+            keep=shaking.keep,
+            remove=shaking.remove,
+            flags=kt.appackager.bytecode.interpreter_flags(bytecode),
+            optimize=bytecode.optimize if bytecode else 0,
+            timeout=shaking.timeout)
+        for name, files in result.candidates.items():
+            logger.info('unused module %s: %s', name, ', '.join(files))
+        result.report(self.config.name, sys.stdout)
+        if shaking.remove and not result.removed:
+            print(f'{self.config.name}: not removing unused modules,'
+                  f' since not all entry points could be traced')
+
+    def compile_package(self):
+        installation = self.topdir + self.config.directory
+        self.compile_tree(self.topdir, self.libpython)
+        subprocess.check_call(['chmod', 'go-w', installation])
+        subprocess.check_call(['chmod', '-R', 'go-w', installation + '/lib'])
+
+    def make_scripts(self):
+        # Generate scripts while we still have the build venv; we need
+        # it to collect the entry point data from the *.dist-info
+        # directories.
+        #
+        bindir = self.topdir + self.config.directory + '/bin'
+        os.makedirs(bindir, exist_ok=True)
+        self.distinfos = self.get_package_distinfos()
+        for script in self.config.scripts:
+            self.make_script(script, bindir)
+        subprocess.check_call(['chmod', '-R', 'a-w', bindir])
+
+    def write_package_control(self):
+        requires = self.requirements()
+        if self.config.runtime:
+            requires.insert(0, self.runtime_package)
+        self.write_control(
+            self.debdir, self.config.name, self.pkgversion, self.arch,
+            self.config.description,
+            requires=requires,
+            conflicts=self.config.conflicts,
+            provides=self.config.provides,
+        )
 
-            with SavedPipenvVenv():
-                with self.non_editable_pipfile_lock():
-                    subprocess.check_output(
-                        ['pipenv', '--bare', 'sync',
-                         '--python', self.config.python])
-
-                    # Determine where site-packages is, because we need that
-                    # to locate the *.dist-info directories, so we can make
-                    # use of the entry point metadata.
-                    #
-                    pip_init = subprocess.check_output(
-                        ['pipenv', 'run', 'python', '-c',
-                         'import os, pip\n'
-                         'print(os.path.abspath(pip.__file__))'])
-                    pip_init = str(pip_init, 'utf-8').strip()
-
-                # We no longer need to build using pipenv; that should
-                # only happen inside the context above.
-
-                self.site_packages = os.path.dirname(os.path.dirname(pip_init))
-                assert self.site_packages.endswith('/site-packages')
-                self.pythondir = os.path.basename(
-                    os.path.dirname(self.site_packages))
-
-                # Clean out the things we do not need:
-                self.excise_packages()
-
-                # ---
-
-                os.chdir(self.site_packages)
-
-                # Need to determine whether any installed packages are
-                # platform-specific.  We can look at the *.dist-info
-                # directories to determine this.
-                #
-                # This affects the arch_specific flag and computed
-                # pkgdirname, topdir, debdir values.
-
-                arch_specific = self.config.arch_specific
-                if self.included_arch_specific_packages():
-                    if arch_specific is None:
-                        arch_specific = True
-                    elif arch_specific is False:
-                        # Configuration says false, but we have
-                        # arch-specific packages in the build.
-                        print('Including architecture specific components in'
-                              ' build, but configuration says the package is'
-                              ' architecture independent.')
-                else:
-                    arch_specific = False
-                assert isinstance(arch_specific, bool)
-
-                build = '1'
-                if arch_specific:
-                    arch = subprocess.check_output(
-                        ['dpkg-architecture', '-q', 'DEB_BUILD_ARCH'])
-                    arch = str(arch, 'utf-8').strip()
-
-                    distro_name = subprocess.check_output(
-                        ['lsb_release', '--id', '--short'])
-                    distro_name = str(distro_name, 'utf-8').strip()
-
-                    distro_version = subprocess.check_output(
-                        ['lsb_release', '--release', '--short'])
-                    distro_version = str(distro_version, 'utf-8').strip()
-
-                    build += distro_name.lower() + distro_version
-                else:
-                    arch = 'all'
-
-                pkgdirname = f'{self.config.name}_{deb_version}-{build}_{arch}'
-                debname = pkgdirname + '.deb'
-
-                topdir = os.path.join(tmpdir, pkgdirname)
-                debdir = os.path.join(topdir, 'DEBIAN')
-                libpython = installation + '/lib/' + self.pythondir
-
-                os.mkdir(topdir)
-                os.mkdir(debdir)
-                os.makedirs(topdir + libpython)
-
-                pack = subprocess.Popen(
-                    ['tar', 'c', '.'], stdout=subprocess.PIPE)
-                unpack = subprocess.Popen(
-                    ['tar', 'x', '-C', topdir + libpython], stdin=pack.stdout)
-                pack.stdout.close()
-                out, err = unpack.communicate()
-
-                # ---
-
-                os.chdir(topdir + libpython)
-                subprocess.run(
-                    [self.config.python, '-m', 'compileall', '-fqq',
-                     '-d', libpython, '.'])
-                subprocess.check_call(
-                    ['chmod', '-R', 'go-w', topdir + installation])
-                os.chdir(workdir)
-
-                # Generate scripts while we still have the build venv;
-                # we need it to collect the entry point data from the
-                # *.dist-info directories.
-                #
-                if self.config.scripts:
-                    bindir = topdir + installation + '/bin'
-                    os.mkdir(bindir)
-                    for script in self.config.scripts:
-                        self.make_script(script, bindir)
-                    subprocess.check_call(['chmod', '-R', 'a-w', bindir])
-
-            for shscript in glob.glob('debian/*'):
-                # TODO: Limit the allowed names of the script files to those
-                # that make sense as Debian installation hooks.
-                basename = os.path.basename(shscript)
-                shutil.copy(shscript, os.path.join(debdir, basename))
-
-            with open(debdir + '/control', 'w') as f:
-                print(f'Package: {self.config.name}', file=f)
-                print(f'Version: {deb_version}-{build}', file=f)
-                if self.config.description:
-                    print(f'Description: {self.config.description}', file=f)
-                if self.config.maintainer:
-                    print(f'Maintainer: {self.config.maintainer}', file=f)
-                    print(f'Architecture: {arch}', file=f)
-                    print(f'Priority: {self.config.priority}', file=f)
-
-                def dependencies(attr, label):
-                    deps = getattr(self.config, attr, ())
-                    if deps:
-                        deps = ', '.join(deps)
-                        print(f'{label}: {deps}', file=f)
-
-                dependencies('requires', 'Depends')
-                dependencies('conflicts', 'Conflicts')
-                dependencies('provides', 'Provides')
-
-            for payload in self.config.payloads:
-                destination = payload['destination']
-                if '/' in destination:
-                    dest_dir, dest_name = destination.rsplit('/', 1)
-                    dest_dir = topdir + os.path.join(installation, dest_dir)
-                    if not os.path.exists(dest_dir):
-                        os.makedirs(dest_dir)
-                else:
-                    dest_dir = topdir + installation
-                    dest_name = destination
-                destination = os.path.join(dest_dir, dest_name)
-                source = os.path.join(workdir, payload['source'])
-                if os.path.isdir(source):
-                    shutil.copytree(source, destination)
-                else:
-                    shutil.copy(source, destination)
-
-            # Build the actual .deb:
-
-            os.chdir(tmpdir)
-            subprocess.check_call(
-                ['fakeroot', 'dpkg-deb', '-z9', '-Zgzip', '-b', pkgdirname])
-            os.chdir(workdir)
-            if not os.path.exists('packages'):
-                os.mkdir('packages')
-            subprocess.check_call(
-                ['mv', os.path.join(tmpdir, debname), 'packages/'])
+    def write_package_manifest(self):
+        self.write_manifest(self.topdir + self.config.directory)
+
+    def write_manifest(self, directory):
+        count = kt.appackager.verify.write_manifest(directory)
+        print(f'wrote manifest of {count} files'
+              f' for {os.path.basename(directory)}')
+
+    def pack(self):
+        # Build the actual .deb files:
+        self.build_deb(self.topdir, self.debname)
+        self.debnames = [self.debname]
+        if self.dbgpkgdirname:
+            self.build_deb(os.path.join(self.tmpdir, self.dbgpkgdirname),
+                           self.dbgpkgdirname + '.deb')
+            self.debnames.append(self.dbgpkgdirname + '.deb')
+
+    def reuse_packages(self, entry):
+        # The packages listed in *entry* were built from the same inputs
+        # as the current build.  If the version is also the same, there's
+        # nothing to do; otherwise the packages are copied, changing only
+        # the version.
+        #
+        if entry['version'] == self.version:
+            print('Inputs unchanged; package already built:')
+            for debname in entry['packages']:
+                print(f'  {debname}')
+            return entry['packages']
 
-            # On success, remember what we built:
-            self.commit_version()
+        debnames = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for debname in entry['packages']:
+                debnames.append(
+                    self.repackage(tmpdir, debname, entry['version']))
+            subprocess.check_call(['chmod', '-R', 'u+w', tmpdir])
+        return debnames
+
+    def repackage(self, tmpdir, debname, old_version):
+        package, old_deb_version, arch = debname[:-4].rsplit('_', 2)
+        build = old_deb_version.rsplit('-', 1)[1]
+        new_deb_version = f'{self.deb_version}-{build}'
+        pkgdirname = f'{package}_{new_deb_version}_{arch}'
+        print(f'Inputs unchanged; copying {debname} as {pkgdirname}.deb')
+
+        topdir = os.path.join(tmpdir, pkgdirname)
+        subprocess.check_call(
+            ['dpkg-deb', '-R', os.path.join('packages', debname), topdir])
+
+        control = os.path.join(topdir, 'DEBIAN', 'control')
+        with open(control) as f:
+            lines = f.readlines()
+        with open(control, 'w') as f:
+            for line in lines:
+                if line.startswith('Version:'):
+                    line = f'Version: {new_deb_version}\n'
+                elif line.startswith('Depends:'):
+                    line = line.replace(f'(= {old_deb_version})',
+                                        f'(= {new_deb_version})')
+                f.write(line)
+
+        # Generated scripts include the version:
+        bindir = topdir + self.config.directory + '/bin'
+        changed = False
+        if os.path.isdir(bindir):
+            old_line = f'version = {old_version!r}\n'
+            new_line = f'version = {self.version!r}\n'
+            for name in os.listdir(bindir):
+                script = os.path.join(bindir, name)
+                with open(script) as f:
+                    lines = f.readlines()
+                if old_line not in lines:
+                    continue
+                mode = os.stat(script).st_mode
+                os.chmod(script, mode | 0o200)
+                with open(script, 'w') as f:
+                    for line in lines:
+                        f.write(new_line if line == old_line else line)
+                os.chmod(script, mode)
+                changed = True
+
+        # The manifest has to match the updated scripts:
+        if changed:
+            for dirpath, dirnames, filenames in os.walk(topdir):
+                if kt.appackager.verify.MANIFEST_NAME in filenames:
+                    self.write_manifest(dirpath)
+
+        self.build_deb(topdir, pkgdirname + '.deb')
+        subprocess.check_call(
+            ['chmod', 'a-w', os.path.join('packages', pkgdirname + '.deb')])
+        return pkgdirname + '.deb'
+
+    def copy_hook_scripts(self, debdir):
+        for shscript in glob.glob('debian/*'):
+            # TODO: Limit the allowed names of the script files to those
+            # that make sense as Debian installation hooks.
+            basename = os.path.basename(shscript)
+            shutil.copy(shscript, os.path.join(debdir, basename))
+
+    def copy_payloads(self, destdir):
+        for payload in self.config.payloads:
+            destination = payload['destination']
+            if '/' in destination:
+                dest_dir, dest_name = destination.rsplit('/', 1)
+                dest_dir = os.path.join(destdir, dest_dir)
+                os.makedirs(dest_dir, exist_ok=True)
+            else:
+                dest_dir = destdir
+                dest_name = destination
+            destination = os.path.join(dest_dir, dest_name)
+            # A resumed build can have a copy in a restored tree.
+            kt.appackager.checkpoint.remove(destination)
+            source = os.path.join(self.workdir, payload['source'])
+            if os.path.isdir(source):
+                shutil.copytree(source, destination)
+            else:
+                shutil.copy(source, destination)
+
+    def copy_site_packages(self, destination, files=None):
+        # Copy from site-packages.  If *files* is provided, only those
+        # files (relative to site-packages) are copied.
+        command = ['tar', 'c']
+        listing = None
+        if files is None:
+            command.append('.')
+        else:
+            with tempfile.NamedTemporaryFile(
+                    'w', dir=self.tmpdir, delete=False) as f:
+                listing = f.name
+                for path in sorted(files):
+                    f.write(path + '\0')
+            command.extend(['--null', '--no-recursion', '-T', listing])
+        pack = subprocess.Popen(
+            command, stdout=subprocess.PIPE, cwd=self.site_packages)
+        unpack = subprocess.Popen(
+            ['tar', 'x', '-C', destination], stdin=pack.stdout)
+        pack.stdout.close()
+        out, err = unpack.communicate()
+        pack.wait()
+        if listing:
+            os.unlink(listing)
+
+    def compile_tree(self, topdir, libpython):
+        bytecode = self.config.bytecode
+        # The pythondir is "python" followed by the version:
+        version = tuple(
+            int(part) for part in self.pythondir[6:].split('.'))
+        try:
+            command = kt.appackager.bytecode.compile_command(
+                self.config.python, libpython, bytecode, version)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        subprocess.check_call(command, cwd=topdir + libpython)
+        if bytecode and bytecode.sourceless:
+            count, size = kt.appackager.bytecode.remove_sources(
+                topdir + libpython)
+            print(f'removed {count} source files ({size} bytes)'
+                  f' from {libpython}')
+
+    def build_deb(self, topdir, debname):
+        output = os.path.join(os.path.dirname(topdir), debname)
+        subprocess.check_call(
+            ['fakeroot', 'dpkg-deb', '-z9', '-Zgzip', '-b', topdir, output])
+        packages = os.path.join(self.workdir, 'packages')
+        os.makedirs(packages, exist_ok=True)
+        subprocess.check_call(['mv', output, packages])
+
+    def write_control(self, debdir, package, version, arch, description,
+                      requires=(), conflicts=(), provides=()):
+        with open(debdir + '/control', 'w') as f:
+            print(f'Package: {package}', file=f)
+            print(f'Version: {version}', file=f)
+            if description:
+                print(f'Description: {description}', file=f)
+            if self.config.maintainer:
+                print(f'Maintainer: {self.config.maintainer}', file=f)
+                print(f'Architecture: {arch}', file=f)
+                print(f'Priority: {self.config.priority}', file=f)
+
+            def dependencies(deps, label):
+                if deps:
+                    deps = ', '.join(deps)
+                    print(f'{label}: {deps}', file=f)
+
+            dependencies(requires, 'Depends')
+            dependencies(conflicts, 'Conflicts')
+            dependencies(provides, 'Provides')
+
+    def prepare_runtime(self):
+        # The runtime package is identified by a hash of everything
+        # that determines its content, so applications built from the
+        # same lock can share a single installed runtime, and the
+        # runtime only needs to be rebuilt when the lock or the way it's
+        # packaged changes.
+        #
+        self.runtime_key = self.compute_runtime_key()
+        runtime = self.config.runtime
+        self.runtime_package = f'{runtime.name}-{self.runtime_key}'
+        self.runtime_directory = f'{runtime.directory}/{self.runtime_key}'
+        self.runtime_debname = None
+        existing = sorted(glob.glob(
+            os.path.join('packages', self.runtime_package + '_*.deb')))
+        if existing:
+            self.runtime_debname = os.path.basename(existing[-1])
+            print(f'Reusing runtime package: {self.runtime_debname}')
+
+    def compute_runtime_key(self):
+        content = self.read_pipfile_lock()
+        locked = {
+            pkgname: info
+            for pkgname, info in content.get('default', {}).items()
+            if 'path' not in info
+        }
+        bytecode = self.config.bytecode
+        key = {
+            'packages': locked,
+            'python': self.config.python,
+            'excise': sorted(self.config.packages_to_excise),
+            # These change how the content is packaged:
+            'bytecode': bytecode and [bytecode.invalidation,
+                                      bytecode.optimize, bytecode.sourceless],
+            'strip': self.config.strip,
+            'debug-package': self.config.debug_package,
+            'manifest': self.config.manifest,
+            'appackager': kt.appackager.fingerprint.appackager_version(),
+        }
+        text = json.dumps(key, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(text).hexdigest()[:12]
+
+    def local_packages(self):
+        # Packages installed from the local filesystem are part of the
+        # application, not the runtime.
+        return [pkgname for pkgname, path in self.local_package_paths()]
+
+    def local_package_paths(self):
+        content = self.read_pipfile_lock()
+        return sorted(
+            (pkgname, info['path'])
+            for pkgname, info in content.get('default', {}).items()
+            if 'path' in info
+        )
 
+    def read_pipfile_lock(self):
+        # Read once, before any environment is synced; the lock is
+        # rewritten while syncing.
+        if self._pipfile_lock is None:
+            lockname = os.path.join(self.workdir, 'Pipfile.lock')
+            # If another build is syncing, the original is set aside,
+            # and it can be put back at any time.
+            try:
+                f = open(lockname + '.orig')
+            except FileNotFoundError:
+                f = open(lockname)
+            with f:
+                self._pipfile_lock = json.load(f)
+        return self._pipfile_lock
+
+    def install_local_packages(self):
+        # Wheels for local packages are built once for each version of
+        # the source tree, and installed from the cache.
+        cache = kt.appackager.local.WheelCache(
+            kt.appackager.cache.cache_directory('wheels'))
+        environment = self.pipenv_environment()
+        for pkgname, path in self.local_package_paths():
+            source = os.path.normpath(os.path.join(self.workdir, path))
+            key = self.local_source_digest(source)
+            wheel = cache.lookup(key)
+            if wheel is None:
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    subprocess.check_output(
+                        ['pipenv', 'run', 'python', '-m', 'pip', 'wheel',
+                         '--no-deps', '--wheel-dir', tmpdir, source],
+                        env=environment)
+                    built, = glob.glob(os.path.join(tmpdir, '*.whl'))
+                    wheel = cache.store(key, built)
+                print(f'built wheel for local package {pkgname}:'
+                      f' {os.path.basename(wheel)}')
+            else:
+                print(f'using cached wheel for local package {pkgname}:'
+                      f' {os.path.basename(wheel)}')
+            subprocess.check_output(
+                ['pipenv', 'run', 'python', '-m', 'pip', 'install',
+                 '--no-deps', '--no-index', wheel],
+                env=environment)
+
+    def local_source_digests(self):
+        # Local packages aren't necessarily in the project.
+        return [
+            (pkgname, self.local_source_digest(
+                os.path.normpath(os.path.join(self.workdir, path))))
+            for pkgname, path in self.local_package_paths()
+        ]
+
+    def local_source_digest(self, source):
+        # The appackager configuration and hook scripts are usually in
+        # the project, but don't affect what's built from it.
+        exclude = [
+            os.path.relpath(os.path.join(self.workdir, path), source)
+            for path in (self.config.path, self.config.hook_scripts)
+        ]
+        return kt.appackager.local.source_digest(
+            source, self.config.python, exclude=exclude)
+
+    def local_package_files(self):
+        files = set()
+        for pkgname in self.local_packages():
+            distinfo = self.get_package_distinfo(pkgname)
+            if distinfo is None:
+                error(f'local package {pkgname!r} is not installed')
+            files.update(kt.appackager.excise.record_paths(distinfo))
+        return files
+
+    def build_runtime(self):
+        runtime = self.config.runtime
+        version = f'1-{self.build}'
+        pkgdirname = f'{self.runtime_package}_{version}_{self.arch}'
+
+        topdir = os.path.join(self.tmpdir, pkgdirname)
+        debdir = os.path.join(topdir, 'DEBIAN')
+        libpython = self.runtime_directory + '/lib/' + self.pythondir
+
+        os.mkdir(topdir)
+        os.mkdir(debdir)
+        os.makedirs(topdir + libpython)
+
+        files = set()
+        for dirpath, dirnames, filenames in os.walk(self.site_packages):
+            for fn in filenames:
+                path = os.path.relpath(os.path.join(dirpath, fn),
+                                       self.site_packages)
+                if path not in self.local_files:
+                    files.add(path)
+        self.copy_site_packages(topdir + libpython, files=files)
+        self.runtime_libdir = topdir + libpython
+        dbgpkgdirname = self.strip_tree(
+            topdir + libpython, self.runtime_package, version, self.arch)
+
+        self.compile_tree(topdir, libpython)
+        subprocess.check_call(
+            ['chmod', '-R', 'go-w', topdir + self.runtime_directory])
+        if self.config.manifest:
+            self.write_manifest(topdir + self.runtime_directory)
+        requires = []
+        if self.config.detect_dependencies:
+            requires = self.analysis.depends()
+        self.write_control(
+            debdir, self.runtime_package, version, self.arch,
+            runtime.description, requires=requires)
+
+        self.runtime_debname = pkgdirname + '.deb'
+        self.build_deb(topdir, self.runtime_debname)
+        debnames = [self.runtime_debname]
+        if dbgpkgdirname:
+            self.build_deb(os.path.join(self.tmpdir, dbgpkgdirname),
+                           dbgpkgdirname + '.deb')
+            debnames.append(dbgpkgdirname + '.deb')
+        for debname in debnames:
             subprocess.check_call(
-                ['chmod', 'a-w', os.path.join('packages', debname)])
-            subprocess.check_call(['chmod', '-R', 'u+w', tmpdir])
+                ['chmod', 'a-w',
+                 os.path.join(self.workdir, 'packages', debname)])
+
+    def strip_tree(self, libdir, package, version, arch):
+        # Strip the shared objects copied into *libdir*.  If separate
+        # debug information is wanted, the tree for a companion package
+        # is prepared, and the name of the directory is returned so the
+        # caller can build the package along with the main package.
+        #
+        paths = [path for path in self.analysis.shared_objects
+                 if os.path.isfile(os.path.join(libdir, path))]
+        if not (self.config.strip and paths):
+            return None
+        debug_root = None
+        if self.config.debug_package:
+            dbgpackage = package + '-dbgsym'
+            dbgpkgdirname = f'{dbgpackage}_{version}_{arch}'
+            dbgtopdir = os.path.join(self.tmpdir, dbgpkgdirname)
+            debug_root = dbgtopdir + kt.appackager.strip.DEBUG_DIRECTORY
+        result = kt.appackager.strip.strip_shared_objects(
+            libdir, paths, debug_root)
+        print(f'{package}: {result}')
+        if not result.debug_files:
+            return None
+
+        os.mkdir(os.path.join(dbgtopdir, 'DEBIAN'))
+        subprocess.check_call(['chmod', '-R', 'go-w', dbgtopdir])
+        self.write_control(
+            os.path.join(dbgtopdir, 'DEBIAN'), dbgpackage, version, arch,
+            f'Debug symbols for {package}.',
+            requires=[f'{package} (= {version})'])
+        return dbgpkgdirname
 
     def excise_packages(self):
-        outside_prefix = os.pardir + os.sep
-        # The set of dirs in site-packages we touched.
-        dirs = set()
         print('preparing to excise:', self.config.packages_to_excise)
+        excision = kt.appackager.excise.Excision(self.site_packages)
+        distinfos = self.get_package_distinfos()
         for pkgname in self.config.packages_to_excise:
-            distinfo = self.get_package_distinfo(pkgname)
-            record = os.path.join(distinfo, 'RECORD')
-            for line in open(record):
-                path, chksum, size = line.rsplit(',', 2)
-                if path.startswith(outside_prefix):
-                    # Not under site-packages; stay away.
-                    continue
-                dirs.add(path.split(os.sep, 1)[0])
-                path = os.path.normpath(os.path.join(self.site_packages, path))
-                if os.path.exists(path):
-                    os.unlink(path)
-            # Avoid leaving an empty dist-info directory, even temporarily.
-            os.rmdir(distinfo)
-        for dirname in dirs:
-            path = os.path.normpath(os.path.join(self.site_packages, dirname))
-            for dirpath, dirnames, filenames in os.walk(path, topdown=False):
-                # Need to re-compute dirnames, since we may have removed
-                # the directories that are included.
-                dirnames = {dname for dname in dirnames
-                            if os.path.isdir(os.path.join(dirpath, dname))}
-                if filenames or dirnames:
-                    print(f'directory {dirpath} not empty')
-                else:
-                    os.rmdir(dirpath)
-
-    def included_arch_specific_packages(self):
-        for wheelfn in glob.glob('*.dist-info/WHEEL'):
-            with open(wheelfn) as f:
-                text = f.read()
-            message = email.message_from_string(text)
-            for tag in message.get_all('tag'):
-                pytag, abitag, platformtag = tag.split('-')
-                if platformtag != 'any':
-                    return True
-        return False
+            distinfo = distinfos.get(_normalize_name(pkgname))
+            if distinfo is None:
+                print(f'package {pkgname} is not installed; not excising')
+                continue
+            excision.add(distinfo)
+        result = excision.run()
+        for path in result.missing:
+            print(f'RECORD entry {path} not found')
+        for path in result.not_empty:
+            dirpath = os.path.join(self.site_packages, path)
+            print(f'directory {dirpath} not empty')
+
+    def analyze_shared_objects(self):
+        cache = kt.appackager.elf.AnalysisCache(os.path.join(
+            kt.appackager.cache.cache_directory(), 'elf-analysis.json'))
+        analysis = kt.appackager.elf.analyze(self.site_packages, cache)
+        count = len(analysis.shared_objects)
+        print(f'found {count} shared objects'
+              f' ({analysis.scanned} files scanned)')
+        if analysis.shared_objects:
+            archs = ', '.join(sorted(analysis.architectures)) or 'unknown'
+            print(f'shared object architectures: {archs}')
+            for library in analysis.unresolved_libraries():
+                print(f'shared objects need {library};'
+                      f' dependency must be configured explicitly')
+        self.analysis = analysis
+        detected = self.detected_dependencies()
+        if detected and not self.config.detect_dependencies:
+            print(f'suggested dependencies for shared objects:'
+                  f' {", ".join(detected)}; add them to [dependencies]'
+                  f' requires, or set detect = true')
+
+    def detected_architecture(self):
+        architectures = self.analysis.architectures
+        arch = self.build_arch
+        if len(architectures) > 1:
+            # Some wheels vendor helpers for other architectures; the
+            # build host is the best guess at what the package is for.
+            archs = ', '.join(sorted(architectures))
+            print(f'Shared objects for multiple architectures included'
+                  f' in build: {archs}; using the build architecture'
+                  f' ({arch}).')
+        elif architectures:
+            detected, = architectures
+            if arch and detected != arch:
+                print(f'Shared objects are built for {detected}, but'
+                      f' building on {arch}; using {detected}.')
+            arch = detected
+        if arch is None:
+            error(f'Could not determine build architecture:'
+                  f' {self.platform_error}')
+        return arch
+
+    def requirements(self):
+        requires = list(self.config.requires)
+        if self.config.detect_dependencies:
+            requires.extend(self.detected_dependencies())
+        return requires
+
+    def detected_dependencies(self):
+        # Dependencies for the shared objects that aren't configured.
+        configured = {_dependency_name(dep) for dep in self.config.requires}
+        return [dep for dep in self.analysis.depends()
+                if _dependency_name(dep) not in configured]
 
     @contextlib.contextmanager
-    def non_editable_pipfile_lock(self):
-        has_editable = False
+    def sync_pipfile_lock(self):
+        # Packages from the local filesystem are left out of the lock
+        # used for syncing; they're installed from cached wheels
+        # afterward.  Other editable packages are installed as
+        # non-editable.
+        changed = False
         lockname = 'Pipfile.lock'
         tmpname = lockname + '.orig'
 
+        if os.path.exists(tmpname):
+            # Left by an interrupted build; the lock next to it may be
+            # the rewritten one.
+            print(f'{tmpname} exists; restore it as {lockname} or remove'
+                  f' it before building', file=sys.stderr)
+            sys.exit(1)
+
         if os.path.isfile(lockname):
             with open(lockname) as orig:
                 content = json.load(orig)
                 for k, v in content.items():
                     if k in ('default', 'develop'):
-                        for pkgname, info in v.items():
-                            if info.get('editable'):
-                                has_editable = True
+                        for pkgname, info in list(v.items()):
+                            if k == 'default' and 'path' in info:
+                                del v[pkgname]
+                                changed = True
+                            elif info.get('editable'):
+                                changed = True
                                 info['editable'] = False
 
-        if has_editable:
+        if changed:
             os.rename(lockname, tmpname)
             with open(lockname, 'w', encoding='utf-8') as f:
                 json.dump(content, f, indent=4, sort_keys=True)
 
-        yield
-
-        if has_editable:
-            os.rename(lockname, lockname + '.used')
-            os.rename(tmpname, lockname)
+        try:
+            yield
+        finally:
+            if changed:
+                os.rename(lockname, lockname + '.used')
+                os.rename(tmpname, lockname)
 
     def next_version(self):
         if os.path.exists('.git'):
@@ -409,6 +1296,33 @@ class Build(object):
 
     def make_script(self, script, directory):
         executable = self.config.python
+        module, object = self.script_entry_point(script)
+        flags = kt.appackager.bytecode.interpreter_flags(self.config.bytecode)
+        profiling = ''
+        call = f'{module}.{object}()'
+        if script.profiling:
+            profiling = kt.appackager.profiling.setup_code(
+                script.name, script.profile_directory, '-Es' + flags)
+            call = f'_profiled({module}.{object})'
+        script_body = SCRIPT_TEMPLATE.format(
+            call=call,
+            executable=executable,
+            flags=flags,
+            initialization=script.initialization,
+            module=module,
+            pythondir=self.pythondir,
+            profiling=profiling,
+            runtime=self.runtime_path(),
+            version=self.version,
+        )
+        target = os.path.join(directory, script.name)
+        with open(target, 'w') as f:
+            f.write(script_body)
+        os.chmod(target, 0o777 - self._mask)
+
+    def script_entry_point(self, script):
+        # Return the module and object named by the console script
+        # entry point for *script*.
         entrypoint = script.entrypoint
         if ':' in entrypoint:
             dist, name = entrypoint.split(':', 1)
@@ -425,83 +1339,58 @@ class Build(object):
                   f' entry-point {name!r}', file=sys.stderr)
             sys.exit(1)
         module, object = console_scripts[name].split(':')
-        script_body = SCRIPT_TEMPLATE.format(
-            executable=executable,
-            initialization=script.initialization,
-            module=module,
-            object=object,
-            pythondir=self.pythondir,
-            version=self.version,
-        )
-        target = os.path.join(directory, script.name)
-        with open(target, 'w') as f:
-            f.write(script_body)
-        os.chmod(target, 0o777 - self._mask)
+        return module, object
+
+    def runtime_path(self):
+        if not self.config.runtime:
+            return ''
+        libpython = self.runtime_directory + '/lib/' + self.pythondir
+        return ('# Add in the directory containing the shared runtime:\n'
+                f'sys.path.insert(1, {libpython!r})\n')
 
     def get_local_dist(self, script):
         if self._local_package:
             return self._local_package
 
-        found = None
-        if self._local_package is None:
-            if os.path.exists('setup.py'):
-                appackagerdir = os.path.dirname(os.path.abspath(__file__))
-                site_packages = os.path.dirname(os.path.dirname(appackagerdir))
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    subprocess.check_call(
-                        # sys.executable here is from the running appackager
-                        # build, so includes the required wheel support:
-                        [sys.executable, 'setup.py', '-q',
-                         'dist_info', '--output-dir', tmpdir],
-                        env={'PYTHONPATH': site_packages})
-                    dist_info = os.path.join(tmpdir, os.listdir(tmpdir)[0])
-                    with open(os.path.join(dist_info, 'METADATA')) as f:
-                        msg = email.message_from_file(f)
-                        self._local_package = msg['name']
-                        found = 'using setup.py'
-
-            elif os.path.exists('setup.cfg'):
-                conf = configparser.ConfigParser(interpolation=None)
-                with open('setup.cfg') as f:
-                    conf.read_file(f, 'setup.cfg')
-                try:
-                    self._local_package = conf.get('metadata', 'name')
-                except configparser.Error:
-                    print(f'[script.{script.name}] entrypoint refers to the'
-                          f' local package, but the package name is not'
-                          f' present in setup.cfg',
-                          file=sys.stderr)
-                    sys.exit(1)
-                else:
-                    found = 'in setup.cfg'
-
-            elif os.path.exists('pyproject.toml'):
-                with open('pyproject.toml', 'rb') as ppf:
-                    conf = tomli.load(ppf)
-                project = conf.get('project')
-                if isinstance(project, dict):
-                    name = project.get('name')
-                    if isinstance(name, str):
-                        self._local_package = name
-                        found = 'in pyproject.toml'
-
-                if not self._local_package:
-                    print(f'[script.{script.name}] entrypoint refers to the'
-                          f' local package, but the package name could not'
-                          f' be located in pyproject.toml',
-                          file=sys.stderr)
-                    sys.exit(1)
-
-        if not self._local_package:
+        # Static metadata is preferred, since nothing needs to be run.
+        name, found = kt.appackager.local.static_name(self.workdir)
+        if name is None:
+            local = [pkgname
+                     for pkgname, path in self.local_package_paths()
+                     if os.path.normpath(path) == os.curdir]
+            if len(local) == 1:
+                name, = local
+                found = 'in Pipfile.lock'
+        if name is None and os.path.exists('setup.py'):
+            appackagerdir = os.path.dirname(os.path.abspath(__file__))
+            site_packages = os.path.dirname(os.path.dirname(appackagerdir))
+            with tempfile.TemporaryDirectory() as tmpdir:
+                subprocess.check_call(
+                    # sys.executable here is from the running appackager
+                    # build, so includes the required wheel support:
+                    [sys.executable, 'setup.py', '-q',
+                     'dist_info', '--output-dir', tmpdir],
+                    env={'PYTHONPATH': site_packages})
+                dist_info = os.path.join(tmpdir, os.listdir(tmpdir)[0])
+                with open(os.path.join(dist_info, 'METADATA')) as f:
+                    msg = email.message_from_file(f)
+                    name = msg['name']
+                    found = 'using setup.py'
+
+        if not name:
             print(f'[script.{script.name}] entrypoint refers to the local'
                   f' package, but package metadata could not be located',
                   file=sys.stderr)
             sys.exit(1)
+        self._local_package = name
         print(f'extracted local package name {self._local_package!r} {found}')
         return self._local_package
 
     def get_console_scripts(self, pkgname):
-        distinfo = self.get_package_distinfo(pkgname)
+        if self.distinfos is None:
+            distinfo = self.get_package_distinfo(pkgname)
+        else:
+            distinfo = self.distinfos.get(_normalize_name(pkgname))
         console_scripts = {}
         entry_point_path = os.path.join(distinfo, 'entry_points.txt')
         try:
@@ -523,6 +1412,13 @@ class Build(object):
         # https://discuss.python.org/t/
         # revisiting-distribution-name-normalization/
         #
+        return self.get_package_distinfos(pkgname).get(
+            _normalize_name(pkgname))
+
+    def get_package_distinfos(self, pkgname=None):
+        # Return a mapping from normalized package names to dist-info
+        # directories.  If *pkgname* is given, stop once it's found.
+        distinfos = {}
         for fn in fnmatch.filter(os.listdir(self.site_packages),
                                  '*.dist-info'):
             mdpath = os.path.join(self.site_packages, fn, 'METADATA')
@@ -539,21 +1435,28 @@ class Build(object):
 
             with open(mdpath) as f:
                 msg = email.message_from_file(f)
-                if msg['name'] == pkgname:
-                    return os.path.join(self.site_packages, fn)
-        return None
+            name = _normalize_name(msg['name'])
+            distinfos[name] = os.path.join(self.site_packages, fn)
+            if pkgname and name == _normalize_name(pkgname):
+                break
+        return distinfos
 
 
 class SavedPipenvVenv(object):
 
-    def __init__(self):
+    def __init__(self, environment=None, restore=None):
         super(SavedPipenvVenv, self).__init__()
+        self.environment = environment
         self.moved_aside = None
         self.original = self.locate()
+        # Location of a virtual environment to restore from a failed
+        # build, if available:
+        self.restore = restore
+        self.restored = False
 
     def locate(self):
         venv = None
-        cp = subprocess.run(['pipenv', '--venv'],
+        cp = subprocess.run(['pipenv', '--venv'], env=self.environment,
                             capture_output=True, encoding='utf-8')
         if not cp.returncode:
             venv = cp.stdout
@@ -570,10 +1473,20 @@ class SavedPipenvVenv(object):
                       " and another to save.", file=sys.stderr)
                 sys.exit(1)
             os.rename(self.original, self.moved_aside)
+        if self.restore:
+            failed = self.restore + '-failed'
+            if os.path.isdir(failed) and not os.path.exists(self.restore):
+                print('Restoring virtual environment from failed build:',
+                      failed)
+                os.rename(failed, self.restore)
+                self.restored = True
         return self
 
     def __exit__(self, typ, value, tb):
         venv = self.original or self.locate()
+        if not venv:
+            # Failed before the virtual environment was created.
+            return
         bad_build = venv + '-failed'
 
         if os.path.isdir(bad_build):
@@ -582,24 +1495,111 @@ class SavedPipenvVenv(object):
 
         if typ is None:
             # Success.  Discard venv.
-            if venv:
-                shutil.rmtree(venv)
+            shutil.rmtree(venv)
         else:
             # Failure.  Save failed build.
-            if venv:
-                print('Saving virtual environment from failed'
-                      ' build as:', bad_build)
-                os.rename(venv, bad_build)
+            print('Saving virtual environment from failed'
+                  ' build as:', bad_build)
+            os.rename(venv, bad_build)
         if self.original:
             os.rename(self.moved_aside, self.original)
 
 
+def _nothing():
+    pass
+
+
+def _requirements(stages, names):
+    # Return the *names* found in *stages*, and all the stages they
+    # require, directly or indirectly.
+    requires = {stage: required for stage, function, required in stages}
+    result = set()
+    pending = [name for name in names if name in requires]
+    while pending:
+        name = pending.pop()
+        if name not in result:
+            result.add(name)
+            pending.extend(requires[name])
+    return result
+
+
+class _SharedContext(object):
+    """Context entered by several threads, possibly at the same time.
+
+    The wrapped context manager is entered by the first thread to enter,
+    and exited by the last thread to exit.
+
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._count = 0
+        self._context = None
+
+    def __enter__(self):
+        with self._lock:
+            if not self._count:
+                self._context = self._factory()
+                self._context.__enter__()
+            self._count += 1
+
+    def __exit__(self, typ, value, tb):
+        with self._lock:
+            self._count -= 1
+            if not self._count:
+                context, self._context = self._context, None
+                context.__exit__(typ, value, tb)
+
+
+class _Claims(object):
+    """Names claimed by builds running at the same time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owners = {}
+
+    def claim(self, name, owner):
+        """Claim *name* for *owner*.
+
+        If *name* was already claimed, the earlier owner is returned.
+
+        """
+        with self._lock:
+            if name in self._owners:
+                return self._owners[name]
+            self._owners[name] = owner
+            return None
+
+
 def error(message):
     for line in textwrap.wrap(message, fix_sentence_endings=True):
         print(line, file=sys.stderr)
     sys.exit(1)
 
 
+def _python_libdirs(top):
+    # Directories like .../lib/python3.11 within *top*.
+    libdirs = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        if os.path.basename(dirpath) == 'lib':
+            libdirs.extend(os.path.join(dirpath, dn) for dn in dirnames
+                           if re.match(r'python\d+\.\d+$', dn))
+            dirnames[:] = []
+    return sorted(libdirs)
+
+
+def _dependency_name(dependency):
+    # Package name from a Debian dependency such as "libc6 (>= 2.31)".
+    return re.split(r'[\s(:]', dependency.strip(), 1)[0]
+
+
+def _normalize_name(name):
+    # Distribution name normalization per PEP 503; Pipfile.lock keys
+    # don't necessarily match the names recorded in METADATA.
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
 _version_re = r'tag: v?(\d+([.]\d+)+)$'
 _version_rx = re.compile(_version_re)
 
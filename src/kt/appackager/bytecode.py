@@ -0,0 +1,66 @@
+"""\
+Byte-code compilation of installed trees.
+
+Installed trees are read-only, so the sources never change after the
+package is built.  Hash-based byte-code with unchecked invalidation lets
+the interpreter skip checking the source on each import, optimization
+levels 1 and 2 drop assertions and docstrings, and sourceless trees
+contain only the byte-code.
+
+"""
+
+import os
+
+
+def compile_command(python, directory, bytecode=None, version=None):
+    """Return the command compiling the current directory.
+
+    *directory* is the installed location, recorded in the byte-code
+    for tracebacks.  *version* is the interpreter's version as a tuple,
+    if known; **compileall** only accepts an optimization level from
+    Python 3.9 on.
+
+    """
+    command = [python, '-m', 'compileall', '-fqq', '-d', directory]
+    if bytecode is not None:
+        if bytecode.invalidation != 'timestamp':
+            command.extend(['--invalidation-mode', bytecode.invalidation])
+        if bytecode.optimize:
+            if version is not None and version < (3, 9):
+                raise ValueError(
+                    f'[installation.bytecode] optimize requires Python 3.9'
+                    f' or newer; {python} is'
+                    f' {".".join(map(str, version))}')
+            command.extend(['-o', str(bytecode.optimize)])
+        if bytecode.sourceless:
+            # Sourceless imports require the byte-code in place of the
+            # source, not in __pycache__.
+            command.append('-b')
+    command.append('.')
+    return command
+
+
+def interpreter_flags(bytecode=None):
+    """Return the interpreter flags needed to use the byte-code."""
+    if bytecode is None:
+        return ''
+    return 'O' * bytecode.optimize
+
+
+def remove_sources(top):
+    """Remove Python sources for which byte-code exists in place.
+
+    Returns the number of files and bytes removed.
+
+    """
+    count = size = 0
+    for dirpath, dirnames, filenames in os.walk(top):
+        for fn in filenames:
+            if not fn.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, fn)
+            if os.path.isfile(path + 'c') and not os.path.islink(path):
+                size += os.path.getsize(path)
+                os.unlink(path)
+                count += 1
+    return count, size
@@ -0,0 +1,22 @@
+"""\
+Persistent cache locations.
+
+"""
+
+import os
+
+
+def cache_directory(*names):
+    """Return the path of a cache directory, creating it if needed.
+
+    The cache lives under ``$XDG_CACHE_HOME/appackager``, which defaults
+    to ``~/.cache/appackager``.  Cache contents can be discarded at any
+    time; they only exist to avoid repeating work across builds.
+
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'appackager', *names)
+    os.makedirs(path, exist_ok=True)
+    return path
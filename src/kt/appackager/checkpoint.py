@@ -0,0 +1,140 @@
+"""\
+Checkpoints for resuming failed builds.
+
+Each target is built in a persistent build directory.  When a group of
+expensive stages completes, a checkpoint is recorded with a digest of
+the inputs to those stages and whatever is needed to pick up their
+results again.  The digest for each checkpoint includes the digest of
+the checkpoint before it, so a change in the inputs to an early stage
+invalidates everything after it.
+
+When a build is resumed, checkpoints are used in order, until one is
+missing or was recorded for different inputs.  Everything in the build
+directory that doesn't belong to a checkpoint still in use is removed.
+
+"""
+
+import json
+import os
+import shutil
+import stat
+import threading
+
+import kt.appackager.fingerprint
+
+
+FILENAME = 'checkpoints.json'
+
+
+class Checkpoints(object):
+    """Checkpoints recorded in a build directory.
+
+    Unless *resume* is true, anything left in *directory* by an earlier
+    build is discarded.
+
+    """
+
+    def __init__(self, directory, resume=False):
+        self.directory = directory
+        self.path = os.path.join(directory, FILENAME)
+        self._lock = threading.Lock()
+        self._records = {}
+        if resume:
+            try:
+                with open(self.path) as f:
+                    self._records = json.load(f)
+            except (OSError, ValueError):
+                pass
+        else:
+            prune(directory, ())
+
+    def lookup(self, name, digest):
+        """Return the state recorded for *name*, if the inputs match."""
+        record = self._records.get(name)
+        if record is not None and record['digest'] == digest:
+            return record['state']
+        return None
+
+    def complete(self, name, digest, state=None):
+        with self._lock:
+            self._records[name] = {'digest': digest, 'state': state or {}}
+            self._save()
+
+    def recorded(self):
+        """Return the names of the recorded checkpoints."""
+        with self._lock:
+            return sorted(self._records)
+
+    def retain(self, names):
+        """Drop the records of checkpoints other than *names*."""
+        with self._lock:
+            self._records = {name: record
+                             for name, record in self._records.items()
+                             if name in names}
+            self._save()
+
+    def discard(self):
+        remove(self.directory)
+
+    def _save(self):
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump(self._records, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmpname, self.path)
+
+
+def digest(*parts):
+    """Return a digest of *parts*, which must be JSON-serializable."""
+    fingerprint = kt.appackager.fingerprint.Fingerprint()
+    for index, part in enumerate(parts):
+        fingerprint.add_text(str(index), json.dumps(part, sort_keys=True))
+    return fingerprint.hexdigest()
+
+
+def prune(top, keep):
+    """Remove everything in *top* other than the paths in *keep*.
+
+    Paths in *keep* are relative to *top*; directories containing kept
+    paths are retained, but nothing else in them.
+
+    """
+    tree = {}
+    for path in keep:
+        node = tree
+        for part in os.path.normpath(path).split(os.sep):
+            node = node.setdefault(part, {})
+        # Everything below a kept path is kept:
+        node.clear()
+        node[None] = {}
+
+    def walk(directory, node):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name not in node:
+                remove(path)
+            elif None not in node[name]:
+                walk(path, node[name])
+
+    if os.path.isdir(top):
+        walk(top, tree)
+
+
+def remove(path):
+    """Remove the file or tree at *path*, including read-only content."""
+    if os.path.islink(path) or not os.path.isdir(path):
+        if os.path.lexists(path):
+            os.unlink(path)
+        return
+    # Directories have to be writable to remove their content.
+    _make_writable(path)
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames:
+            if not os.path.islink(os.path.join(dirpath, name)):
+                _make_writable(os.path.join(dirpath, name))
+    shutil.rmtree(path)
+
+
+def _make_writable(directory):
+    mode = stat.S_IMODE(os.lstat(directory).st_mode)
+    os.chmod(directory, mode | stat.S_IRWXU)
@@ -4,13 +4,28 @@ Command-line & configuration-loading support.
 """
 
 import argparse
+import copy
 import logging
 
 import tomli
 
 
 DEFAULT_AUTOVERSION_FILE = '.autoversion.json'
+DEFAULT_CONFIGURATION = 'appackager.toml'
 DEFAULT_HOOK_SCRIPTS = 'debian'
+DEFAULT_PROFILE_DIRECTORY = '/tmp'
+DEFAULT_TRACE_TIMEOUT = 300
+
+INVALIDATION_MODES = ('timestamp', 'checked-hash', 'unchecked-hash')
+
+# Settings that can be overridden for each target interpreter:
+TARGET_SETTINGS = {
+    'python': 'string',
+    'name': 'string',
+    'directory': 'string',
+    'requires': 'array',
+    'distro': 'string',
+}
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +33,30 @@ logger = logging.getLogger(__name__)
 class ArgumentParser(argparse.ArgumentParser):
 
     def __init__(self, *args, **kwargs):
+        # "verify" is dispatched before this parser is used.
+        kwargs.setdefault('usage', '%(prog)s [options]\n'
+                                   '       %(prog)s verify [-h] DIRECTORY ...')
+        kwargs.setdefault('epilog', 'Use "%(prog)s verify DIRECTORY..." to'
+                                    ' check installed packages against'
+                                    ' their manifests.')
         super(ArgumentParser, self).__init__(*args, **kwargs)
         self.set_defaults(verbose=0)
-        self.add_argument('-c', '--configuration', default='appackager.toml')
+        self.add_argument('-c', '--configuration',
+                          default=DEFAULT_CONFIGURATION)
         self.add_argument('--set-version', action='store')
+        self.add_argument('--force', action='store_true',
+                          help='build even if a package built from the'
+                               ' same inputs already exists')
+        self.add_argument('--resume', action='store_true',
+                          help='continue a failed build, re-using results'
+                               ' of completed stages with unchanged inputs')
+        self.add_argument('--analyze', nargs='?', const=True,
+                          metavar='DEB',
+                          help='report the footprint and import times of'
+                               ' the built package, or of an existing'
+                               ' package file without building')
+        self.add_argument('--analyze-json', metavar='FILE',
+                          help='also write the --analyze report as JSON')
         vg = self.add_mutually_exclusive_group()
         vg.add_argument('-v', '--verbose', action='count')
         vg.add_argument('--verbosity', action='store',
@@ -31,7 +66,12 @@ class ArgumentParser(argparse.ArgumentParser):
         namespace = super(ArgumentParser, self).parse_args()
         with open(namespace.configuration, 'rb') as cf:
             namespace.config = Configuration(tomli.load(cf))
+        namespace.config.path = namespace.configuration
         namespace.config.set_version = namespace.set_version
+        namespace.config.force = namespace.force
+        namespace.config.resume = namespace.resume
+        namespace.config.analyze = namespace.analyze
+        namespace.config.analyze_json = namespace.analyze_json
         return namespace
 
 
@@ -49,6 +89,14 @@ _toml_types = {
 
 class Configuration(object):
 
+    # Settings from the command line:
+    path = DEFAULT_CONFIGURATION
+    set_version = None
+    force = False
+    resume = False
+    analyze = None
+    analyze_json = None
+
     def __init__(self, config):
         self._config = config
         # Make sure everything is computed and checked.
@@ -61,7 +109,16 @@ class Configuration(object):
         self.packages_to_excise = self._get('installation', 'excise-packages',
                                             type='array',
                                             default=[])
-        self.python = self._get('installation', 'python')
+        self.strip = self._get('installation', 'strip',
+                               type='boolean', default=False)
+        self.debug_package = self._get('installation', 'debug-package',
+                                       type='boolean', default=False)
+        if self.debug_package and not self.strip:
+            raise ValueError('[installation] debug-package requires strip')
+        self.manifest = self._get('installation', 'manifest',
+                                  type='boolean', default=True)
+        self.bytecode = self._bytecode()
+        self.tree_shaking = self._tree_shaking()
 
         self.hook_scripts = self._get('package', 'hook-scripts',
                                       default=DEFAULT_HOOK_SCRIPTS)
@@ -84,6 +141,19 @@ class Configuration(object):
         self.conflicts = self._dependencies('conflicts')
         self.provides = self._dependencies('provides')
 
+        # The top-level settings reflect the first target; builds for
+        # each target use the configuration from for_target().
+        self.targets = self._targets()
+        self.python = self.targets[0].python
+        self.distro = self.targets[0].distro
+
+        # Add dependencies for libraries needed by included shared
+        # objects, when the providing packages are known.  Package names
+        # differ between distributions and releases, so by default these
+        # are only suggested.
+        self.detect_dependencies = self._get('dependencies', 'detect',
+                                             type='boolean', default=False)
+
         try:
             self.payloads = [
                 dict(payload, name=name)
@@ -92,6 +162,19 @@ class Configuration(object):
         except KeyError:
             self.payloads = []
 
+        self.runtime = self._runtime()
+
+    def for_target(self, target):
+        """Return the configuration for building only *target*."""
+        config = copy.copy(self)
+        config.name = target.name
+        config.directory = target.directory
+        config.python = target.python
+        config.requires = target.requires
+        config.distro = target.distro
+        config.targets = (target,)
+        return config
+
     def _get(self, *names, type='string', default=_marker):
         table_names, name = self._split_names(names)
         path = ''
@@ -140,12 +223,134 @@ class Configuration(object):
             raise TypeError('at least one component name must be provided')
         return names[:-1], names[-1]
 
+    def _targets(self):
+        # [installation] python is either a single interpreter, or a list
+        # of targets.  Each target is an interpreter, or a table that can
+        # override the package name, installation directory, requirements
+        # and distribution label for that interpreter.
+        try:
+            targets = [self._get('installation', 'python')]
+        except TypeError:
+            targets = self._get('installation', 'python', type='array')
+        if not targets:
+            raise ValueError('[installation] python must specify at least'
+                             ' one interpreter')
+        result = []
+        for settings in targets:
+            if isinstance(settings, str):
+                settings = {'python': settings}
+            elif not isinstance(settings, dict):
+                raise TypeError('[installation] python entries must be'
+                                ' strings or tables')
+            for name, value in settings.items():
+                if name not in TARGET_SETTINGS:
+                    raise ValueError(f'[installation] python entries do not'
+                                     f' support {name!r}')
+                vtype = TARGET_SETTINGS[name]
+                if not isinstance(value, _toml_types[vtype]):
+                    raise TypeError(f'[installation] python entry {name}'
+                                    f' must be a {vtype}')
+            if 'python' not in settings:
+                raise KeyError('[installation] python entries must'
+                               ' specify python')
+            result.append(Target(
+                python=settings['python'],
+                name=settings.get('name', self.name),
+                directory=settings.get('directory', self.directory),
+                requires=list(settings.get('requires', self.requires)),
+                distro=settings.get('distro'),
+            ))
+
+        # Packages from different targets must not overwrite each other.
+        seen = set()
+        for target in result:
+            if (target.name, target.distro) in seen:
+                raise ValueError(f'[installation] python targets for'
+                                 f' package {target.name!r} must specify'
+                                 f' different names or distro labels')
+            seen.add((target.name, target.distro))
+        return tuple(result)
+
+    def _bytecode(self):
+        # Byte-code settings are only needed to change the defaults.
+        try:
+            self._get('installation', 'bytecode', type='table')
+        except KeyError:
+            return None
+        invalidation = self._get('installation', 'bytecode', 'invalidation',
+                                 default='timestamp')
+        if invalidation not in INVALIDATION_MODES:
+            modes = ', '.join(INVALIDATION_MODES)
+            raise ValueError(f'[installation.bytecode] invalidation must be'
+                             f' one of {modes}')
+        optimize = self._get('installation', 'bytecode', 'optimize',
+                             type='integer', default=0)
+        if optimize not in (0, 1, 2):
+            raise ValueError('[installation.bytecode] optimize must be'
+                             ' 0, 1, or 2')
+        sourceless = self._get('installation', 'bytecode', 'sourceless',
+                               type='boolean', default=False)
+        return Bytecode(invalidation, optimize, sourceless)
+
+    def _tree_shaking(self):
+        # Tree shaking is enabled by the presence of the section, but
+        # only removes anything if asked.
+        try:
+            self._get('installation', 'tree-shaking', type='table')
+        except KeyError:
+            return None
+        if not self.scripts:
+            raise ValueError('[installation.tree-shaking] requires at least'
+                             ' one [script.*] section')
+        remove = self._get('installation', 'tree-shaking', 'remove',
+                           type='boolean', default=False)
+        keep = self._get('installation', 'tree-shaking', 'keep',
+                         type='array', default=[])
+        if not all(isinstance(pattern, str) for pattern in keep):
+            raise TypeError('[installation.tree-shaking] keep must be'
+                            ' an array of strings')
+        exercise = self._get('installation', 'tree-shaking', 'exercise',
+                             type='array', default=[])
+        names = {script.name for script in self.scripts}
+        for argv in exercise:
+            if not (isinstance(argv, list) and argv
+                    and all(isinstance(arg, str) for arg in argv)):
+                raise TypeError('[installation.tree-shaking] exercise must'
+                                ' be an array of arrays of strings')
+            if argv[0] not in names:
+                raise ValueError(f'[installation.tree-shaking] exercise'
+                                 f' refers to unknown script {argv[0]!r}')
+        timeout = self._get('installation', 'tree-shaking', 'timeout',
+                            type='integer', default=DEFAULT_TRACE_TIMEOUT)
+        return TreeShaking(remove, keep, exercise, timeout)
+
+    def _runtime(self):
+        # The presence of a [runtime] section enables layered packaging;
+        # all settings within the section are optional.
+        if 'runtime' not in self._config:
+            return None
+        if not isinstance(self._config['runtime'], dict):
+            raise TypeError('[runtime] must be a table')
+        return Runtime(
+            name=self._get('runtime', 'name',
+                           default=self.name + '-runtime'),
+            directory=self._get('runtime', 'directory',
+                                default=self.directory + '-runtime'),
+            description=self._get('runtime', 'description',
+                                  default=f'Runtime dependencies for'
+                                          f' {self.name}.'),
+        )
+
     def _scripts(self):
         initialization = self._get('scripts', 'initialization', default='')
         if initialization.rstrip():
             initialization = initialization.rstrip() + '\n'
         else:
             initialization = ''
+        profiling = self._get('scripts', 'profiling',
+                              type='boolean', default=False)
+        profile_directory = self._get('scripts', 'profile-directory',
+                                      default=DEFAULT_PROFILE_DIRECTORY)
         section = self._config.get('script', {})
         if not isinstance(section, dict):
             raise TypeError('[script] must be a table')
@@ -157,6 +362,10 @@ class Configuration(object):
             # Really expect this to be a script definition.
             if 'initialization' not in subsection:
                 subsection['initialization'] = initialization
+            if 'profiling' not in subsection:
+                subsection['profiling'] = profiling
+            if 'profile-directory' not in subsection:
+                subsection['profile-directory'] = profile_directory
             scripts.append(self._script_definition(name, subsection))
 
         return tuple(scripts)
@@ -164,17 +373,62 @@ class Configuration(object):
     def _script_definition(self, name, section):
         entrypoint = self._get('script', name, 'entry-point')
         initialization = self._get('script', name, 'initialization')
+        profiling = self._get('script', name, 'profiling', type='boolean')
+        profile_directory = self._get('script', name, 'profile-directory')
         return Script(
             name,
             entrypoint=entrypoint,
             initialization=initialization,
+            profiling=profiling,
+            profile_directory=profile_directory,
         )
 
 
 class Script(object):
 
     def __init__(self, name,
-                 entrypoint=None, main=None, initialization=None):
+                 entrypoint=None, main=None, initialization=None,
+                 profiling=False, profile_directory=DEFAULT_PROFILE_DIRECTORY):
         self.name = name
         self.entrypoint = entrypoint
         self.initialization = initialization
+        self.profiling = profiling
+        self.profile_directory = profile_directory
+
+
+class Bytecode(object):
+
+    def __init__(self, invalidation='timestamp', optimize=0,
+                 sourceless=False):
+        self.invalidation = invalidation
+        self.optimize = optimize
+        self.sourceless = sourceless
+
+
+class TreeShaking(object):
+
+    def __init__(self, remove=False, keep=(), exercise=(),
+                 timeout=DEFAULT_TRACE_TIMEOUT):
+        self.remove = remove
+        self.keep = list(keep)
+        # Each is a script name followed by arguments:
+        self.exercise = [list(argv) for argv in exercise]
+        self.timeout = timeout
+
+
+class Runtime(object):
+
+    def __init__(self, name, directory, description):
+        self.name = name
+        self.directory = directory
+        self.description = description
+
+
+class Target(object):
+
+    def __init__(self, python, name, directory, requires, distro=None):
+        self.python = python
+        self.name = name
+        self.directory = directory
+        self.requires = requires
+        self.distro = distro
@@ -0,0 +1,483 @@
+"""\
+Analysis of ELF shared objects included in a build.
+
+Wheel tags only tell us what a distribution claims to be; a
+``py3-none-any`` wheel can still vendor compiled code.  The analysis
+here looks at the content of every file in the staged tree, reading only
+the leading bytes of each to identify ELF objects, and then collects the
+architecture, needed libraries and required symbol versions for those.
+
+"""
+
+import collections
+import concurrent.futures
+import email
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import struct
+import tempfile
+import threading
+
+import kt.appackager.excise
+import kt.appackager.fingerprint
+
+
+ELF_MAGIC = b'\x7fELF'
+
+# Large enough for the file header of either ELF class.
+HEADER_SIZE = 64
+
+ET_EXEC = 2
+ET_DYN = 3
+
+SHT_SYMTAB = 2
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_GNU_VERNEED = 0x6ffffffe
+
+DT_NULL = 0
+DT_NEEDED = 1
+
+NT_GNU_BUILD_ID = 3
+
+EM_PPC64 = 21
+
+# Debian architecture names for ELF machine types.
+_architectures = {
+    3: 'i386',
+    20: 'powerpc',
+    EM_PPC64: 'ppc64',
+    22: 's390x',
+    40: 'armhf',
+    62: 'amd64',
+    183: 'arm64',
+    243: 'riscv64',
+    258: 'loong64',
+}
+
+# Debian packages providing commonly needed libraries, along with the
+# symbol version prefix used to derive a minimum package version.
+_library_packages = {
+    'libc.so.6': ('libc6', 'GLIBC_'),
+    'libm.so.6': ('libc6', 'GLIBC_'),
+    'libdl.so.2': ('libc6', 'GLIBC_'),
+    'libpthread.so.0': ('libc6', 'GLIBC_'),
+    'librt.so.1': ('libc6', 'GLIBC_'),
+    'libutil.so.1': ('libc6', 'GLIBC_'),
+    'ld-linux-x86-64.so.2': ('libc6', 'GLIBC_'),
+    'ld-linux-aarch64.so.1': ('libc6', 'GLIBC_'),
+    'libstdc++.so.6': ('libstdc++6', None),
+    # libgcc1 was renamed in Debian 11 and Ubuntu 20.04:
+    'libgcc_s.so.1': ('libgcc-s1 | libgcc1', None),
+    'libz.so.1': ('zlib1g', None),
+}
+
+_header = collections.namedtuple(
+    '_header', 'elfclass endian type machine shoff shentsize shnum shstrndx')
+_section = collections.namedtuple(
+    '_section', 'name type offset size link')
+
+
+def read_header(f):
+    """Return the parsed ELF header from *f*, or ``None``.
+
+    Only the first few bytes are read, so this is cheap to apply to
+    every file in a tree.
+
+    """
+    data = f.read(HEADER_SIZE)
+    if len(data) < 52 or data[:4] != ELF_MAGIC:
+        return None
+    elfclass = data[4]
+    encoding = data[5]
+    if elfclass not in (1, 2) or encoding not in (1, 2):
+        return None
+    endian = '<' if encoding == 1 else '>'
+    if elfclass == 2:
+        if len(data) < HEADER_SIZE:
+            return None
+        fields = struct.unpack_from(endian + 'HHIQQQIHHHHHH', data, 16)
+    else:
+        fields = struct.unpack_from(endian + 'HHIIIIIHHHHHH', data, 16)
+    (e_type, e_machine, e_version, e_entry, e_phoff, e_shoff, e_flags,
+     e_ehsize, e_phentsize, e_phnum, e_shentsize, e_shnum,
+     e_shstrndx) = fields
+    return _header(elfclass, endian, e_type, e_machine,
+                   e_shoff, e_shentsize, e_shnum, e_shstrndx)
+
+
+class ElfFile(object):
+    """Access to the dynamic-linking information of an ELF object."""
+
+    def __init__(self, f, header):
+        self.f = f
+        self.header = header
+        self._sections = None
+
+    @property
+    def architecture(self):
+        arch = _architectures.get(self.header.machine)
+        if self.header.machine == EM_PPC64 and self.header.endian == '<':
+            arch = 'ppc64el'
+        return arch
+
+    def sections(self):
+        if self._sections is None:
+            header = self.header
+            if header.elfclass == 2:
+                fmt = header.endian + 'IIQQQQIIQQ'
+            else:
+                fmt = header.endian + 'IIIIIIIIII'
+            size = struct.calcsize(fmt)
+            self._sections = []
+            if header.shoff and header.shentsize >= size:
+                self.f.seek(header.shoff)
+                data = self.f.read(header.shentsize * header.shnum)
+                for i in range(len(data) // header.shentsize):
+                    (sh_name, sh_type, sh_flags, sh_addr, sh_offset,
+                     sh_size, sh_link, sh_info, sh_addralign,
+                     sh_entsize) = struct.unpack_from(
+                         fmt, data, i * header.shentsize)
+                    self._sections.append(_section(
+                        sh_name, sh_type, sh_offset, sh_size, sh_link))
+        return self._sections
+
+    def section_names(self):
+        names = self.string_table(self.header.shstrndx)
+        return [_string(names, section.name) for section in self.sections()]
+
+    def has_debug_info(self):
+        """Return true if the object has not been stripped."""
+        if any(section.type == SHT_SYMTAB for section in self.sections()):
+            return True
+        return any(name.startswith('.debug_')
+                   for name in self.section_names())
+
+    def build_id(self):
+        """Return the GNU build-id as a hex string, or ``None``."""
+        endian = self.header.endian
+        for section in self.sections():
+            if section.type != SHT_NOTE:
+                continue
+            data = self.read_section(section)
+            offset = 0
+            while offset + 12 <= len(data):
+                namesz, descsz, note_type = struct.unpack_from(
+                    endian + 'III', data, offset)
+                offset += 12
+                name = data[offset:offset + namesz]
+                offset += _align4(namesz)
+                desc = data[offset:offset + descsz]
+                offset += _align4(descsz)
+                if note_type == NT_GNU_BUILD_ID and name == b'GNU\0':
+                    return desc.hex()
+        return None
+
+    def read_section(self, section):
+        self.f.seek(section.offset)
+        return self.f.read(section.size)
+
+    def string_table(self, index):
+        sections = self.sections()
+        if 0 < index < len(sections):
+            return self.read_section(sections[index])
+        return b''
+
+    def needed(self):
+        """Return the DT_NEEDED library names, in order."""
+        if self.header.elfclass == 2:
+            fmt = self.header.endian + 'qQ'
+        else:
+            fmt = self.header.endian + 'iI'
+        size = struct.calcsize(fmt)
+        needed = []
+        for section in self.sections():
+            if section.type != SHT_DYNAMIC:
+                continue
+            strings = self.string_table(section.link)
+            data = self.read_section(section)
+            for offset in range(0, len(data) - size + 1, size):
+                tag, value = struct.unpack_from(fmt, data, offset)
+                if tag == DT_NULL:
+                    break
+                if tag == DT_NEEDED:
+                    needed.append(_string(strings, value))
+        return needed
+
+    def version_requirements(self):
+        """Return a mapping from library name to needed symbol versions."""
+        endian = self.header.endian
+        requirements = {}
+        for section in self.sections():
+            if section.type != SHT_GNU_VERNEED:
+                continue
+            strings = self.string_table(section.link)
+            data = self.read_section(section)
+            offset = 0
+            while offset + 16 <= len(data):
+                (vn_version, vn_cnt, vn_file, vn_aux,
+                 vn_next) = struct.unpack_from(endian + 'HHIII', data, offset)
+                library = _string(strings, vn_file)
+                versions = requirements.setdefault(library, set())
+                aux = offset + vn_aux
+                for i in range(vn_cnt):
+                    if aux + 16 > len(data):
+                        break
+                    (vna_hash, vna_flags, vna_other, vna_name,
+                     vna_next) = struct.unpack_from(endian + 'IHHII',
+                                                    data, aux)
+                    versions.add(_string(strings, vna_name))
+                    if not vna_next:
+                        break
+                    aux += vna_next
+                if not vn_next:
+                    break
+                offset += vn_next
+        return {library: sorted(versions)
+                for library, versions in requirements.items()}
+
+
+def _align4(size):
+    return (size + 3) & ~3
+
+
+def open_elf(f):
+    """Return an ``ElfFile`` for the open binary file *f*, or ``None``."""
+    header = read_header(f)
+    if header is None:
+        return None
+    return ElfFile(f, header)
+
+
+def _string(table, offset):
+    end = table.find(b'\0', offset)
+    if end < 0:
+        end = len(table)
+    return str(table[offset:end], 'utf-8', 'replace')
+
+
+def inspect(path):
+    """Return a description of the ELF object at *path*, or ``None``.
+
+    The description is a JSON-compatible dictionary.
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = read_header(f)
+            if header is None or header.type not in (ET_DYN, ET_EXEC):
+                return None
+            elf = ElfFile(f, header)
+            return {
+                'architecture': elf.architecture,
+                'machine': header.machine,
+                'needed': elf.needed(),
+                'versions': elf.version_requirements(),
+            }
+    except (OSError, struct.error):
+        return None
+
+
+_version_number_rx = re.compile(r'^(\d+(?:\.\d+)*)$')
+
+
+def _version_key(version):
+    return tuple(int(part) for part in version.split('.'))
+
+
+class Analysis(object):
+    """Results of analyzing the content of a site-packages tree."""
+
+    def __init__(self):
+        # dist-info directory name --> list of wheel tags
+        self.tags = {}
+        # path relative to site-packages --> ELF description
+        self.shared_objects = {}
+        # path relative to site-packages --> dist-info directory name
+        self.owners = {}
+        # Number of files actually read (not served from the cache).
+        self.scanned = 0
+
+    @property
+    def architectures(self):
+        return {info['architecture']
+                for info in self.shared_objects.values()
+                if info['architecture']}
+
+    @property
+    def arch_specific(self):
+        if self.shared_objects:
+            return True
+        for tags in self.tags.values():
+            for tag in tags:
+                pytag, abitag, platformtag = tag.split('-')
+                if platformtag != 'any':
+                    return True
+        return False
+
+    def needed_libraries(self):
+        """Return needed libraries not provided by the tree itself."""
+        provided = {os.path.basename(path) for path in self.shared_objects}
+        needed = set()
+        for info in self.shared_objects.values():
+            needed.update(info['needed'])
+        return sorted(needed - provided)
+
+    def minimum_version(self, prefix):
+        """Return the highest symbol version with *prefix* required."""
+        best = None
+        for info in self.shared_objects.values():
+            for library, versions in info['versions'].items():
+                for version in versions:
+                    if not version.startswith(prefix):
+                        continue
+                    number = version[len(prefix):]
+                    if not _version_number_rx.match(number):
+                        continue
+                    if best is None or (
+                            _version_key(number) > _version_key(best)):
+                        best = number
+        return best
+
+    def depends(self):
+        """Return suggested Debian dependencies for the shared objects."""
+        packages = {}
+        for library in self.needed_libraries():
+            if library not in _library_packages:
+                continue
+            package, prefix = _library_packages[library]
+            if package not in packages:
+                version = prefix and self.minimum_version(prefix)
+                packages[package] = version
+        return [f'{package} (>= {version})' if version else package
+                for package, version in sorted(packages.items())]
+
+    def unresolved_libraries(self):
+        """Return needed libraries with no known providing package."""
+        return [library for library in self.needed_libraries()
+                if library not in _library_packages]
+
+
+class AnalysisCache(object):
+    """Analysis results for distributions, keyed by a RECORD hash.
+
+    A distribution's RECORD includes hashes of all the files installed
+    for it, so a hash of the RECORD identifies the content of the
+    distribution.
+
+    """
+
+    # Builds for several targets can save at the same time.
+    _save_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = self._load()
+        self.changed = False
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+        self.changed = True
+
+    def save(self):
+        if self.path and self.changed:
+            with self._save_lock:
+                # Keep entries saved by others since this was loaded.
+                entries = self._load()
+                entries.update(self.entries)
+                fd, tmpname = tempfile.mkstemp(
+                    prefix=os.path.basename(self.path) + '.',
+                    suffix='.tmp', dir=os.path.dirname(self.path))
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(entries, f, sort_keys=True)
+                    os.replace(tmpname, self.path)
+                except BaseException:
+                    os.unlink(tmpname)
+                    raise
+            self.entries = entries
+            self.changed = False
+
+
+def analyze(site_packages, cache=None, max_workers=None):
+    """Analyze the content of *site_packages*.
+
+    Distributions with results in *cache* (an ``AnalysisCache``) are not
+    rescanned; the files of all others are scanned in a single parallel
+    walk of the tree.
+
+    """
+    if cache is None:
+        cache = AnalysisCache()
+    analysis = Analysis()
+
+    skipped = set()
+    pending = {}
+    for fn in fnmatch.filter(os.listdir(site_packages), '*.dist-info'):
+        distinfo = os.path.join(site_packages, fn)
+        analysis.tags[fn] = _wheel_tags(distinfo)
+        try:
+            with open(os.path.join(distinfo, 'RECORD'), 'rb') as f:
+                record = f.read()
+        except OSError:
+            continue
+        key = hashlib.sha256(record).hexdigest()
+        paths = kt.appackager.excise.parse_record(str(record, 'utf-8'))
+        cached = cache.get(key)
+        if cached is None:
+            pending[fn] = key, {}
+            for path in paths:
+                analysis.owners[path] = fn
+        else:
+            skipped.update(paths)
+            for path, info in cached.items():
+                # The tree may have changed since the entry was cached.
+                if os.path.exists(os.path.join(site_packages, path)):
+                    analysis.shared_objects[path] = info
+                    analysis.owners[path] = fn
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {}
+        for path in kt.appackager.fingerprint.walk_files(site_packages):
+            if path not in skipped:
+                full_path = os.path.join(site_packages, path)
+                futures[executor.submit(inspect, full_path)] = path
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            analysis.scanned += 1
+            info = future.result()
+            if info is None:
+                continue
+            analysis.shared_objects[path] = info
+            owner = analysis.owners.get(path)
+            if owner in pending:
+                pending[owner][1][path] = info
+
+    for key, results in pending.values():
+        cache.set(key, results)
+    cache.save()
+    return analysis
+
+
+def _wheel_tags(distinfo):
+    try:
+        with open(os.path.join(distinfo, 'WHEEL')) as f:
+            message = email.message_from_file(f)
+    except OSError:
+        return []
+    return message.get_all('tag') or []
@@ -0,0 +1,120 @@
+"""\
+Removal of installed distributions from a site-packages tree.
+
+All RECORD files are loaded before anything is removed, so the complete
+sets of files and directories are known up front.  Files are unlinked
+in parallel batches without checking for existence first, and the
+directories are then removed deepest-first; a directory that still has
+content is simply left in place, without rescanning the tree.
+
+"""
+
+import concurrent.futures
+import errno
+import os
+
+
+BATCH_SIZE = 512
+
+
+def record_paths(distinfo):
+    """Return the paths listed in the RECORD file in *distinfo*.
+
+    Paths are relative to the directory containing *distinfo*; entries
+    outside that directory (scripts, headers) are omitted.
+
+    """
+    with open(os.path.join(distinfo, 'RECORD')) as f:
+        return parse_record(f.read())
+
+
+def parse_record(text):
+    """Return the paths listed in the RECORD content *text*.
+
+    Entries outside the directory containing the RECORD are omitted.
+
+    """
+    outside_prefix = os.pardir + os.sep
+    paths = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        path = line.rsplit(',', 2)[0]
+        if path.startswith(outside_prefix):
+            # Not under site-packages; stay away.
+            continue
+        paths.append(os.path.normpath(path))
+    return paths
+
+
+class ExcisionResult(object):
+
+    def __init__(self):
+        self.removed_files = 0
+        self.removed_directories = 0
+        # RECORD entries that did not exist, relative to site-packages.
+        self.missing = []
+        # Directories left in place because they were not empty.
+        self.not_empty = []
+
+
+class Excision(object):
+
+    def __init__(self, site_packages):
+        self.site_packages = site_packages
+        # Paths relative to site-packages:
+        self.files = set()
+        self.directories = set()
+
+    def add(self, distinfo):
+        """Add the distribution described by the *distinfo* directory."""
+        for path in record_paths(distinfo):
+            self.files.add(path)
+            self._add_directory(os.path.dirname(path))
+        # Always remove the dist-info directory, even if not all of the
+        # content is listed in the RECORD.
+        self._add_directory(
+            os.path.relpath(distinfo, self.site_packages))
+
+    def _add_directory(self, path):
+        while path and path not in self.directories:
+            self.directories.add(path)
+            path = os.path.dirname(path)
+
+    def run(self, max_workers=None):
+        result = ExcisionResult()
+        paths = sorted(self.files)
+        batches = [paths[i:i + BATCH_SIZE]
+                   for i in range(0, len(paths), BATCH_SIZE)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for removed, missing in executor.map(self._unlink, batches):
+                result.removed_files += removed
+                result.missing.extend(missing)
+
+        # Deepest first, so children are removed before their parents.
+        directories = sorted(self.directories,
+                             key=lambda path: (-path.count(os.sep), path))
+        for path in directories:
+            try:
+                os.rmdir(os.path.join(self.site_packages, path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+                    raise
+                result.not_empty.append(path)
+            else:
+                result.removed_directories += 1
+        return result
+
+    def _unlink(self, paths):
+        removed = 0
+        missing = []
+        for path in paths:
+            try:
+                os.unlink(os.path.join(self.site_packages, path))
+            except FileNotFoundError:
+                missing.append(path)
+            else:
+                removed += 1
+        return removed, missing
@@ -0,0 +1,196 @@
+"""\
+Fingerprints of build inputs, and an index of packages built from them.
+
+The fingerprint covers everything that affects the content of a built
+package other than the version number: the lock file, the local project
+sources, the configuration, hook scripts and payloads, the target
+interpreter, and appackager itself.  It's computed before any of the
+expensive build stages, so a build whose inputs match an existing
+package can be skipped.
+
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+
+
+INDEX_NAME = '.index.json'
+
+# Files in the project directory that are created or changed by
+# building, rather than being inputs to the build.
+_build_products = ('packages', 'Pipfile.lock.orig', 'Pipfile.lock.used')
+
+
+class Fingerprint(object):
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+
+    def add_text(self, label, text):
+        self._add(label, text.encode('utf-8'))
+
+    def add_file(self, label, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self._add(label, digest.digest())
+
+    def add_path(self, label, path):
+        """Add a file, or all files in a directory tree."""
+        if os.path.isdir(path):
+            for relpath in walk_files(path):
+                self.add_file(f'{label}/{relpath}',
+                              os.path.join(path, relpath))
+        elif os.path.exists(path):
+            self.add_file(label, path)
+        else:
+            self.add_text(label, '<missing>')
+
+    def _add(self, label, data):
+        label = label.encode('utf-8')
+        for part in (label, data):
+            self._hash.update(b'%d:' % len(part))
+            self._hash.update(part)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def compute(config, workdir, lock, local_sources=()):
+    """Return the fingerprint of the build inputs for *config*.
+
+    *lock* is the content of ``Pipfile.lock``; the file itself is
+    rewritten while environments are synced.  *local_sources* lists the
+    names of packages installed from the local filesystem, with digests
+    of their sources; those can be outside the project.
+
+    """
+    fingerprint = Fingerprint()
+
+    excluded = set(_build_products)
+    excluded.add('Pipfile.lock')
+    excluded.add(os.path.normpath(config.autoversion_file))
+    for relpath in project_files(workdir):
+        if relpath.split(os.sep, 1)[0] in excluded or relpath in excluded:
+            continue
+        fingerprint.add_file('project/' + relpath,
+                             os.path.join(workdir, relpath))
+
+    fingerprint.add_text('lock', json.dumps(lock, sort_keys=True))
+
+    # These are usually part of the project, but not necessarily.
+    fingerprint.add_path('configuration',
+                         os.path.join(workdir, config.path))
+    fingerprint.add_path('hooks',
+                         os.path.join(workdir, config.hook_scripts))
+    for payload in config.payloads:
+        fingerprint.add_path('payload/' + payload['name'],
+                             os.path.join(workdir, payload['source']))
+    for pkgname, digest in local_sources:
+        fingerprint.add_text('local/' + pkgname, digest)
+
+    # Targets built with the same interpreter differ in these:
+    fingerprint.add_text('target', json.dumps(
+        [config.name, config.directory, config.distro]))
+
+    interpreter = subprocess.check_output(
+        [config.python, '-c', 'import sys; print(sys.version)'])
+    fingerprint.add_text('interpreter', str(interpreter, 'utf-8'))
+
+    fingerprint.add_text('appackager', appackager_version())
+    return fingerprint.hexdigest()
+
+
+def appackager_version():
+    # The package version alone isn't enough, since development builds
+    # don't change it.
+    here = os.path.dirname(os.path.abspath(__file__))
+    fingerprint = Fingerprint()
+    for relpath in walk_files(here):
+        if relpath.endswith('.py'):
+            fingerprint.add_file(relpath, os.path.join(here, relpath))
+    return fingerprint.hexdigest()
+
+
+def project_files(workdir):
+    """Return paths of files in the project, relative to *workdir*.
+
+    When the project is managed by git, files ignored by git are
+    omitted.
+
+    """
+    if os.path.exists(os.path.join(workdir, '.git')):
+        stdout = subprocess.check_output(
+            ['git', 'ls-files', '-z', '--cached', '--others',
+             '--exclude-standard'],
+            cwd=workdir)
+        paths = set(str(stdout, 'utf-8').split('\0'))
+        paths.discard('')
+        # Removed from the working tree but not from the index:
+        return sorted(path for path in paths
+                      if os.path.isfile(os.path.join(workdir, path)))
+    return [relpath for relpath in walk_files(workdir)
+            if not relpath.startswith('.')]
+
+
+def walk_files(top):
+    """Return the paths of files below *top*, relative to *top*.
+
+    Symlinks to files are included; ``.git`` and ``__pycache__``
+    directories are skipped.
+
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [dn for dn in dirnames
+                       if dn not in ('.git', '__pycache__')]
+        for fn in filenames:
+            path = os.path.join(dirpath, fn)
+            if os.path.isfile(path):
+                paths.append(os.path.relpath(path, top))
+    return sorted(paths)
+
+
+class ArtifactIndex(object):
+    """Record of which packages were built from which inputs.
+
+    The index is stored alongside the packages, and maps fingerprints
+    to the version and the names of the package files built.
+
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.directory = directory
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    def lookup(self, fingerprint):
+        """Return the entry for *fingerprint* if the packages still exist."""
+        entry = self.entries.get(fingerprint)
+        if entry is None:
+            return None
+        for debname in entry['packages']:
+            if not os.path.exists(os.path.join(self.directory, debname)):
+                return None
+        return entry
+
+    def record(self, fingerprint, version, packages):
+        self.entries[fingerprint] = {
+            'version': version,
+            'packages': list(packages),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        tmpname = self.path + '.tmp'
+        with open(tmpname, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmpname, self.path)
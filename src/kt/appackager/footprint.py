@@ -0,0 +1,347 @@
+"""\
+Footprint and import-cost analysis of installed trees.
+
+Files in a ``lib/pythonX.Y`` tree are attributed to distributions using
+the RECORD files from the *.dist-info directories; byte-code compiled
+after installation is attributed to the distribution that owns the
+source.  Import times are measured by importing each top-level module in
+a fresh interpreter using ``-X importtime``.
+
+"""
+
+import concurrent.futures
+import email
+import json
+import os
+import re
+import stat
+import subprocess
+import zlib
+
+import kt.appackager.excise
+
+
+# Pseudo-distribution for files not listed in any RECORD:
+UNOWNED = '(unowned)'
+
+CATEGORIES = ('shared-objects', 'python', 'bytecode', 'data')
+
+_shared_object_re = re.compile(r'\.so(\.\d+)*$')
+_importtime_re = re.compile(r'^import time:\s*(\d+) \|\s*(\d+) \| ( *)(\S+)$')
+
+
+def classify(path):
+    """Return the category of the file at *path*."""
+    if _shared_object_re.search(path):
+        return 'shared-objects'
+    if path.endswith('.py'):
+        return 'python'
+    if path.endswith('.pyc'):
+        return 'bytecode'
+    return 'data'
+
+
+class Distribution(object):
+
+    def __init__(self, name, version=None):
+        self.name = name
+        self.version = version
+        self.files = 0
+        self.size = 0
+        self.compressed = 0
+        # Category --> bytes:
+        self.categories = dict.fromkeys(CATEGORIES, 0)
+        self.modules = []
+
+    def add(self, category, size, compressed):
+        self.files += 1
+        self.size += size
+        self.compressed += compressed
+        self.categories[category] += size
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'files': self.files,
+            'size': self.size,
+            'compressed': self.compressed,
+            'categories': dict(self.categories),
+            'modules': list(self.modules),
+        }
+
+
+class ImportCost(object):
+
+    def __init__(self, module, distribution):
+        self.module = module
+        self.distribution = distribution
+        # Microseconds, as reported by -X importtime:
+        self.cumulative = None
+        self.self_time = None
+        # Number of modules loaded by the import, including itself:
+        self.modules = 0
+        self.error = None
+
+    def as_dict(self):
+        return {
+            'module': self.module,
+            'distribution': self.distribution,
+            'cumulative_us': self.cumulative,
+            'self_us': self.self_time,
+            'modules': self.modules,
+            'error': self.error,
+        }
+
+
+class Footprint(object):
+
+    def __init__(self, root, label=None):
+        self.root = root
+        self.label = label or root
+        self.distributions = {}
+        self.imports = []
+
+    def distribution(self, name, version=None):
+        if name not in self.distributions:
+            self.distributions[name] = Distribution(name, version)
+        return self.distributions[name]
+
+    def totals(self):
+        total = Distribution('total')
+        for dist in self.distributions.values():
+            total.files += dist.files
+            total.size += dist.size
+            total.compressed += dist.compressed
+            for category, size in dist.categories.items():
+                total.categories[category] += size
+        return total
+
+    def as_dict(self):
+        dists = sorted(self.distributions.values(),
+                       key=lambda dist: (-dist.size, dist.name))
+        imports = sorted(self.imports,
+                         key=lambda cost: (-(cost.cumulative or 0),
+                                           cost.module))
+        return {
+            'label': self.label,
+            'distributions': [dist.as_dict() for dist in dists],
+            'totals': self.totals().as_dict(),
+            'imports': [cost.as_dict() for cost in imports],
+        }
+
+    def report(self, stream):
+        data = self.as_dict()
+        print(f'Footprint of {self.label}:', file=stream)
+        rows = [[dist['name'], str(dist['files']),
+                 _format_size(dist['size']),
+                 _format_size(dist['compressed'])]
+                + [_format_size(dist['categories'][category])
+                   for category in CATEGORIES]
+                for dist in data['distributions'] + [data['totals']]]
+        _print_table(
+            ['distribution', 'files', 'size', 'compressed',
+             '.so', '.py', '.pyc', 'data'],
+            rows, stream)
+
+        if data['imports']:
+            print(file=stream)
+            print('Import times:', file=stream)
+            rows = []
+            for cost in data['imports']:
+                if cost['error']:
+                    rows.append([cost['module'], cost['distribution'],
+                                 '-', '-', '-', cost['error']])
+                else:
+                    rows.append([cost['module'], cost['distribution'],
+                                 f'{cost["cumulative_us"] / 1000:.1f}',
+                                 f'{cost["self_us"] / 1000:.1f}',
+                                 str(cost['modules']), ''])
+            _print_table(
+                ['module', 'distribution', 'cumulative ms', 'self ms',
+                 'modules', 'error'],
+                rows, stream)
+
+
+def analyze_tree(root, label=None, max_workers=None):
+    """Return the footprint of the tree at *root*, by distribution."""
+    footprint = Footprint(root, label)
+    owners = {}
+    for fn in sorted(os.listdir(root)):
+        if not fn.endswith('.dist-info'):
+            continue
+        distinfo = os.path.join(root, fn)
+        if not os.path.exists(os.path.join(distinfo, 'RECORD')):
+            continue
+        name, version = _metadata(distinfo, fn)
+        dist = footprint.distribution(name, version)
+        paths = kt.appackager.excise.record_paths(distinfo)
+        for path in paths:
+            owners[path] = name
+        dist.modules = _top_level_modules(distinfo, paths)
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        for fn in filenames:
+            paths.append(
+                os.path.relpath(os.path.join(dirpath, fn), root))
+    paths.sort()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        sizes = executor.map(
+            lambda path: _measure(os.path.join(root, path)), paths)
+        for path, (size, compressed) in zip(paths, sizes):
+            owner = _owner(path, owners)
+            footprint.distribution(owner).add(
+                classify(path), size, compressed)
+    return footprint
+
+
+def measure_imports(footprint, python, path=(), flags='', repeat=3):
+    """Measure the time needed to import each top-level module.
+
+    *python* is run with *flags* added to ``-EsB``, with the analyzed
+    tree and any additional directories in *path* first on ``sys.path``.
+    The fastest of *repeat* runs is used.
+
+    """
+    sys_path = [footprint.root] + list(path)
+    for dist in sorted(footprint.distributions.values(),
+                       key=lambda dist: dist.name):
+        for module in dist.modules:
+            cost = ImportCost(module, dist.name)
+            for i in range(repeat):
+                cp = subprocess.run(
+                    [python, '-EsB' + flags, '-X', 'importtime', '-c',
+                     f'import sys; sys.path[:0] = {sys_path!r}\n'
+                     f'import {module}'],
+                    cwd=footprint.root, capture_output=True,
+                    encoding='utf-8', errors='replace')
+                if cp.returncode:
+                    lines = cp.stderr.strip().splitlines()
+                    cost.error = lines[-1] if lines else 'import failed'
+                    break
+                cumulative, self_time, modules = parse_importtime(
+                    cp.stderr, module)
+                if cost.cumulative is None or cumulative < cost.cumulative:
+                    cost.cumulative = cumulative
+                    cost.self_time = self_time
+                    cost.modules = modules
+            footprint.imports.append(cost)
+
+
+def parse_importtime(output, module):
+    """Return cumulative and self time, and the number of modules loaded.
+
+    *output* is the ``-X importtime`` output from importing *module*.
+    Times are in microseconds.  Modules are reported after the modules
+    they import, so the modules loaded for *module* are the nested
+    entries immediately before it.
+
+    """
+    entries = []
+    for line in output.splitlines():
+        match = _importtime_re.match(line)
+        if match:
+            self_time, cumulative, indent, name = match.groups()
+            entries.append((int(self_time), int(cumulative),
+                            len(indent), name))
+    for index in range(len(entries) - 1, -1, -1):
+        self_time, cumulative, depth, name = entries[index]
+        if depth == 0 and name == module:
+            modules = 1
+            while index - modules >= 0 and entries[index - modules][2]:
+                modules += 1
+            return cumulative, self_time, modules
+    # Already imported while starting the interpreter.
+    return 0, 0, 0
+
+
+def write_json(footprints, path):
+    with open(path, 'w') as f:
+        json.dump({'packages': [footprint.as_dict()
+                                for footprint in footprints]},
+                  f, indent=2)
+        f.write('\n')
+
+
+def _metadata(distinfo, dirname):
+    name = version = None
+    try:
+        with open(os.path.join(distinfo, 'METADATA')) as f:
+            msg = email.message_from_file(f)
+    except OSError:
+        pass
+    else:
+        name, version = msg['name'], msg['version']
+    if not name:
+        name, sep, version = dirname[:-len('.dist-info')].partition('-')
+    return name, version or None
+
+
+def _top_level_modules(distinfo, paths):
+    top_level = os.path.join(distinfo, 'top_level.txt')
+    if os.path.exists(top_level):
+        with open(top_level) as f:
+            names = {line.strip() for line in f}
+    else:
+        names = set()
+        for path in paths:
+            first, sep, rest = path.partition(os.sep)
+            if rest:
+                if rest in ('__init__.py', '__init__.pyc'):
+                    names.add(first)
+            elif first.endswith(('.py', '.pyc')):
+                names.add(first.rsplit('.', 1)[0])
+            elif _shared_object_re.search(first):
+                names.add(first.split('.', 1)[0])
+    return sorted(name for name in names
+                  if name.isidentifier() and name != '__pycache__')
+
+
+def _owner(path, owners):
+    owner = owners.get(path)
+    if owner is None and path.endswith('.pyc'):
+        dirname, basename = os.path.split(path)
+        if os.path.basename(dirname) == '__pycache__':
+            # name.cpython-311.opt-2.pyc --> name.py
+            source = os.path.join(os.path.dirname(dirname),
+                                  basename.split('.', 1)[0] + '.py')
+        else:
+            # Sourceless:
+            source = path[:-1]
+        owner = owners.get(source)
+    return owner or UNOWNED
+
+
+def _measure(path):
+    st = os.lstat(path)
+    if not stat.S_ISREG(st.st_mode):
+        return 0, 0
+    compressor = zlib.compressobj(9)
+    compressed = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            compressed += len(compressor.compress(chunk))
+    compressed += len(compressor.flush())
+    return st.st_size, compressed
+
+
+def _format_size(size):
+    for unit in ('', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            break
+        size /= 1024
+    if unit:
+        return f'{size:.1f}{unit}'
+    return str(size)
+
+
+def _print_table(header, rows, stream):
+    widths = [max(len(row[column]) for row in [header] + rows)
+              for column in range(len(header))]
+    for row in [header] + rows:
+        cells = [row[0].ljust(widths[0])]
+        cells.extend(cell.rjust(width)
+                     for cell, width in zip(row[1:], widths[1:]))
+        print('  '.join(cells).rstrip(), file=stream)
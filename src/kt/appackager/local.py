@@ -0,0 +1,140 @@
+"""\
+Support for packages installed from the local filesystem.
+
+The name of the local project is read from static metadata when
+possible, so no project code needs to be run.  Wheels built for local
+packages are cached by a digest of the source tree, so unchanged
+sources are never rebuilt.
+
+"""
+
+import configparser
+import os
+import shutil
+import tempfile
+
+import tomli
+
+import kt.appackager.fingerprint
+
+
+# Entries kept in the wheel cache, most recently used first:
+MAX_CACHED_WHEELS = 20
+
+# Files that don't affect the content of a wheel built from the
+# project, though they're generally part of the source tree.
+_not_sources = ('packages', 'Pipfile', 'Pipfile.lock', 'Pipfile.lock.orig',
+                'Pipfile.lock.used', 'build', 'dist')
+
+
+def static_name(directory):
+    """Return the project name from static metadata in *directory*.
+
+    The name and a description of where it was found are returned, or
+    ``(None, None)`` if the name isn't available statically.
+
+    """
+    pyproject = os.path.join(directory, 'pyproject.toml')
+    if os.path.exists(pyproject):
+        with open(pyproject, 'rb') as f:
+            conf = tomli.load(f)
+        for table in (conf.get('project'),
+                      conf.get('tool', {}).get('poetry')):
+            if isinstance(table, dict):
+                name = table.get('name')
+                if isinstance(name, str) and name:
+                    return name, 'in pyproject.toml'
+
+    setup_cfg = os.path.join(directory, 'setup.cfg')
+    if os.path.exists(setup_cfg):
+        conf = configparser.ConfigParser(interpolation=None)
+        with open(setup_cfg) as f:
+            conf.read_file(f, setup_cfg)
+        try:
+            return conf.get('metadata', 'name'), 'in setup.cfg'
+        except configparser.Error:
+            pass
+
+    return None, None
+
+
+def source_digest(source, *extra, exclude=()):
+    """Return a digest of the source tree at *source*.
+
+    Additional text that affects the build, such as the interpreter,
+    can be passed as *extra*.  Files or trees that aren't part of the
+    sources can be named in *exclude*, relative to *source*.  If
+    *source* is a file, such as an sdist or wheel, only that file is
+    hashed.
+
+    """
+    fingerprint = kt.appackager.fingerprint.Fingerprint()
+    for text in extra:
+        fingerprint.add_text('extra', text)
+    if os.path.isfile(source):
+        fingerprint.add_file(os.path.basename(source), source)
+        return fingerprint.hexdigest()
+    directory = source
+    exclude = [os.path.normpath(path) for path in exclude]
+    for relpath in kt.appackager.fingerprint.project_files(directory):
+        if relpath.split(os.sep, 1)[0] in _not_sources:
+            continue
+        if any(relpath == path or relpath.startswith(path + os.sep)
+               for path in exclude):
+            continue
+        if relpath.startswith('.') or '.egg-info' in relpath:
+            continue
+        fingerprint.add_file(relpath, os.path.join(directory, relpath))
+    return fingerprint.hexdigest()
+
+
+class WheelCache(object):
+    """Wheels stored by key, each in a directory named for the key."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def lookup(self, key):
+        """Return the path of the wheel cached for *key*, or None."""
+        entry = os.path.join(self.directory, key)
+        try:
+            names = [fn for fn in os.listdir(entry) if fn.endswith('.whl')]
+        except FileNotFoundError:
+            return None
+        if len(names) != 1:
+            return None
+        # Track use, so the least recently used wheels are removed.
+        os.utime(entry)
+        return os.path.join(entry, names[0])
+
+    def store(self, key, wheel):
+        """Copy *wheel* into the cache for *key*, returning the new path."""
+        entry = os.path.join(self.directory, key)
+        # Unique for each writer, including threads building several
+        # targets in one process.
+        tmpentry = tempfile.mkdtemp(
+            prefix=key + '.', suffix='.tmp', dir=self.directory)
+        shutil.copy(wheel, tmpentry)
+        try:
+            os.rename(tmpentry, entry)
+        except OSError:
+            # Stored concurrently by another build.
+            shutil.rmtree(tmpentry)
+        self.prune()
+        return self.lookup(key)
+
+    def prune(self, keep=MAX_CACHED_WHEELS):
+        entries = []
+        for fn in os.listdir(self.directory):
+            path = os.path.join(self.directory, fn)
+            if fn.endswith('.tmp'):
+                continue
+            try:
+                if os.path.isdir(path):
+                    entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                # Pruned concurrently by another build.
+                continue
+        entries.sort(reverse=True)
+        for mtime, path in entries[keep:]:
+            shutil.rmtree(path, ignore_errors=True)
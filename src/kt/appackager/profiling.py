@@ -0,0 +1,105 @@
+"""\
+Profiling hooks for generated scripts.
+
+Scripts generated with profiling enabled check a single environment
+variable (``NAME_PROFILE``, derived from the script name) on startup.
+When it is set to ``cprofile``, ``importtime`` or ``tracemalloc``, a
+profile is written to the directory named by ``NAME_PROFILE_DIR``, or
+the directory configured for the script.  The file is created with a
+unique name that includes the time and process id.
+
+``importtime`` requires running the interpreter with ``-X importtime``,
+so the script runs itself again in a child process and copies the
+import timings from the child's standard error to the profile.
+
+"""
+
+import re
+
+
+PROFILERS = ('cprofile', 'importtime', 'tracemalloc')
+
+SETUP_TEMPLATE = '''\
+# Profiling is enabled by setting {variable} to one of:
+# {profilers}.
+_profiler = os.environ.get({variable!r})
+if _profiler:
+    import tempfile
+    import time
+
+    def _profile_path(extension):
+        directory = os.environ.get({directory_variable!r}, {directory!r})
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        # Created here, so nothing planted in a shared directory can be
+        # written through.
+        fd, path = tempfile.mkstemp(
+            prefix=f'{name}-{{stamp}}-{{os.getpid()}}-',
+            suffix='.' + extension, dir=directory)
+        os.close(fd)
+        return path
+
+    if _profiler == 'importtime':
+        if not os.environ.get({child_variable!r}):
+            import subprocess
+            with open(_profile_path('importtime'), 'w') as _log:
+                _child = subprocess.Popen(
+                    [sys.executable, {flags!r}, '-X', 'importtime',
+                     __file__] + sys.argv[1:],
+                    env=dict(os.environ, {child_variable}='1'),
+                    stderr=subprocess.PIPE, errors='replace')
+                for _line in _child.stderr:
+                    if _line.startswith('import time:'):
+                        _log.write(_line)
+                    else:
+                        sys.stderr.write(_line)
+            sys.exit(_child.wait())
+    elif _profiler == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start(25)
+    elif _profiler != 'cprofile':
+        print(f'{variable}: unknown profiler {{_profiler!r}}',
+              file=sys.stderr)
+        _profiler = None
+
+
+def _profiled(function):
+    if _profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function)
+        finally:
+            profile.dump_stats(_profile_path('prof'))
+    elif _profiler == 'tracemalloc':
+        try:
+            return function()
+        finally:
+            tracemalloc.take_snapshot().dump(_profile_path('tracemalloc'))
+    return function()
+
+'''
+
+
+def environment_variable(name):
+    """Return the environment variable controlling profiling for *name*."""
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).upper() + '_PROFILE'
+
+
+def setup_code(name, directory, flags):
+    """Return the profiling setup code for the script *name*.
+
+    *flags* is the interpreter option argument from the script's ``#!``
+    line, used when the script runs itself again.
+
+    """
+    variable = environment_variable(name)
+    return SETUP_TEMPLATE.format(
+        child_variable='_' + variable + '_CHILD',
+        directory=directory,
+        directory_variable=variable + '_DIR',
+        flags=flags,
+        name=name,
+        profilers=', '.join(PROFILERS),
+        variable=variable,
+    )
@@ -0,0 +1,280 @@
+"""\
+Removal of modules an application never imports ("tree shaking").
+
+The entry point of each script is imported by a tracer run with the
+target interpreter, with the staged tree first on ``sys.path``.
+Exercises configured for the scripts call the entry points with the
+given arguments as well.  Modules in the staged tree that aren't loaded
+by any of the runs, and don't match the keep-list, are candidates for
+removal.
+
+Only module files (sources, byte-code and extension modules) are
+removed; data files are left in place.  Candidates are removed only if
+every run completed; otherwise they're only reported.
+
+"""
+
+import concurrent.futures
+import fnmatch
+import json
+import os
+import subprocess
+import tempfile
+
+
+# Run by the traced interpreter with a JSON specification:
+TRACER = '''\
+import importlib
+import json
+import os
+import sys
+
+spec = json.loads(sys.argv[1])
+sys.path[:] = [p for p in sys.path
+               if p and os.path.exists(p) and not p.endswith('/dist-packages')]
+sys.path[:0] = spec['path']
+sys.argv[:] = spec['argv']
+error = None
+try:
+    exec(spec['initialization'], {'__name__': '__appackager_trace__'})
+    target = importlib.import_module(spec['module'])
+    for name in spec['object'].split('.'):
+        target = getattr(target, name)
+    if spec['call']:
+        target()
+except SystemExit:
+    pass
+except BaseException as e:
+    error = f'{type(e).__name__}: {e}'
+with open(spec['output'], 'w') as f:
+    json.dump({'modules': sorted(sys.modules), 'error': error}, f)
+'''
+
+# Run by the target interpreter with source paths on standard input:
+COMPILE_TIMER = '''\
+import sys
+import time
+
+start = time.perf_counter()
+for path in sys.stdin.read().splitlines():
+    with open(path, 'rb') as f:
+        source = f.read()
+    try:
+        compile(source, path, 'exec', dont_inherit=True,
+                optimize=int(sys.argv[1]))
+    except SyntaxError:
+        pass
+print(time.perf_counter() - start)
+'''
+
+_extension_suffixes = ('.so', '.pyd')
+
+
+class Run(object):
+    """Import of an entry point, and optionally a call to it."""
+
+    def __init__(self, argv, module, object, initialization='', call=False):
+        self.argv = list(argv)
+        self.module = module
+        self.object = object
+        self.initialization = initialization or ''
+        self.call = call
+
+    def __str__(self):
+        words = ' '.join(self.argv)
+        action = 'running' if self.call else 'importing'
+        return f'{action} {words} ({self.module}:{self.object})'
+
+
+class Result(object):
+
+    def __init__(self):
+        # Module name --> paths of files, relative to the tree:
+        self.candidates = {}
+        self.size = 0
+        # Seconds needed to compile the candidate sources:
+        self.compile_time = 0.0
+        self.loaded = set()
+        self.errors = []
+        self.removed = False
+
+    @property
+    def files(self):
+        return sorted(path for paths in self.candidates.values()
+                      for path in paths)
+
+    def report(self, label, stream):
+        action = 'removed' if self.removed else 'could remove'
+        print(f'{label}: tree shaking {action}'
+              f' {len(self.candidates)} unused modules'
+              f' ({len(self.files)} files, {self.size} bytes);'
+              f' {self.compile_time:.2f}s of compile time saved',
+              file=stream)
+        counts = {}
+        for module in self.candidates:
+            top = module.split('.', 1)[0]
+            counts[top] = counts.get(top, 0) + 1
+        for top, count in sorted(counts.items(),
+                                 key=lambda item: (-item[1], item[0])):
+            plural = '' if count == 1 else 's'
+            print(f'  {top}: {count} module{plural}', file=stream)
+        for run, error in self.errors:
+            print(f'{label}: tree shaking: {run} failed: {error}',
+                  file=stream)
+
+
+def module_name(relpath):
+    """Return the name of the module in the file at *relpath*.
+
+    None is returned if *relpath* isn't an importable module file.
+
+    """
+    dirname, basename = os.path.split(relpath)
+    parts = dirname.split(os.sep) if dirname else []
+    if parts and parts[-1] == '__pycache__':
+        # name.cpython-311.opt-1.pyc
+        if not basename.endswith('.pyc'):
+            return None
+        parts.pop()
+        name = basename.split('.', 1)[0]
+    elif basename.endswith(('.py', '.pyc')):
+        name = basename.rsplit('.', 1)[0]
+    elif basename.endswith(_extension_suffixes):
+        name = basename.split('.', 1)[0]
+    else:
+        return None
+    if name != '__init__':
+        parts.append(name)
+    if not parts or not all(part.isidentifier() for part in parts):
+        return None
+    return '.'.join(parts)
+
+
+def module_files(libdir):
+    """Return a mapping from module names to files in *libdir*."""
+    modules = {}
+    for dirpath, dirnames, filenames in os.walk(libdir):
+        for fn in filenames:
+            relpath = os.path.relpath(os.path.join(dirpath, fn), libdir)
+            name = module_name(relpath)
+            if name is not None:
+                modules.setdefault(name, []).append(relpath)
+    return modules
+
+
+def is_kept(name, keep):
+    """Return true if the module *name* matches the *keep* patterns.
+
+    A pattern matches the named module and its submodules, and can
+    include shell-style wildcards.
+
+    """
+    return any(name == pattern or name.startswith(pattern + '.')
+               or fnmatch.fnmatchcase(name, pattern)
+               for pattern in keep)
+
+
+def find_candidates(modules, loaded, keep=()):
+    """Return the names in *modules* that are neither loaded nor kept."""
+    kept = {name for name in modules
+            if name in loaded or is_kept(name, keep)}
+    # Packages are needed for the modules they contain.
+    for name in list(kept):
+        while '.' in name:
+            name = name.rsplit('.', 1)[0]
+            kept.add(name)
+    return sorted(set(modules) - kept)
+
+
+def trace(python, path, run, flags='', timeout=None):
+    """Return the modules loaded by *run*, and any error message."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = os.path.join(tmpdir, 'trace.json')
+        spec = {
+            'path': list(path),
+            'argv': run.argv,
+            'initialization': run.initialization,
+            'module': run.module,
+            'object': run.object,
+            'call': run.call,
+            'output': output,
+        }
+        try:
+            cp = subprocess.run(
+                [python, '-EsB' + flags, '-c', TRACER, json.dumps(spec)],
+                cwd=tmpdir, stdin=subprocess.DEVNULL, capture_output=True,
+                timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return set(), f'timed out after {timeout} seconds'
+        try:
+            with open(output) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            lines = str(cp.stderr, 'utf-8', 'replace').strip().splitlines()
+            return set(), (lines[-1] if lines
+                           else f'exit status {cp.returncode}')
+    return set(result['modules']), result['error']
+
+
+def compile_time(python, paths, optimize=0):
+    """Return the seconds *python* needs to compile the sources."""
+    if not paths:
+        return 0.0
+    stdout = subprocess.check_output(
+        [python, '-EsB', '-c', COMPILE_TIMER, str(optimize)],
+        input='\n'.join(paths).encode('utf-8'))
+    return float(stdout)
+
+
+def shake(python, libdir, path, runs, keep=(), remove=False, flags='',
+          optimize=0, timeout=None, max_workers=None):
+    """Find, and if *remove* is true remove, unused modules in *libdir*.
+
+    *path* is the list of directories put first on ``sys.path`` for each
+    of the *runs*; it must include *libdir*.
+
+    """
+    result = Result()
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        traces = executor.map(
+            lambda run: trace(python, path, run, flags, timeout), runs)
+        for run, (loaded, error) in zip(runs, traces):
+            result.loaded.update(loaded)
+            if error:
+                result.errors.append((run, error))
+
+    modules = module_files(libdir)
+    for name in find_candidates(modules, result.loaded, keep):
+        result.candidates[name] = sorted(modules[name])
+    files = result.files
+    result.size = sum(os.path.getsize(os.path.join(libdir, relpath))
+                      for relpath in files)
+    result.compile_time = compile_time(
+        python, [os.path.join(libdir, relpath) for relpath in files
+                 if relpath.endswith('.py')],
+        optimize)
+
+    # A failed run could have loaded only some of what's needed.
+    if remove and not result.errors:
+        remove_files(libdir, files)
+        result.removed = True
+    return result
+
+
+def remove_files(libdir, files):
+    """Remove *files* from *libdir*, and any directories left empty."""
+    directories = set()
+    for relpath in files:
+        os.unlink(os.path.join(libdir, relpath))
+        directories.add(os.path.dirname(relpath))
+    # Deepest first, so emptied parents are removed as well.
+    for dirname in sorted(directories, key=lambda d: -d.count(os.sep)):
+        while dirname:
+            path = os.path.join(libdir, dirname)
+            if not os.path.isdir(path):
+                # Already removed with a deeper directory.
+                break
+            if os.listdir(path):
+                break
+            os.rmdir(path)
+            dirname = os.path.dirname(dirname)
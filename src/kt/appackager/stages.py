@@ -0,0 +1,138 @@
+"""\
+Concurrent execution of build stages with declared dependencies.
+
+Each stage is started as soon as all the stages it requires have
+completed, so the total time for a set of stages approaches the time
+for the longest chain of dependent stages (the critical path).
+
+"""
+
+import concurrent.futures
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class Stage(object):
+
+    def __init__(self, name, function, requires=()):
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.start = None
+        self.end = None
+        self.result = None
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+class Scheduler(object):
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.start = None
+        self.end = None
+
+    def add(self, name, function, requires=()):
+        """Add a stage that runs *function* once *requires* are complete.
+
+        Required stages must already have been added; this ensures there
+        are no dependency cycles.
+
+        """
+        if name in self.stages:
+            raise ValueError(f'stage {name!r} already defined')
+        for required in requires:
+            if required not in self.stages:
+                raise ValueError(f'stage {name!r} requires unknown'
+                                 f' stage {required!r}')
+        stage = Stage(name, function, requires)
+        self.stages[name] = stage
+        return stage
+
+    def run(self, finish=()):
+        """Run all stages, returning a mapping of stage names to results.
+
+        If any stage fails, no further stages are started, other than
+        those named in *finish*, which are still started once the stages
+        they require are complete.  Stages that are already running are
+        allowed to finish, and the first exception is re-raised.
+
+        """
+        pending = dict(self.stages)
+        completed = set()
+        running = {}
+        failure = None
+        self.start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(
+                self.max_workers) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if failure is not None and name not in finish:
+                        continue
+                    if completed.issuperset(stage.requires):
+                        del pending[name]
+                        future = executor.submit(self._run_stage, stage)
+                        running[future] = stage
+                if not running:
+                    break
+                finished, unfinished = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if failure is None:
+                            failure = e
+                    else:
+                        completed.add(stage.name)
+        self.end = time.perf_counter()
+        if failure is not None:
+            raise failure
+        self.log_critical_path()
+        return {name: stage.result for name, stage in self.stages.items()}
+
+    def _run_stage(self, stage):
+        stage.start = time.perf_counter()
+        try:
+            stage.result = stage.function()
+        finally:
+            stage.end = time.perf_counter()
+
+    @property
+    def durations(self):
+        return {name: stage.duration
+                for name, stage in self.stages.items()
+                if stage.duration is not None}
+
+    def critical_path(self):
+        """Return the chain of stages that determined the total time."""
+        finished = [stage for stage in self.stages.values()
+                    if stage.end is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda stage: stage.end)]
+        while path[-1].requires:
+            path.append(max((self.stages[name] for name in path[-1].requires),
+                            key=lambda stage: stage.end))
+        path.reverse()
+        return path
+
+    def log_critical_path(self):
+        path = self.critical_path()
+        if not path:
+            return
+        logger.info(
+            'critical path: %s (%.2fs elapsed, %.2fs total stage time)',
+            ' -> '.join(f'{stage.name} {stage.duration:.2f}s'
+                        for stage in path),
+            self.end - self.start,
+            sum(self.durations.values()))
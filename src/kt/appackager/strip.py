@@ -0,0 +1,100 @@
+"""\
+Stripping of shared objects in a staged tree.
+
+Debug information can optionally be saved in a separate tree using the
+build-id layout (``usr/lib/debug/.build-id/xx/yyyy.debug``), suitable
+for packaging as a companion debug-symbols package.
+
+"""
+
+import concurrent.futures
+import os
+import subprocess
+
+import kt.appackager.elf
+
+
+DEBUG_DIRECTORY = '/usr/lib/debug'
+
+
+class StripResult(object):
+    """Summary of stripping shared objects in a tree."""
+
+    def __init__(self):
+        # Paths of stripped objects, relative to the stripped tree.
+        self.stripped = []
+        # Paths of separated debug files, relative to the debug root.
+        self.debug_files = []
+        self.size_before = 0
+        self.size_after = 0
+
+    @property
+    def saved(self):
+        return self.size_before - self.size_after
+
+    def __str__(self):
+        text = (f'stripped {len(self.stripped)} shared objects,'
+                f' saved {self.saved} bytes')
+        if self.debug_files:
+            text += (f'; separated debug information for'
+                     f' {len(self.debug_files)} shared objects')
+        return text
+
+
+def strip_shared_objects(root, paths, debug_root=None, max_workers=None):
+    """Strip the shared objects at *paths* (relative to *root*).
+
+    If *debug_root* is provided, debug information is moved to files
+    under that directory before stripping, for objects that have a
+    build-id.  Objects without symbols or debug information are left
+    alone.  Stripping is performed in parallel.
+
+    """
+    result = StripResult()
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(_strip, os.path.join(root, path), debug_root):
+            path
+            for path in sorted(paths)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            outcome = future.result()
+            if outcome is None:
+                continue
+            before, after, debug_file = outcome
+            result.stripped.append(futures[future])
+            result.size_before += before
+            result.size_after += after
+            if debug_file:
+                result.debug_files.append(debug_file)
+    result.stripped.sort()
+    result.debug_files.sort()
+    return result
+
+
+def debug_file_path(build_id):
+    """Return the build-id location for the debug file of an object."""
+    return os.path.join('.build-id', build_id[:2], build_id[2:] + '.debug')
+
+
+def _strip(path, debug_root):
+    with open(path, 'rb') as f:
+        elf = kt.appackager.elf.open_elf(f)
+        if elf is None or not elf.has_debug_info():
+            return None
+        build_id = elf.build_id()
+    before = os.path.getsize(path)
+    debug_file = None
+    if debug_root and build_id:
+        debug_file = debug_file_path(build_id)
+        debug_path = os.path.join(debug_root, debug_file)
+        os.makedirs(os.path.dirname(debug_path), exist_ok=True)
+        subprocess.check_call(
+            ['objcopy', '--only-keep-debug', '--compress-debug-sections',
+             path, debug_path])
+        os.chmod(debug_path, 0o644)
+    subprocess.check_call(['strip', '--strip-unneeded', path])
+    if debug_file:
+        subprocess.check_call(
+            ['objcopy', f'--add-gnu-debuglink={debug_path}', path])
+    return before, os.path.getsize(path), debug_file
@@ -0,0 +1,257 @@
+"""\
+Integrity manifests for installed trees.
+
+A manifest listing the SHA-256 digest, size and modification time of
+each file in the installation directory is written into the package when
+it's built.  Once the package is installed, **appackage verify** checks
+the tree against the manifest::
+
+    appackage verify [--fast] [--json] [--jobs N] DIRECTORY...
+
+Files are hashed in parallel using memory-mapped reads.  With **--fast**,
+only sizes and modification times are compared, so no file content is
+read.  The exit status is 0 if every tree matches its manifest, 1 if any
+files are missing, modified or unexpected, and 2 if a tree can't be
+checked at all.
+
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import stat
+import sys
+
+
+# Relative to the installation directory:
+MANIFEST_NAME = '.appackager-manifest.json'
+MANIFEST_VERSION = 1
+
+# Exit statuses for the verify command:
+OK = 0
+DRIFTED = 1
+ERROR = 2
+
+MISSING = 'missing'
+MODIFIED = 'modified'
+EXTRA = 'extra'
+
+
+class ManifestError(Exception):
+    """Raised when a manifest can't be loaded."""
+
+
+class Problem(object):
+
+    def __init__(self, path, kind, detail=None):
+        self.path = path
+        self.kind = kind
+        self.detail = detail
+
+    def as_dict(self):
+        return {
+            'path': self.path,
+            'problem': self.kind,
+            'detail': self.detail,
+        }
+
+
+def hash_file(path):
+    """Return the hex SHA-256 digest of the file at *path*."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # Empty files can't be mapped.
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            # hashlib releases the GIL for large buffers, so this runs
+            # in parallel across threads.
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def tree_entries(top):
+    """Return relative paths of the files and symlinks in *top*.
+
+    The manifest itself is not included.
+
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(top):
+        # Symlinks to directories are listed as directories, but aren't
+        # followed by os.walk:
+        for name in dirnames:
+            if os.path.islink(os.path.join(dirpath, name)):
+                filenames.append(name)
+        for fn in filenames:
+            paths.append(os.path.relpath(os.path.join(dirpath, fn), top))
+    paths.sort()
+    if MANIFEST_NAME in paths:
+        paths.remove(MANIFEST_NAME)
+    return paths
+
+
+def build_manifest(top, max_workers=None):
+    """Return the manifest of the tree at *top*."""
+    # dpkg-deb clamps modification times when SOURCE_DATE_EPOCH is set,
+    # so the recorded times have to match.
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    epoch = int(epoch) if epoch else None
+
+    def entry(relpath):
+        path = os.path.join(top, relpath)
+        st = os.lstat(path)
+        if stat.S_ISLNK(st.st_mode):
+            return {'link': os.readlink(path)}
+        mtime = int(st.st_mtime)
+        if epoch is not None:
+            mtime = min(mtime, epoch)
+        return {'sha256': hash_file(path), 'size': st.st_size,
+                'mtime': mtime}
+
+    paths = tree_entries(top)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        files = dict(zip(paths, executor.map(entry, paths)))
+    return {
+        'version': MANIFEST_VERSION,
+        'algorithm': 'sha256',
+        'files': files,
+    }
+
+
+def write_manifest(top, max_workers=None):
+    """Write the manifest for the tree at *top* into the tree.
+
+    The number of entries is returned.
+
+    """
+    manifest = build_manifest(top, max_workers)
+    path = os.path.join(top, MANIFEST_NAME)
+    if os.path.exists(path):
+        os.unlink(path)
+    with open(path, 'w') as f:
+        json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+        f.write('\n')
+    os.chmod(path, 0o444)
+    return len(manifest['files'])
+
+
+def load_manifest(top):
+    path = os.path.join(top, MANIFEST_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ManifestError(f'{path} does not exist')
+    except (OSError, ValueError) as e:
+        raise ManifestError(f'could not load {path}: {e}')
+    if (not isinstance(manifest, dict)
+            or manifest.get('version') != MANIFEST_VERSION
+            or not isinstance(manifest.get('files'), dict)):
+        raise ManifestError(f'{path} is not a supported manifest')
+    return manifest
+
+
+def verify_tree(top, manifest, fast=False, max_workers=None):
+    """Return the problems found by checking *top* against *manifest*.
+
+    If *fast* is true, only sizes and modification times are compared;
+    otherwise file content is compared, and modification times are
+    ignored.
+
+    """
+    expected = manifest['files']
+    actual = set(tree_entries(top))
+    problems = [Problem(relpath, MISSING)
+                for relpath in sorted(set(expected) - actual)]
+    problems.extend(Problem(relpath, EXTRA)
+                    for relpath in sorted(actual - set(expected)))
+
+    def check(relpath):
+        entry = expected[relpath]
+        path = os.path.join(top, relpath)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return Problem(relpath, MISSING)
+        if 'link' in entry:
+            if not stat.S_ISLNK(st.st_mode):
+                return Problem(relpath, MODIFIED, 'not a symlink')
+            target = os.readlink(path)
+            if target != entry['link']:
+                return Problem(relpath, MODIFIED,
+                               f'link to {target}, expected {entry["link"]}')
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return Problem(relpath, MODIFIED, 'not a regular file')
+        if st.st_size != entry['size']:
+            return Problem(relpath, MODIFIED,
+                           f'size {st.st_size}, expected {entry["size"]}')
+        if fast:
+            if int(st.st_mtime) != entry['mtime']:
+                return Problem(relpath, MODIFIED,
+                               f'mtime {int(st.st_mtime)},'
+                               f' expected {entry["mtime"]}')
+        elif hash_file(path) != entry['sha256']:
+            return Problem(relpath, MODIFIED, 'sha256 mismatch')
+        return None
+
+    common = sorted(actual.intersection(expected))
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        problems.extend(problem for problem in executor.map(check, common)
+                        if problem is not None)
+    problems.sort(key=lambda problem: problem.path)
+    return problems
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='appackage verify',
+        description='Check installed trees against the manifests'
+                    ' included in their packages.')
+    parser.add_argument('directories', nargs='+', metavar='DIRECTORY',
+                        help='installation directory of a package')
+    parser.add_argument('--fast', action='store_true',
+                        help='compare only sizes and modification times')
+    parser.add_argument('--json', action='store_true',
+                        help='write the results as JSON')
+    parser.add_argument('--jobs', '-j', type=int, metavar='N',
+                        help='number of files checked concurrently')
+    settings = parser.parse_args(args)
+
+    status = OK
+    results = []
+    for directory in settings.directories:
+        result = {'directory': directory, 'files': 0,
+                  'problems': [], 'error': None}
+        results.append(result)
+        try:
+            manifest = load_manifest(directory)
+        except ManifestError as e:
+            result['error'] = str(e)
+            status = ERROR
+            if not settings.json:
+                print(f'{directory}: {e}', file=sys.stderr)
+            continue
+        problems = verify_tree(directory, manifest, fast=settings.fast,
+                               max_workers=settings.jobs)
+        result['files'] = len(manifest['files'])
+        result['problems'] = [problem.as_dict() for problem in problems]
+        if problems and status == OK:
+            status = DRIFTED
+        if not settings.json:
+            for problem in problems:
+                detail = f' ({problem.detail})' if problem.detail else ''
+                print(f'{problem.kind}: '
+                      f'{os.path.join(directory, problem.path)}{detail}')
+            print(f'{directory}: {result["files"]} files checked,'
+                  f' {len(problems)} problems', file=sys.stderr)
+
+    if settings.json:
+        json.dump({'status': status, 'fast': settings.fast,
+                   'trees': results},
+                  sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    return status
@@ -0,0 +1,169 @@
+"""\
+Helpers for building test fixtures.
+
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+
+PYTHONDIR = 'python%d.%d' % sys.version_info[:2]
+
+
+SHARED_OBJECT_SOURCE = '''\
+#include <math.h>
+#include <stdlib.h>
+
+double fixture_compute(double value)
+{
+    const char *scale = getenv("FIXTURE_SCALE");
+    return cbrt(value) * (scale ? atof(scale) : 1.0);
+}
+'''
+
+
+def compile_shared_object(directory, name, source=SHARED_OBJECT_SOURCE,
+                          debug=False):
+    """Compile *source* to a shared object in *directory*.
+
+    The test is skipped if no C compiler is available.
+
+    """
+    compiler = shutil.which(os.environ.get('CC', 'cc'))
+    if compiler is None:
+        raise unittest.SkipTest('C compiler not available')
+    source_path = os.path.join(directory, name + '.c')
+    with open(source_path, 'w') as f:
+        f.write(source)
+    target = os.path.join(directory, name)
+    command = [compiler, '-shared', '-fPIC', '-o', target, source_path, '-lm']
+    if debug:
+        command[1:1] = ['-g', '-Wl,--build-id']
+    subprocess.check_call(command)
+    os.unlink(source_path)
+    return target
+
+
+# Stand-ins for the external tools used by builds.  The pipenv stand-in
+# "syncs" by copying the site-packages tree named by $FIXTURE_SITE into
+# the virtual environment at $FIXTURE_VENV, or fails if
+# $FIXTURE_SYNC_FAILS is set.  Wheels built for local packages are
+# empty, and installing them does nothing; the local packages are
+# expected in $FIXTURE_SITE already.
+
+PIPENV_STANDIN = '''\
+#!{python}
+import os, shutil, sys
+venv = os.environ['FIXTURE_VENV']
+site = os.path.join(venv, 'lib', {pythondir!r}, 'site-packages')
+args = sys.argv[1:]
+if args == ['--venv']:
+    if os.path.isdir(venv):
+        print(venv)
+        sys.exit(0)
+    sys.exit(1)
+elif 'sync' in args:
+    if os.environ.get('FIXTURE_SYNC_FAILS'):
+        sys.exit(1)
+    os.makedirs(os.path.dirname(site))
+    shutil.copytree(os.environ['FIXTURE_SITE'], site, symlinks=True)
+elif args[:5] == ['run', 'python', '-m', 'pip', 'wheel']:
+    wheeldir = args[args.index('--wheel-dir') + 1]
+    name = os.path.basename(args[-1].rstrip('/'))
+    open(os.path.join(wheeldir, name + '-1.0-py3-none-any.whl'), 'w').close()
+elif args[:5] == ['run', 'python', '-m', 'pip', 'install']:
+    pass
+elif args[:2] == ['run', 'python']:
+    print(os.path.join(site, 'pip', '__init__.py'))
+else:
+    sys.exit('unsupported pipenv invocation: %r' % (args,))
+'''
+
+DPKG_DEB_STANDIN = '''\
+#!{python}
+import subprocess, sys
+args = [arg for arg in sys.argv[1:] if not arg.startswith('-Z')
+        and not arg.startswith('-z')]
+assert args[0] == '-b', args
+directory = args[1].rstrip('/')
+output = args[2] if len(args) > 2 else directory + '.deb'
+subprocess.check_call(['tar', 'czf', output, '-C', directory, '.'])
+'''
+
+SIMPLE_STANDINS = {
+    'fakeroot': '#!/bin/sh\nexec "$@"\n',
+    'dpkg-architecture': '#!/bin/sh\necho amd64\n',
+    'lsb_release': ('#!/bin/sh\ncase "$1" in\n'
+                    '  --id) echo Ubuntu;;\n'
+                    '  *) echo 22.04;;\nesac\n'),
+}
+
+
+def write(path, content, mode=None):
+    """Write *content* to *path*, creating directories as needed."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def record_line(site_packages, path):
+    """Return the RECORD line for the file at *path*."""
+    with open(os.path.join(site_packages, path), 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    return f'{path},sha256={digest},{len(content)}\n'
+
+
+def make_dist(site_packages, name, files, tag='py3-none-any',
+              entry_points=None, top_level=None, missing=()):
+    """Install distribution *name* 1.0 in *site_packages*.
+
+    *files* maps paths relative to *site_packages* to their content, or
+    lists paths of files that are created empty unless they already
+    exist.  The RECORD also lists the *missing* paths, which aren't
+    installed, and a script outside *site_packages*.  Returns the path
+    of the ``*.dist-info`` directory.
+
+    """
+    distinfo = f'{name}-1.0.dist-info'
+    if not isinstance(files, dict):
+        files = {path: None for path in files}
+    files[f'{distinfo}/METADATA'] = (
+        f'Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n\n')
+    files[f'{distinfo}/WHEEL'] = (
+        f'Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: {tag}\n')
+    if entry_points is not None:
+        files[f'{distinfo}/entry_points.txt'] = entry_points
+    if top_level is not None:
+        files[f'{distinfo}/top_level.txt'] = top_level + '\n'
+    for path, content in files.items():
+        fullpath = os.path.join(site_packages, path)
+        if content is not None:
+            write(fullpath, content)
+        elif not os.path.exists(fullpath):
+            write(fullpath, '')
+    with open(os.path.join(site_packages, distinfo, 'RECORD'), 'w') as f:
+        for path in sorted(files):
+            f.write(record_line(site_packages, path))
+        for path in missing:
+            f.write(f'{path},,\n')
+        f.write(f'{distinfo}/RECORD,,\n')
+        f.write(f'../../../bin/{name},,\n')
+    return os.path.join(site_packages, distinfo)
+
+
+def install_standins(bindir):
+    """Write stand-ins for external tools into *bindir*."""
+    python = sys.executable
+    write(os.path.join(bindir, 'pipenv'),
+          PIPENV_STANDIN.format(python=python, pythondir=PYTHONDIR), 0o755)
+    write(os.path.join(bindir, 'dpkg-deb'),
+          DPKG_DEB_STANDIN.format(python=python), 0o755)
+    for name, content in SIMPLE_STANDINS.items():
+        write(os.path.join(bindir, name), content, 0o755)
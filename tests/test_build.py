@@ -0,0 +1,337 @@
+"""\
+Tests for kt.appackager.build.
+
+External tools are replaced with stand-ins from tests.fixtures.
+
+"""
+
+import contextlib
+import glob
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+
+import tomli
+
+import kt.appackager.build
+import kt.appackager.cli
+import kt.appackager.elf
+import tests.fixtures
+
+
+PYTHONDIR = tests.fixtures.PYTHONDIR
+
+CONFIGURATION = '''\
+[package]
+name = "myapp"
+maintainer = "Tests"
+
+[dependencies]
+requires = []
+
+[installation]
+directory = "/opt/myapp"
+python = {python}
+
+[runtime]
+
+[script.myapp]
+entry-point = "app:myapp"
+'''
+
+
+class LayeredBuildTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        environ = dict(os.environ)
+
+        def restore_environ():
+            os.environ.clear()
+            os.environ.update(environ)
+
+        self.addCleanup(restore_environ)
+        self.addCleanup(os.chdir, os.getcwd())
+
+        bindir = os.path.join(self.tmpdir, 'bin')
+        tests.fixtures.install_standins(bindir)
+        os.environ['PATH'] = bindir + os.pathsep + os.environ['PATH']
+        os.environ['FIXTURE_SITE'] = os.path.join(self.tmpdir, 'site-packages')
+        os.environ['FIXTURE_VENV'] = os.path.join(self.tmpdir, 'venv')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.tmpdir, 'cache')
+
+        self.project = os.path.join(self.tmpdir, 'project')
+        self.make_dist('app', {
+            'app/__init__.py': '',
+            'app/cli.py': 'def main():\n    pass\n',
+        }, entry_points='[console_scripts]\nmyapp = app.cli:main\n')
+        self.make_dist('dep', {'dep/__init__.py': 'answer = 42\n'})
+        tests.fixtures.write(
+            os.path.join(os.environ['FIXTURE_SITE'], 'pip', '__init__.py'), '')
+        tests.fixtures.write(
+            os.path.join(self.project, 'app', 'setup.cfg'),
+            '[metadata]\nname = app\n')
+        self.write_lock({'dep': {'version': '==1.0'}})
+        tests.fixtures.write(
+            os.path.join(self.project, 'appackager.toml'),
+            CONFIGURATION.format(python=json.dumps(sys.executable)))
+
+    def make_dist(self, name, files, entry_points=None):
+        tests.fixtures.make_dist(os.environ['FIXTURE_SITE'], name, files,
+                                 entry_points=entry_points)
+
+    def write_lock(self, packages, local=None):
+        if local is None:
+            local = {'path': 'app', 'editable': True}
+        packages = dict(packages, app=local)
+        tests.fixtures.write(
+            os.path.join(self.project, 'Pipfile.lock'),
+            json.dumps({'default': packages, 'develop': {}}, indent=4))
+
+    def configuration(self):
+        with open(os.path.join(self.project, 'appackager.toml'), 'rb') as f:
+            config = kt.appackager.cli.Configuration(tomli.load(f))
+        config.set_version = '1.0.0'
+        return config
+
+    def target_build(self):
+        # A build with what's shared between targets already done.
+        os.chdir(self.project)
+        build = kt.appackager.build.Build(self.configuration())
+        build.workdir = self.project
+        return build
+
+    def run_build(self, resume=False):
+        os.chdir(self.project)
+        config = self.configuration()
+        config.resume = resume
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            kt.appackager.build.Build(config).run()
+        self.output = stdout.getvalue()
+        packages = os.path.join(self.project, 'packages')
+        return {os.path.basename(path).split('_', 1)[0]: path
+                for path in glob.glob(os.path.join(packages, '*.deb'))}
+
+    def test_resume_after_payload_failure(self):
+        path = os.path.join(self.project, 'appackager.toml')
+        with open(path) as f:
+            original = f.read()
+        tests.fixtures.write(path, original + (
+            '\n[payload.etc]\nsource = "etc"\ndestination = "etc"\n'))
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(FileNotFoundError):
+                self.run_build()
+        # Stages that don't need the payloads ran on to the checkpoints:
+        self.assertIn('with results from environment, tree stages;'
+                      ' use --resume', stderr.getvalue())
+
+        tests.fixtures.write(
+            os.path.join(self.project, 'etc', 'app.conf'), 'setting = 1\n')
+        debs = self.run_build(resume=True)
+        self.assertIn('resuming with saved results from environment, tree'
+                      ' stages', self.output)
+        files, content = self.read_package(debs['myapp'])
+        self.assertIn('opt/myapp/etc/app.conf', files)
+
+    def read_package(self, path):
+        with tarfile.open(path) as tar:
+            files = {os.path.normpath(member.name): member
+                     for member in tar.getmembers() if member.isfile()}
+            content = {name: str(tar.extractfile(member).read(), 'utf-8')
+                       for name, member in files.items()
+                       if name.startswith('DEBIAN/')
+                       or '/bin/' in name}
+        return set(files), content
+
+    def test_runtime_key_ignores_local_packages(self):
+        key = self.target_build().compute_runtime_key()
+        self.write_lock({'dep': {'version': '==1.0'}},
+                        local={'path': 'app', 'editable': False})
+        self.assertEqual(self.target_build().compute_runtime_key(), key)
+        self.write_lock({'dep': {'version': '==1.1'}})
+        self.assertNotEqual(self.target_build().compute_runtime_key(), key)
+
+    def test_runtime_key_includes_packaging_settings(self):
+        key = self.target_build().compute_runtime_key()
+        keys = {key}
+        for settings in ('strip = true',
+                         'strip = true\ndebug-package = true',
+                         'manifest = false',
+                         '[installation.bytecode]\noptimize = 2'):
+            build = self.target_build()
+            text = CONFIGURATION.format(python=json.dumps(sys.executable))
+            text = text.replace('\n[runtime]', f'{settings}\n\n[runtime]')
+            build.config = kt.appackager.cli.Configuration(tomli.loads(text))
+            keys.add(build.compute_runtime_key())
+        self.assertEqual(len(keys), 5)
+
+    def test_fingerprint_includes_local_packages(self):
+        # Local packages can be outside the project.
+        tests.fixtures.write(
+            os.path.join(self.tmpdir, 'lib', 'libpkg', '__init__.py'), '')
+        tests.fixtures.write(
+            os.path.join(self.tmpdir, 'lib', 'setup.cfg'),
+            '[metadata]\nname = libpkg\n')
+        self.write_lock({'dep': {'version': '==1.0'},
+                         'libpkg': {'path': '../lib'}})
+        build = self.target_build()
+        build.compute_fingerprint()
+        before = build.fingerprint
+
+        tests.fixtures.write(
+            os.path.join(self.tmpdir, 'lib', 'libpkg', '__init__.py'),
+            'VALUE = 1\n')
+        build.compute_fingerprint()
+        self.assertNotEqual(build.fingerprint, before)
+
+    def test_lock_restored_after_failed_sync(self):
+        lockname = os.path.join(self.project, 'Pipfile.lock')
+        with open(lockname) as f:
+            original = f.read()
+        os.environ['FIXTURE_SYNC_FAILS'] = '1'
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.run_build()
+        with open(lockname) as f:
+            self.assertEqual(f.read(), original)
+        self.assertFalse(os.path.exists(lockname + '.orig'))
+
+    def test_interrupted_sync_detected(self):
+        lockname = os.path.join(self.project, 'Pipfile.lock')
+        shutil.copy(lockname, lockname + '.orig')
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                self.run_build()
+        self.assertIn('Pipfile.lock.orig exists', stderr.getvalue())
+        self.assertTrue(os.path.exists(lockname + '.orig'))
+
+    def test_local_package_files(self):
+        build = self.target_build()
+        build.site_packages = os.environ['FIXTURE_SITE']
+        self.assertEqual(
+            build.local_package_files(),
+            {'app/__init__.py', 'app/cli.py',
+             'app-1.0.dist-info/METADATA', 'app-1.0.dist-info/WHEEL',
+             'app-1.0.dist-info/entry_points.txt',
+             'app-1.0.dist-info/RECORD'})
+
+    def test_layered_packages(self):
+        key = self.target_build().compute_runtime_key()
+        runtime_package = f'myapp-runtime-{key}'
+        runtime_libdir = f'opt/myapp-runtime/{key}/lib/{PYTHONDIR}'
+
+        debs = self.run_build()
+        self.assertEqual(sorted(debs), ['myapp', runtime_package])
+
+        # Only the local package is in the application package:
+        files, content = self.read_package(debs['myapp'])
+        libdir = f'opt/myapp/lib/{PYTHONDIR}'
+        self.assertIn(f'{libdir}/app/cli.py', files)
+        self.assertIn(f'{libdir}/app-1.0.dist-info/RECORD', files)
+        self.assertFalse([path for path in files
+                          if path.startswith(f'{libdir}/dep')])
+        self.assertIn(f'Depends: {runtime_package}\n',
+                      content['DEBIAN/control'])
+        self.assertIn(f'sys.path.insert(1, {"/" + runtime_libdir!r})\n',
+                      content['opt/myapp/bin/myapp'])
+
+        # Everything else is in the runtime package:
+        files, content = self.read_package(debs[runtime_package])
+        self.assertIn(f'{runtime_libdir}/dep/__init__.py', files)
+        self.assertIn(f'{runtime_libdir}/pip/__init__.py', files)
+        self.assertFalse([path for path in files
+                          if path.startswith(f'{runtime_libdir}/app')])
+        self.assertIn(f'Package: {runtime_package}\n',
+                      content['DEBIAN/control'])
+
+
+class PackageNameTestCase(unittest.TestCase):
+
+    def target_builds(self, targets):
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            '[package]\nname = "myapp"\n'
+            '[dependencies]\nrequires = []\n'
+            '[installation]\ndirectory = "/opt/myapp"\n'
+            f'python = {targets}\n'))
+        build = kt.appackager.build.Build(config)
+        build.debnames_claimed = kt.appackager.build._Claims()
+        builds = []
+        for index, target in enumerate(config.targets):
+            target_build = kt.appackager.build.Build(
+                config.for_target(target))
+            target_build.timing_prefix = f'myapp:{index}/'
+            target_build.debnames_claimed = build.debnames_claimed
+            target_build.analysis = kt.appackager.elf.Analysis()
+            target_build.deb_version = '1.0.0'
+            target_build.build_arch = 'amd64'
+            target_build.distro = target.distro or 'ubuntu22.04'
+            builds.append(target_build)
+        return builds
+
+    def test_distro_label_without_shared_objects(self):
+        builds = self.target_builds(
+            '[{python = "/opt/jammy/bin/python3", distro = "jammy"},'
+            ' {python = "/opt/noble/bin/python3", distro = "noble"}]')
+        for build in builds:
+            build.determine_architecture()
+        self.assertEqual([build.debname for build in builds],
+                         ['myapp_1.0.0-1jammy_all.deb',
+                          'myapp_1.0.0-1noble_all.deb'])
+
+    def test_no_distro_label(self):
+        build, = self.target_builds('"/usr/bin/python3"')
+        build.determine_architecture()
+        self.assertEqual(build.debname, 'myapp_1.0.0-1_all.deb')
+
+    def test_colliding_targets(self):
+        # The detected distribution matches the other target's label.
+        builds = self.target_builds(
+            '["/usr/bin/python3",'
+            ' {python = "/opt/jammy/bin/python3", distro = "ubuntu22.04"}]')
+        for build in builds:
+            build.analysis.tags['ext-1.0.dist-info'] = [
+                'cp311-cp311-linux_x86_64']
+        first, second = builds
+        first.determine_architecture()
+        self.assertEqual(first.debname, 'myapp_1.0.0-1ubuntu22.04_amd64.deb')
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                second.determine_architecture()
+        self.assertIn('myapp:0 and myapp:1', stderr.getvalue())
+
+    def test_multiple_architectures(self):
+        build, = self.target_builds('"/usr/bin/python3"')
+        build.analysis.shared_objects = {
+            'ext/_speedups.so': {'architecture': 'amd64'},
+            'ext/helpers/arm64.so': {'architecture': 'arm64'},
+        }
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            build.determine_architecture()
+        self.assertEqual(build.arch, 'amd64')
+        self.assertIn('amd64, arm64', stdout.getvalue())
+
+    def test_suggested_dependencies(self):
+        for detect in (False, True):
+            build, = self.target_builds('"/usr/bin/python3"')
+            build.config.requires = ['libc6']
+            build.config.detect_dependencies = detect
+            build.analysis.shared_objects = {
+                'ext/_speedups.so': {
+                    'architecture': 'amd64',
+                    'needed': ['libc.so.6', 'libgcc_s.so.1'],
+                    'versions': {'libc.so.6': ['GLIBC_2.17']},
+                },
+            }
+            self.assertEqual(build.detected_dependencies(),
+                             ['libgcc-s1 | libgcc1'])
+            expected = ['libc6']
+            if detect:
+                expected.append('libgcc-s1 | libgcc1')
+            self.assertEqual(build.requirements(), expected)
@@ -0,0 +1,91 @@
+"""\
+Tests for kt.appackager.bytecode.
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import kt.appackager.bytecode
+import kt.appackager.cli
+
+
+MODULE_SOURCE = '''\
+"""Module docstring."""
+
+def answer():
+    assert False, 'assertions enabled'
+'''
+
+
+class BytecodeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.package = os.path.join(self.tmpdir, 'pkg')
+        os.mkdir(self.package)
+        with open(os.path.join(self.package, '__init__.py'), 'w') as f:
+            f.write(MODULE_SOURCE)
+        with open(os.path.join(self.package, 'data.txt'), 'w') as f:
+            f.write('not python\n')
+
+    def compile(self, bytecode):
+        command = kt.appackager.bytecode.compile_command(
+            sys.executable, '/opt/myapp/lib', bytecode)
+        subprocess.check_call(command, cwd=self.tmpdir)
+
+    def run_python(self, bytecode, code):
+        flags = kt.appackager.bytecode.interpreter_flags(bytecode)
+        cp = subprocess.run(
+            [sys.executable, '-Es' + flags, '-c', code],
+            cwd=self.tmpdir, capture_output=True, encoding='utf-8')
+        return cp.stdout.strip()
+
+    def test_default_command(self):
+        self.assertEqual(
+            kt.appackager.bytecode.compile_command('python3', '/opt/lib'),
+            ['python3', '-m', 'compileall', '-fqq', '-d', '/opt/lib', '.'])
+        self.assertEqual(kt.appackager.bytecode.interpreter_flags(), '')
+
+    def test_optimize_requires_python39(self):
+        bytecode = kt.appackager.cli.Bytecode(optimize=1)
+        with self.assertRaises(ValueError):
+            kt.appackager.bytecode.compile_command(
+                'python3', '/opt/lib', bytecode, (3, 8))
+        self.assertIn('-o', kt.appackager.bytecode.compile_command(
+            'python3', '/opt/lib', bytecode, (3, 9)))
+        # Hash-based byte-code alone is fine:
+        bytecode = kt.appackager.cli.Bytecode('checked-hash')
+        self.assertIn('--invalidation-mode',
+                      kt.appackager.bytecode.compile_command(
+                          'python3', '/opt/lib', bytecode, (3, 7)))
+
+    def test_unchecked_hash(self):
+        bytecode = kt.appackager.cli.Bytecode('unchecked-hash')
+        self.compile(bytecode)
+        pycache = os.path.join(self.package, '__pycache__')
+        pyc, = os.listdir(pycache)
+        with open(os.path.join(pycache, pyc), 'rb') as f:
+            header = f.read(16)
+        # Hash-based, source not checked:
+        self.assertEqual(int.from_bytes(header[4:8], 'little'), 1)
+
+    def test_sourceless_optimized(self):
+        bytecode = kt.appackager.cli.Bytecode(optimize=2, sourceless=True)
+        self.compile(bytecode)
+        count, size = kt.appackager.bytecode.remove_sources(self.tmpdir)
+        self.assertEqual(count, 1)
+        self.assertEqual(size, len(MODULE_SOURCE))
+        self.assertEqual(sorted(os.listdir(self.package)),
+                         ['__init__.pyc', 'data.txt'])
+        self.assertEqual(kt.appackager.bytecode.interpreter_flags(bytecode),
+                         'OO')
+        self.assertEqual(
+            self.run_python(bytecode,
+                            'import pkg; pkg.answer(); print(pkg.__doc__)'),
+            'None')
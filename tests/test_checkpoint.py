@@ -0,0 +1,119 @@
+"""\
+Tests for kt.appackager.checkpoint.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import kt.appackager.checkpoint
+
+
+class CheckpointsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.builddir = os.path.join(self.tmpdir, 'build')
+        os.mkdir(self.builddir)
+
+    def test_resume(self):
+        checkpoints = kt.appackager.checkpoint.Checkpoints(self.builddir)
+        checkpoints.complete('environment', 'abc', {'venv': '/tmp/venv'})
+        checkpoints.complete('tree', 'def')
+
+        self.assertEqual(checkpoints.recorded(), ['environment', 'tree'])
+
+        checkpoints = kt.appackager.checkpoint.Checkpoints(
+            self.builddir, resume=True)
+        self.assertEqual(checkpoints.lookup('environment', 'abc'),
+                         {'venv': '/tmp/venv'})
+        self.assertEqual(checkpoints.lookup('tree', 'def'), {})
+        # Different inputs:
+        self.assertIsNone(checkpoints.lookup('environment', 'xyz'))
+        self.assertIsNone(checkpoints.lookup('unknown', 'abc'))
+
+        checkpoints.retain(['environment'])
+        checkpoints = kt.appackager.checkpoint.Checkpoints(
+            self.builddir, resume=True)
+        self.assertIsNotNone(checkpoints.lookup('environment', 'abc'))
+        self.assertIsNone(checkpoints.lookup('tree', 'def'))
+
+    def test_fresh_build_discards(self):
+        checkpoints = kt.appackager.checkpoint.Checkpoints(self.builddir)
+        checkpoints.complete('environment', 'abc')
+        os.mkdir(os.path.join(self.builddir, 'package'))
+
+        checkpoints = kt.appackager.checkpoint.Checkpoints(self.builddir)
+        self.assertIsNone(checkpoints.lookup('environment', 'abc'))
+        self.assertEqual(os.listdir(self.builddir), [])
+
+    def test_resume_without_checkpoints(self):
+        checkpoints = kt.appackager.checkpoint.Checkpoints(
+            self.builddir, resume=True)
+        self.assertIsNone(checkpoints.lookup('environment', 'abc'))
+        self.assertEqual(checkpoints.recorded(), [])
+
+    def test_discard(self):
+        checkpoints = kt.appackager.checkpoint.Checkpoints(self.builddir)
+        checkpoints.complete('environment', 'abc')
+        checkpoints.discard()
+        self.assertFalse(os.path.exists(self.builddir))
+
+    def test_digest(self):
+        digest = kt.appackager.checkpoint.digest
+        self.assertEqual(digest('a', ['b', 1], None),
+                         digest('a', ['b', 1], None))
+        self.assertNotEqual(digest('a', ['b', 1]), digest('a', ['b', 2]))
+        self.assertNotEqual(digest('ab', 'c'), digest('a', 'bc'))
+
+
+class PruneTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        for relpath in ['checkpoints.json',
+                        'package/DEBIAN/control',
+                        'package/opt/myapp/bin/myapp',
+                        'package/opt/myapp/lib/python3.11/myapp/__init__.py',
+                        'package/opt/myapp/lib/python3.11/six.py',
+                        'package/opt/myapp/etc/payload.conf',
+                        'runtime/opt/myapp-runtime/lib/six.py']:
+            path = os.path.join(self.tmpdir, relpath)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w'):
+                pass
+        # Generated scripts are read-only:
+        os.chmod(os.path.join(self.tmpdir, 'package/opt/myapp/bin'), 0o555)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, fn), self.tmpdir)
+            for dirpath, dirnames, filenames in os.walk(self.tmpdir)
+            for fn in filenames)
+
+    def test_prune(self):
+        kt.appackager.checkpoint.prune(
+            self.tmpdir,
+            ['checkpoints.json', 'package/opt/myapp/lib/python3.11'])
+        self.assertEqual(self.files(), [
+            'checkpoints.json',
+            'package/opt/myapp/lib/python3.11/myapp/__init__.py',
+            'package/opt/myapp/lib/python3.11/six.py',
+        ])
+
+    def test_prune_everything(self):
+        kt.appackager.checkpoint.prune(self.tmpdir, ())
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_remove(self):
+        kt.appackager.checkpoint.remove(os.path.join(self.tmpdir, 'package'))
+        kt.appackager.checkpoint.remove(
+            os.path.join(self.tmpdir, 'checkpoints.json'))
+        # Nothing to remove:
+        kt.appackager.checkpoint.remove(
+            os.path.join(self.tmpdir, 'checkpoints.json'))
+        self.assertEqual(os.listdir(self.tmpdir), ['runtime'])
@@ -7,12 +7,27 @@ import os.path
 import sys
 import unittest
 
+import tomli
+
 import kt.appackager.cli
 
 
 here = os.path.dirname(os.path.abspath(__file__))
 sample_toml = os.path.join(here, 'sample.toml')
 
+minimal_toml = '''\
+[package]
+name = "myapp"
+
+[installation]
+directory = "/opt/myapp"
+python = "/opt/cleanpython311/bin/python3"
+
+[dependencies]
+requires = []
+
+'''
+
 
 class CLITestCase(unittest.TestCase):
 
@@ -39,3 +54,218 @@ class CLITestCase(unittest.TestCase):
                       by_name['script-next'].initialization)
         self.assertIn('kt.tracing.disable()',
                       by_name['script-name'].initialization)
+        self.assertEqual(config.path, sample_toml)
+        self.assertFalse(config.force)
+
+    def test_force(self):
+        sys.argv[1:] = ['-c', sample_toml, '--force']
+        parser = kt.appackager.cli.ArgumentParser()
+        self.assertTrue(parser.parse_args().config.force)
+
+    def test_resume(self):
+        sys.argv[1:] = ['-c', sample_toml]
+        parser = kt.appackager.cli.ArgumentParser()
+        self.assertFalse(parser.parse_args().config.resume)
+        sys.argv[1:] = ['-c', sample_toml, '--resume']
+        parser = kt.appackager.cli.ArgumentParser()
+        self.assertTrue(parser.parse_args().config.resume)
+
+    def test_help_mentions_verify(self):
+        parser = kt.appackager.cli.ArgumentParser(prog='appackage')
+        text = parser.format_help()
+        self.assertIn('appackage verify [-h] DIRECTORY', text)
+        self.assertIn('appackage verify DIRECTORY...', text)
+
+    def test_runtime_not_configured(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        self.assertIsNone(config.runtime)
+
+    def test_runtime_defaults(self):
+        config = kt.appackager.cli.Configuration(
+            tomli.loads(minimal_toml + '[runtime]\n'))
+        self.assertEqual(config.runtime.name, 'myapp-runtime')
+        self.assertEqual(config.runtime.directory, '/opt/myapp-runtime')
+        self.assertIn('myapp', config.runtime.description)
+
+    def test_runtime_settings(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml
+            + '[runtime]\n'
+            + 'name = "shared-deps"\n'
+            + 'directory = "/opt/shared"\n'))
+        self.assertEqual(config.runtime.name, 'shared-deps')
+        self.assertEqual(config.runtime.directory, '/opt/shared')
+
+    def targets_config(self, python):
+        text = minimal_toml.replace(
+            'python = "/opt/cleanpython311/bin/python3"',
+            f'python = {python}')
+        return kt.appackager.cli.Configuration(tomli.loads(text))
+
+    def test_single_target(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        target, = config.targets
+        self.assertEqual(target.python, '/opt/cleanpython311/bin/python3')
+        self.assertEqual(target.name, 'myapp')
+        self.assertEqual(target.directory, '/opt/myapp')
+        self.assertIsNone(target.distro)
+
+    def test_multiple_targets(self):
+        config = self.targets_config(
+            '["/opt/cleanpython311/bin/python3",'
+            ' {python = "/opt/cleanpython312/bin/python3",'
+            '  name = "myapp-py312", directory = "/opt/myapp-py312",'
+            '  requires = ["cleanpython312"]}]')
+        first, second = config.targets
+        self.assertEqual(config.python, first.python)
+        self.assertEqual(first.name, 'myapp')
+        self.assertEqual(first.requires, [])
+
+        target_config = config.for_target(second)
+        self.assertEqual(target_config.python,
+                         '/opt/cleanpython312/bin/python3')
+        self.assertEqual(target_config.name, 'myapp-py312')
+        self.assertEqual(target_config.directory, '/opt/myapp-py312')
+        self.assertEqual(target_config.requires, ['cleanpython312'])
+        self.assertEqual(target_config.targets, (second,))
+        # The original is unchanged:
+        self.assertEqual(config.name, 'myapp')
+
+    def test_targets_distinguished_by_distro(self):
+        config = self.targets_config(
+            '[{python = "/opt/jammy/bin/python3", distro = "ubuntu22.04"},'
+            ' {python = "/opt/noble/bin/python3", distro = "ubuntu24.04"}]')
+        self.assertEqual([target.distro for target in config.targets],
+                         ['ubuntu22.04', 'ubuntu24.04'])
+        # The labels go into the package versions, keeping the packages
+        # apart even when they aren't architecture-specific:
+        self.assertEqual(
+            [config.for_target(target).distro for target in config.targets],
+            ['ubuntu22.04', 'ubuntu24.04'])
+
+    def test_conflicting_targets(self):
+        with self.assertRaises(ValueError):
+            self.targets_config('["/opt/cleanpython311/bin/python3",'
+                                ' "/opt/cleanpython312/bin/python3"]')
+
+    def test_invalid_targets(self):
+        with self.assertRaises(ValueError):
+            self.targets_config('[]')
+        with self.assertRaises(ValueError):
+            self.targets_config('[{python = "/usr/bin/python3", arch = 1}]')
+        with self.assertRaises(TypeError):
+            self.targets_config('[{python = "/usr/bin/python3", name = 1}]')
+        with self.assertRaises(KeyError):
+            self.targets_config('[{name = "other"}]')
+
+    def test_detect_dependencies(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        self.assertFalse(config.detect_dependencies)
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml.replace('[dependencies]\n',
+                                 '[dependencies]\ndetect = true\n')))
+        self.assertTrue(config.detect_dependencies)
+
+    def test_manifest(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        self.assertTrue(config.manifest)
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml.replace('[installation]\n',
+                                 '[installation]\nmanifest = false\n')))
+        self.assertFalse(config.manifest)
+
+    def test_bytecode_defaults(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        self.assertIsNone(config.bytecode)
+        config = kt.appackager.cli.Configuration(
+            tomli.loads(minimal_toml + '[installation.bytecode]\n'))
+        self.assertEqual(config.bytecode.invalidation, 'timestamp')
+        self.assertEqual(config.bytecode.optimize, 0)
+        self.assertFalse(config.bytecode.sourceless)
+
+    def test_bytecode_settings(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml
+            + '[installation.bytecode]\n'
+            + 'invalidation = "unchecked-hash"\n'
+            + 'optimize = 2\n'
+            + 'sourceless = true\n'))
+        self.assertEqual(config.bytecode.invalidation, 'unchecked-hash')
+        self.assertEqual(config.bytecode.optimize, 2)
+        self.assertTrue(config.bytecode.sourceless)
+
+    def test_bytecode_invalid(self):
+        for setting in ('invalidation = "never"', 'optimize = 3'):
+            with self.assertRaises(ValueError):
+                kt.appackager.cli.Configuration(tomli.loads(
+                    minimal_toml
+                    + '[installation.bytecode]\n'
+                    + setting + '\n'))
+
+    def test_tree_shaking_defaults(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(minimal_toml))
+        self.assertIsNone(config.tree_shaking)
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml
+            + '[installation.tree-shaking]\n'
+            + '[script.one]\n'
+            + 'entry-point = "pkg:one"\n'))
+        self.assertFalse(config.tree_shaking.remove)
+        self.assertEqual(config.tree_shaking.keep, [])
+        self.assertEqual(config.tree_shaking.exercise, [])
+        self.assertEqual(config.tree_shaking.timeout,
+                         kt.appackager.cli.DEFAULT_TRACE_TIMEOUT)
+
+    def test_tree_shaking_settings(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml
+            + '[installation.tree-shaking]\n'
+            + 'remove = true\n'
+            + 'keep = ["botocore.data", "pkg.plugins.*"]\n'
+            + 'exercise = [["one", "--help"], ["one", "selftest"]]\n'
+            + 'timeout = 60\n'
+            + '[script.one]\n'
+            + 'entry-point = "pkg:one"\n'))
+        self.assertTrue(config.tree_shaking.remove)
+        self.assertEqual(config.tree_shaking.keep,
+                         ['botocore.data', 'pkg.plugins.*'])
+        self.assertEqual(config.tree_shaking.exercise,
+                         [['one', '--help'], ['one', 'selftest']])
+        self.assertEqual(config.tree_shaking.timeout, 60)
+
+    def test_tree_shaking_invalid(self):
+        script = '[script.one]\nentry-point = "pkg:one"\n'
+        for settings, exception in [
+                ('', ValueError),
+                ('exercise = [["two"]]\n' + script, ValueError),
+                ('exercise = [[]]\n' + script, TypeError),
+                ('exercise = ["one"]\n' + script, TypeError),
+                ('keep = [1]\n' + script, TypeError)]:
+            with self.assertRaises(exception):
+                kt.appackager.cli.Configuration(tomli.loads(
+                    minimal_toml
+                    + '[installation.tree-shaking]\n'
+                    + settings))
+
+    def test_script_profiling(self):
+        config = kt.appackager.cli.Configuration(tomli.loads(
+            minimal_toml
+            + '[scripts]\n'
+            + 'profiling = true\n'
+            + '[script.one]\n'
+            + 'entry-point = "pkg:one"\n'
+            + '[script.two]\n'
+            + 'entry-point = "pkg:two"\n'
+            + 'profiling = false\n'
+            + 'profile-directory = "/var/tmp/two"\n'))
+        one, two = config.scripts
+        self.assertTrue(one.profiling)
+        self.assertEqual(one.profile_directory,
+                         kt.appackager.cli.DEFAULT_PROFILE_DIRECTORY)
+        self.assertFalse(two.profiling)
+        self.assertEqual(two.profile_directory, '/var/tmp/two')
+
+    def test_script_profiling_default(self):
+        sys.argv[1:] = ['-c', sample_toml]
+        config = kt.appackager.cli.ArgumentParser().parse_args().config
+        self.assertFalse(any(script.profiling for script in config.scripts))
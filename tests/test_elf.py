@@ -0,0 +1,126 @@
+"""\
+Tests for kt.appackager.elf.
+
+"""
+
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import kt.appackager.elf
+import tests.fixtures
+
+
+class InspectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_non_elf(self):
+        path = os.path.join(self.tmpdir, 'module.py')
+        with open(path, 'w') as f:
+            f.write('print("hello")\n')
+        self.assertIsNone(kt.appackager.elf.inspect(path))
+
+    def test_truncated_elf(self):
+        path = os.path.join(self.tmpdir, 'broken.so')
+        with open(path, 'wb') as f:
+            f.write(kt.appackager.elf.ELF_MAGIC + b'\2\1')
+        self.assertIsNone(kt.appackager.elf.inspect(path))
+
+    def test_shared_object(self):
+        path = tests.fixtures.compile_shared_object(self.tmpdir, 'fixture.so')
+        info = kt.appackager.elf.inspect(path)
+        self.assertIn('libc.so.6', info['needed'])
+        self.assertIn('libm.so.6', info['needed'])
+        self.assertTrue(any(version.startswith('GLIBC_')
+                            for version in info['versions']['libc.so.6']))
+        with open(sys.executable, 'rb') as f:
+            header = kt.appackager.elf.read_header(f)
+        if header is not None:
+            self.assertEqual(info['machine'], header.machine)
+
+
+class AnalyzeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.site_packages = os.path.join(self.tmpdir, 'site-packages')
+        os.mkdir(self.site_packages)
+
+    def make_dist(self, name, files, tag='py3-none-any'):
+        return tests.fixtures.make_dist(self.site_packages, name, files, tag)
+
+    def test_pure_python(self):
+        os.mkdir(os.path.join(self.site_packages, 'pure'))
+        with open(os.path.join(self.site_packages, 'pure', '__init__.py'),
+                  'w') as f:
+            f.write('')
+        self.make_dist('pure', ['pure/__init__.py'])
+        analysis = kt.appackager.elf.analyze(self.site_packages)
+        self.assertFalse(analysis.arch_specific)
+        self.assertEqual(analysis.depends(), [])
+
+    def test_platform_tag(self):
+        self.make_dist('tagged', [], tag='cp311-cp311-linux_x86_64')
+        analysis = kt.appackager.elf.analyze(self.site_packages)
+        self.assertTrue(analysis.arch_specific)
+        self.assertEqual(analysis.shared_objects, {})
+
+    def test_vendored_shared_object_in_pure_wheel(self):
+        pkgdir = os.path.join(self.site_packages, 'vendoring')
+        os.mkdir(pkgdir)
+        tests.fixtures.compile_shared_object(pkgdir, '_speedups.so')
+        self.make_dist('vendoring', ['vendoring/_speedups.so'])
+
+        analysis = kt.appackager.elf.analyze(self.site_packages)
+        self.assertTrue(analysis.arch_specific)
+        self.assertEqual(list(analysis.shared_objects),
+                         ['vendoring/_speedups.so'])
+        self.assertEqual(analysis.owners['vendoring/_speedups.so'],
+                         'vendoring-1.0.dist-info')
+        depends = analysis.depends()
+        self.assertEqual(len(depends), 1)
+        self.assertRegex(depends[0], r'^libc6 \(>= \d+\.\d+(\.\d+)*\)$')
+
+    def test_cached_results(self):
+        pkgdir = os.path.join(self.site_packages, 'vendoring')
+        os.mkdir(pkgdir)
+        tests.fixtures.compile_shared_object(pkgdir, '_speedups.so')
+        self.make_dist('vendoring', ['vendoring/_speedups.so'])
+        cache_path = os.path.join(self.tmpdir, 'cache.json')
+
+        cache = kt.appackager.elf.AnalysisCache(cache_path)
+        first = kt.appackager.elf.analyze(self.site_packages, cache)
+        self.assertGreater(first.scanned, 0)
+
+        cache = kt.appackager.elf.AnalysisCache(cache_path)
+        second = kt.appackager.elf.analyze(self.site_packages, cache)
+        self.assertEqual(second.scanned, 0)
+        self.assertEqual(second.shared_objects, first.shared_objects)
+        self.assertEqual(second.depends(), first.depends())
+
+    def test_concurrent_cache_saves(self):
+        cache_path = os.path.join(self.tmpdir, 'cache.json')
+        caches = [kt.appackager.elf.AnalysisCache(cache_path)
+                  for i in range(8)]
+
+        def save(index):
+            cache = caches[index]
+            for round in range(20):
+                cache.set(f'{index}-{round}', {'round': round})
+                cache.save()
+
+        with concurrent.futures.ThreadPoolExecutor(len(caches)) as executor:
+            list(executor.map(save, range(len(caches))))
+
+        cache = kt.appackager.elf.AnalysisCache(cache_path)
+        self.assertEqual(len(cache.entries), 8 * 20)
+        self.assertEqual(os.listdir(self.tmpdir).count('cache.json'), 1)
+        self.assertFalse([fn for fn in os.listdir(self.tmpdir)
+                          if fn.endswith('.tmp')])
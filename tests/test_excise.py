@@ -0,0 +1,90 @@
+"""\
+Tests for kt.appackager.excise.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import kt.appackager.excise
+import tests.fixtures
+
+
+class ExcisionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.site_packages = os.path.join(
+            self.tmpdir, 'lib', 'python3.11', 'site-packages')
+        os.makedirs(self.site_packages)
+
+    def make_dist(self, name, files, missing=()):
+        return tests.fixtures.make_dist(
+            self.site_packages, name, {path: path for path in files},
+            missing=missing)
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(self.site_packages, path))
+
+    def test_excise(self):
+        first = self.make_dist('first', [
+            'first/__init__.py',
+            'first/sub/deeper/module.py',
+            'shared/first.py',
+        ])
+        second = self.make_dist('second', [
+            'second/__init__.py',
+            'second/data/values.json',
+        ])
+        self.make_dist('kept', [
+            'kept/__init__.py',
+            'shared/kept.py',
+        ])
+        bindir = os.path.join(self.tmpdir, 'bin')
+        os.mkdir(bindir)
+        with open(os.path.join(bindir, 'first'), 'w'):
+            pass
+
+        excision = kt.appackager.excise.Excision(self.site_packages)
+        excision.add(first)
+        excision.add(second)
+        result = excision.run(max_workers=2)
+
+        self.assertEqual(result.removed_files, 11)
+        self.assertEqual(result.missing, [])
+        self.assertEqual(result.not_empty, ['shared'])
+        for path in ('first', 'second', 'first-1.0.dist-info',
+                     'second-1.0.dist-info', 'shared/first.py'):
+            self.assertFalse(self.exists(path), path)
+        for path in ('kept/__init__.py', 'shared/kept.py',
+                     'kept-1.0.dist-info/RECORD'):
+            self.assertTrue(self.exists(path), path)
+        # Entries outside site-packages are left alone:
+        self.assertTrue(os.path.exists(os.path.join(bindir, 'first')))
+
+    def test_missing_entries_reported(self):
+        distinfo = self.make_dist(
+            'partial', ['partial/__init__.py'],
+            missing=['partial/__pycache__/__init__.cpython-311.pyc'])
+        excision = kt.appackager.excise.Excision(self.site_packages)
+        excision.add(distinfo)
+        result = excision.run()
+        self.assertEqual(result.missing,
+                         ['partial/__pycache__/__init__.cpython-311.pyc'])
+        self.assertFalse(self.exists('partial'))
+        self.assertFalse(self.exists('partial-1.0.dist-info'))
+
+    def test_unrecorded_content_kept(self):
+        distinfo = self.make_dist('dist', ['dist/__init__.py'])
+        with open(os.path.join(self.site_packages, 'dist', 'extra.txt'),
+                  'w'):
+            pass
+        excision = kt.appackager.excise.Excision(self.site_packages)
+        excision.add(distinfo)
+        result = excision.run()
+        self.assertEqual(result.not_empty, ['dist'])
+        self.assertTrue(self.exists('dist/extra.txt'))
+        self.assertFalse(self.exists('dist-1.0.dist-info'))
@@ -0,0 +1,121 @@
+"""\
+Tests for kt.appackager.fingerprint.
+
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import tomli
+
+import kt.appackager.cli
+import kt.appackager.fingerprint
+
+
+CONFIGURATION = '''\
+[package]
+name = "myapp"
+
+[installation]
+directory = "/opt/myapp"
+python = {python!r}
+
+[dependencies]
+requires = []
+
+[payload.extra]
+source = "../extra.txt"
+destination = "share/extra.txt"
+'''
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.project = os.path.join(self.tmpdir, 'project')
+        os.mkdir(self.project)
+        self.write('appackager.toml',
+                   CONFIGURATION.format(python=sys.executable))
+        self.write('Pipfile.lock', '{"default": {}, "develop": {}}\n')
+        self.write('src/myapp/__init__.py', '')
+        self.write('debian/postinst', '#!/bin/sh\n')
+        self.write('../extra.txt', 'extra\n')
+
+    def write(self, path, content):
+        path = os.path.join(self.project, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def compute(self, lock=None):
+        with open(os.path.join(self.project, 'appackager.toml'), 'rb') as f:
+            config = kt.appackager.cli.Configuration(tomli.load(f))
+        if lock is None:
+            with open(os.path.join(self.project, 'Pipfile.lock')) as f:
+                lock = json.load(f)
+        return kt.appackager.fingerprint.compute(config, self.project, lock)
+
+    def test_stable(self):
+        self.assertEqual(self.compute(), self.compute())
+
+    def test_input_changes(self):
+        changes = [
+            ('Pipfile.lock', '{"default": {"a": {}}, "develop": {}}\n'),
+            ('src/myapp/__init__.py', 'VALUE = 1\n'),
+            ('src/myapp/new.py', ''),
+            ('debian/postinst', '#!/bin/sh\nexit 0\n'),
+            ('../extra.txt', 'changed\n'),
+        ]
+        fingerprints = {self.compute()}
+        for path, content in changes:
+            self.write(path, content)
+            fingerprint = self.compute()
+            self.assertNotIn(fingerprint, fingerprints, path)
+            fingerprints.add(fingerprint)
+
+    def test_build_products_ignored(self):
+        before = self.compute()
+        self.write('.autoversion.json', '{}\n')
+        self.write('packages/myapp_1.0.0-1_all.deb', '')
+        self.write('Pipfile.lock.used', '{}\n')
+        self.assertEqual(self.compute(), before)
+
+    def test_lock_rewritten_for_sync(self):
+        lock = {'default': {}, 'develop': {}}
+        before = self.compute()
+        # While another target syncs, the file on disk differs from the
+        # lock the build is working from:
+        self.write('Pipfile.lock.orig', json.dumps(lock))
+        self.write('Pipfile.lock', '{"default": {"a": {}}, "develop": {}}\n')
+        self.assertEqual(self.compute(lock), before)
+
+
+class ArtifactIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.packages = os.path.join(self.tmpdir, 'packages')
+
+    def test_record_and_lookup(self):
+        index = kt.appackager.fingerprint.ArtifactIndex(self.packages)
+        self.assertIsNone(index.lookup('abc'))
+        index.record('abc', '1.0.0', ['myapp_1.0.0-1_all.deb'])
+        with open(os.path.join(self.packages, 'myapp_1.0.0-1_all.deb'), 'w'):
+            pass
+
+        index = kt.appackager.fingerprint.ArtifactIndex(self.packages)
+        entry = index.lookup('abc')
+        self.assertEqual(entry['version'], '1.0.0')
+        self.assertEqual(entry['packages'], ['myapp_1.0.0-1_all.deb'])
+
+    def test_removed_package_not_reused(self):
+        index = kt.appackager.fingerprint.ArtifactIndex(self.packages)
+        index.record('abc', '1.0.0', ['myapp_1.0.0-1_all.deb'])
+        self.assertIsNone(index.lookup('abc'))
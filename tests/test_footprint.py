@@ -0,0 +1,110 @@
+"""\
+Tests for kt.appackager.footprint.
+
+"""
+
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import kt.appackager.footprint
+import tests.fixtures
+
+
+IMPORTTIME_OUTPUT = '''\
+import time: self [us] | cumulative | imported package
+import time:        50 |         50 | _io
+import time:       120 |        120 |     helper.sub
+import time:       200 |        320 |   helper
+import time:       400 |        720 | mypkg
+'''
+
+
+class FootprintTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def write(self, path, content=''):
+        fullpath = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(fullpath), exist_ok=True)
+        with open(fullpath, 'w') as f:
+            f.write(content)
+
+    def make_dist(self, name, files, top_level=None):
+        tests.fixtures.make_dist(self.root, name, files, top_level=top_level)
+
+    def test_attribution(self):
+        self.make_dist('Alpha', {
+            'alpha/__init__.py': 'import beta\n',
+            'alpha/_speedups.cpython-311-x86_64-linux-gnu.so': 'x' * 100,
+            'alpha/data.json': '{}',
+        })
+        self.make_dist('beta', {'beta.pyc': 'b' * 10}, top_level='beta')
+        # Compiled after installation, so not in the RECORD:
+        self.write('alpha/__pycache__/__init__.cpython-311.pyc', 'c' * 20)
+        self.write('stray.txt', 'stray')
+
+        footprint = kt.appackager.footprint.analyze_tree(self.root)
+        alpha = footprint.distributions['Alpha']
+        self.assertEqual(alpha.modules, ['alpha'])
+        self.assertEqual(alpha.categories['shared-objects'], 100)
+        self.assertEqual(alpha.categories['python'], 12)
+        self.assertEqual(alpha.categories['bytecode'], 20)
+        # data.json, METADATA, WHEEL and RECORD:
+        self.assertGreater(alpha.categories['data'], 2)
+        self.assertEqual(alpha.files, 7)
+        self.assertGreater(alpha.compressed, 0)
+        self.assertLess(alpha.compressed, alpha.size)
+
+        beta = footprint.distributions['beta']
+        self.assertEqual(beta.modules, ['beta'])
+        self.assertEqual(beta.categories['bytecode'], 10)
+
+        unowned = footprint.distributions[kt.appackager.footprint.UNOWNED]
+        self.assertEqual(unowned.files, 1)
+        self.assertEqual(footprint.totals().files, sum(
+            dist.files for dist in footprint.distributions.values()))
+
+        data = footprint.as_dict()
+        # Largest first:
+        self.assertEqual(data['distributions'][0]['name'], 'Alpha')
+        stream = io.StringIO()
+        footprint.report(stream)
+        self.assertIn('Alpha', stream.getvalue())
+
+    def test_measure_imports(self):
+        self.make_dist('Alpha', {'alpha/__init__.py': 'import beta\n'})
+        self.make_dist('beta', {'beta.py': 'VALUE = 1\n'})
+        self.make_dist('broken', {'broken.py': 'raise ImportError("no")\n'})
+        footprint = kt.appackager.footprint.analyze_tree(self.root)
+        kt.appackager.footprint.measure_imports(
+            footprint, sys.executable, repeat=1)
+        costs = {cost.module: cost for cost in footprint.imports}
+        self.assertEqual(sorted(costs), ['alpha', 'beta', 'broken'])
+        self.assertIsNone(costs['alpha'].error)
+        self.assertEqual(costs['alpha'].modules, 2)
+        self.assertGreater(costs['alpha'].cumulative, 0)
+        self.assertIn('no', costs['broken'].error)
+
+        path = os.path.join(self.root, 'report.json')
+        kt.appackager.footprint.write_json([footprint], path)
+        with open(path) as f:
+            data = json.load(f)
+        package, = data['packages']
+        self.assertEqual(len(package['imports']), 3)
+
+    def test_parse_importtime(self):
+        self.assertEqual(
+            kt.appackager.footprint.parse_importtime(
+                IMPORTTIME_OUTPUT, 'mypkg'),
+            (720, 400, 3))
+        self.assertEqual(
+            kt.appackager.footprint.parse_importtime(
+                IMPORTTIME_OUTPUT, 'other'),
+            (0, 0, 0))
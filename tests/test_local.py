@@ -0,0 +1,139 @@
+"""\
+Tests for kt.appackager.local.
+
+"""
+
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import unittest
+
+import kt.appackager.local
+
+
+class LocalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def write(self, relpath, content):
+        path = os.path.join(self.tmpdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+
+class StaticNameTestCase(LocalTestCase):
+
+    def test_pyproject_project(self):
+        self.write('pyproject.toml', '[project]\nname = "myapp"\n')
+        self.assertEqual(kt.appackager.local.static_name(self.tmpdir),
+                         ('myapp', 'in pyproject.toml'))
+
+    def test_pyproject_poetry(self):
+        self.write('pyproject.toml', '[tool.poetry]\nname = "myapp"\n')
+        self.assertEqual(kt.appackager.local.static_name(self.tmpdir),
+                         ('myapp', 'in pyproject.toml'))
+
+    def test_setup_cfg(self):
+        # pyproject.toml without a name defers to setup.cfg.
+        self.write('pyproject.toml',
+                   '[build-system]\nrequires = ["setuptools"]\n')
+        self.write('setup.cfg', '[metadata]\nname = myapp\n')
+        self.assertEqual(kt.appackager.local.static_name(self.tmpdir),
+                         ('myapp', 'in setup.cfg'))
+
+    def test_dynamic(self):
+        self.write('setup.py', 'import setuptools\nsetuptools.setup()\n')
+        self.write('setup.cfg', '[options]\nzip_safe = false\n')
+        self.assertEqual(kt.appackager.local.static_name(self.tmpdir),
+                         (None, None))
+
+
+class SourceDigestTestCase(LocalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.write('setup.cfg', '[metadata]\nname = myapp\n')
+        self.write('myapp/__init__.py', 'answer = 42\n')
+        self.digest = kt.appackager.local.source_digest(self.tmpdir)
+
+    def test_source_change(self):
+        self.write('myapp/__init__.py', 'answer = 43\n')
+        self.assertNotEqual(kt.appackager.local.source_digest(self.tmpdir),
+                            self.digest)
+
+    def test_extra(self):
+        self.assertNotEqual(
+            kt.appackager.local.source_digest(self.tmpdir, '/usr/bin/python3'),
+            self.digest)
+
+    def test_ignored(self):
+        self.write('Pipfile.lock', '{}\n')
+        self.write('packages/myapp_1.0_all.deb', '')
+        self.write('build/lib/myapp/__init__.py', 'answer = 42\n')
+        self.write('myapp.egg-info/PKG-INFO', 'Name: myapp\n')
+        self.write('.tox/log.txt', 'ok\n')
+        self.assertEqual(kt.appackager.local.source_digest(self.tmpdir),
+                         self.digest)
+
+    def test_exclude(self):
+        self.write('appackager.toml', '[package]\nname = "myapp"\n')
+        self.write('debian/postinst', '#!/bin/sh\n')
+        self.assertEqual(
+            kt.appackager.local.source_digest(
+                self.tmpdir, exclude=['appackager.toml', 'debian']),
+            self.digest)
+
+    def test_archive(self):
+        sdist = self.write('dist/myapp-1.0.tar.gz', 'archive')
+        digest = kt.appackager.local.source_digest(sdist)
+        self.assertEqual(kt.appackager.local.source_digest(sdist), digest)
+        self.write('dist/myapp-1.0.tar.gz', 'changed')
+        self.assertNotEqual(kt.appackager.local.source_digest(sdist), digest)
+
+
+class WheelCacheTestCase(LocalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = kt.appackager.local.WheelCache(
+            os.path.join(self.tmpdir, 'cache'))
+        os.mkdir(self.cache.directory)
+        self.wheel = self.write('built/myapp-1.0-py3-none-any.whl', 'wheel')
+
+    def test_store_and_lookup(self):
+        self.assertIsNone(self.cache.lookup('abc'))
+        stored = self.cache.store('abc', self.wheel)
+        self.assertEqual(os.path.basename(stored),
+                         'myapp-1.0-py3-none-any.whl')
+        self.assertTrue(stored.startswith(self.cache.directory + os.sep))
+        self.assertEqual(self.cache.lookup('abc'), stored)
+        self.assertIsNone(self.cache.lookup('def'))
+
+    def test_store_existing(self):
+        first = self.cache.store('abc', self.wheel)
+        self.assertEqual(self.cache.store('abc', self.wheel), first)
+        self.assertEqual(os.listdir(self.cache.directory), ['abc'])
+
+    def test_concurrent_stores(self):
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            stored = set(executor.map(
+                lambda index: self.cache.store('abc', self.wheel),
+                range(8)))
+        self.assertEqual(stored, {self.cache.lookup('abc')})
+        self.assertEqual(os.listdir(self.cache.directory), ['abc'])
+
+    def test_prune(self):
+        for index, key in enumerate(['a', 'b', 'c']):
+            self.cache.store(key, self.wheel)
+            entry = os.path.join(self.cache.directory, key)
+            os.utime(entry, (1000 + index, 1000 + index))
+        # Use makes 'a' the most recently used entry.
+        self.cache.lookup('a')
+        self.cache.prune(keep=2)
+        self.assertEqual(sorted(os.listdir(self.cache.directory)),
+                         ['a', 'c'])
@@ -0,0 +1,109 @@
+"""\
+Tests for kt.appackager.profiling.
+
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import kt.appackager.profiling
+
+
+SCRIPT_TEMPLATE = '''\
+#!{executable} -Es
+import os
+import sys
+
+sys.path.insert(0, {lib_dir!r})
+
+{profiling}import sample
+
+if __name__ == "__main__":
+    sys.exit(_profiled(sample.main))
+'''
+
+SAMPLE_MODULE = '''\
+import sys
+
+
+def main():
+    print('output')
+    print('error output', file=sys.stderr)
+    return 3
+'''
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        lib_dir = os.path.join(self.tmpdir, 'lib')
+        os.mkdir(lib_dir)
+        with open(os.path.join(lib_dir, 'sample.py'), 'w') as f:
+            f.write(SAMPLE_MODULE)
+        self.profiles = os.path.join(self.tmpdir, 'profiles')
+        self.script = os.path.join(self.tmpdir, 'my-tool')
+        with open(self.script, 'w') as f:
+            f.write(SCRIPT_TEMPLATE.format(
+                executable=sys.executable,
+                lib_dir=lib_dir,
+                profiling=kt.appackager.profiling.setup_code(
+                    'my-tool', self.profiles, '-Es'),
+            ))
+
+    def run_script(self, profiler=None):
+        env = dict(os.environ)
+        env.pop('MY_TOOL_PROFILE', None)
+        if profiler:
+            env['MY_TOOL_PROFILE'] = profiler
+        cp = subprocess.run([sys.executable, '-Es', self.script], env=env,
+                            capture_output=True, encoding='utf-8')
+        self.assertEqual(cp.returncode, 3)
+        self.assertEqual(cp.stdout, 'output\n')
+        return cp.stderr
+
+    def profile_files(self):
+        if not os.path.isdir(self.profiles):
+            return []
+        return sorted(os.listdir(self.profiles))
+
+    def test_environment_variable(self):
+        self.assertEqual(
+            kt.appackager.profiling.environment_variable('my-tool.x'),
+            'MY_TOOL_X_PROFILE')
+
+    def test_disabled(self):
+        self.assertEqual(self.run_script(), 'error output\n')
+        self.assertEqual(self.profile_files(), [])
+
+    def test_cprofile(self):
+        self.run_script('cprofile')
+        profile, = self.profile_files()
+        self.assertTrue(profile.startswith('my-tool-'))
+        self.assertTrue(profile.endswith('.prof'))
+        # Created exclusively, and private to the user:
+        mode = os.stat(os.path.join(self.profiles, profile)).st_mode
+        self.assertEqual(mode & 0o777, 0o600)
+
+    def test_tracemalloc(self):
+        self.run_script('tracemalloc')
+        profile, = self.profile_files()
+        self.assertTrue(profile.endswith('.tracemalloc'))
+
+    def test_importtime(self):
+        # Other output on stderr is passed through.
+        self.assertEqual(self.run_script('importtime'), 'error output\n')
+        profile, = self.profile_files()
+        self.assertTrue(profile.endswith('.importtime'))
+        with open(os.path.join(self.profiles, profile)) as f:
+            content = f.read()
+        self.assertIn('| sample\n', content)
+
+    def test_unknown_profiler(self):
+        self.assertIn('unknown profiler', self.run_script('bogus'))
+        self.assertEqual(self.profile_files(), [])
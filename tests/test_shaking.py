@@ -0,0 +1,157 @@
+"""\
+Tests for kt.appackager.shaking.
+
+"""
+
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import kt.appackager.shaking
+
+
+APP_SOURCE = '''\
+import bigdep.core
+
+
+def main():
+    import bigdep.lazy
+'''
+
+
+class ModuleNameTestCase(unittest.TestCase):
+
+    def test_module_name(self):
+        module_name = kt.appackager.shaking.module_name
+        self.assertEqual(module_name('six.py'), 'six')
+        self.assertEqual(module_name('pkg/__init__.py'), 'pkg')
+        self.assertEqual(module_name('pkg/sub/mod.py'), 'pkg.sub.mod')
+        self.assertEqual(
+            module_name('pkg/__pycache__/mod.cpython-311.opt-1.pyc'),
+            'pkg.mod')
+        self.assertEqual(
+            module_name('pkg/__pycache__/__init__.cpython-311.pyc'), 'pkg')
+        self.assertEqual(module_name('pkg/mod.pyc'), 'pkg.mod')
+        self.assertEqual(
+            module_name('pkg/_ext.cpython-311-x86_64-linux-gnu.so'),
+            'pkg._ext')
+        self.assertEqual(module_name('_ext.abi3.so'), '_ext')
+
+    def test_not_modules(self):
+        module_name = kt.appackager.shaking.module_name
+        self.assertIsNone(module_name('pkg/data.json'))
+        self.assertIsNone(module_name('pkg-1.0.dist-info/RECORD'))
+        self.assertIsNone(module_name('pkg-1.0.data/scripts/tool.py'))
+        self.assertIsNone(module_name('__init__.py'))
+        self.assertIsNone(module_name('pkg/__pycache__/notes.txt'))
+
+    def test_is_kept(self):
+        keep = ['botocore.data', 'pkg.plugins.*']
+        is_kept = kt.appackager.shaking.is_kept
+        self.assertTrue(is_kept('botocore.data', keep))
+        self.assertTrue(is_kept('botocore.data.s3', keep))
+        self.assertTrue(is_kept('pkg.plugins.one', keep))
+        self.assertFalse(is_kept('botocore.database', keep))
+        self.assertFalse(is_kept('pkg.plugins', keep))
+
+    def test_find_candidates(self):
+        modules = dict.fromkeys(['app', 'dep', 'dep.core', 'dep.lazy',
+                                 'dep.extra', 'dep.extra.deep', 'other'])
+        self.assertEqual(
+            kt.appackager.shaking.find_candidates(
+                modules, {'app', 'dep', 'dep.core', 'json'},
+                keep=['dep.extra.deep']),
+            # dep.extra contains a kept module:
+            ['dep.lazy', 'other'])
+
+
+class ShakeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.libdir = os.path.join(self.tmpdir, 'lib')
+        self.write('app.py', APP_SOURCE)
+        self.write('bigdep/__init__.py', '')
+        self.write('bigdep/core.py', 'VALUE = 1\n')
+        self.write('bigdep/lazy.py', 'VALUE = 2\n')
+        self.write('bigdep/unused/__init__.py', 'VALUE = 3\n')
+        self.write('bigdep/unused/data.json', '{}\n')
+        self.write('other.py', 'VALUE = 4\n')
+
+    def write(self, relpath, content):
+        path = os.path.join(self.libdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def shake(self, runs, **kwargs):
+        return kt.appackager.shaking.shake(
+            sys.executable, self.libdir, [self.libdir], runs, **kwargs)
+
+    def test_report_only(self):
+        result = self.shake([kt.appackager.shaking.Run(
+            ['app'], 'app', 'main')])
+        self.assertEqual(sorted(result.candidates),
+                         ['bigdep.lazy', 'bigdep.unused', 'other'])
+        self.assertEqual(result.files, ['bigdep/lazy.py',
+                                        'bigdep/unused/__init__.py',
+                                        'other.py'])
+        self.assertEqual(result.size, 30)
+        self.assertFalse(result.removed)
+        self.assertTrue(os.path.exists(os.path.join(self.libdir, 'other.py')))
+
+        stream = io.StringIO()
+        result.report('myapp', stream)
+        self.assertIn('could remove 3 unused modules', stream.getvalue())
+        self.assertIn('  bigdep: 2 modules', stream.getvalue())
+
+    def test_remove(self):
+        result = self.shake(
+            [kt.appackager.shaking.Run(['app'], 'app', 'main', call=True)],
+            keep=['other'], remove=True)
+        self.assertEqual(sorted(result.candidates), ['bigdep.unused'])
+        self.assertTrue(result.removed)
+        self.assertFalse(os.path.exists(
+            os.path.join(self.libdir, 'bigdep/unused/__init__.py')))
+        # Data files are left in place:
+        self.assertTrue(os.path.exists(
+            os.path.join(self.libdir, 'bigdep/unused/data.json')))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.libdir, 'bigdep/lazy.py')))
+
+    def test_failed_run(self):
+        run = kt.appackager.shaking.Run(
+            ['app'], 'app', 'main',
+            initialization='raise RuntimeError("broken")')
+        result = self.shake([run], remove=True)
+        self.assertEqual(result.errors, [(run, 'RuntimeError: broken')])
+        self.assertFalse(result.removed)
+        self.assertTrue(os.path.exists(os.path.join(self.libdir, 'app.py')))
+
+    def test_exit(self):
+        self.write('app.py', APP_SOURCE + '    raise SystemExit(2)\n')
+        result = self.shake([kt.appackager.shaking.Run(
+            ['app'], 'app', 'main', call=True)])
+        self.assertEqual(result.errors, [])
+        self.assertNotIn('bigdep.lazy', result.candidates)
+
+    def test_remove_files(self):
+        kt.appackager.shaking.remove_files(
+            self.libdir, ['bigdep/unused/__init__.py',
+                          'bigdep/unused/data.json', 'other.py'])
+        self.assertEqual(sorted(os.listdir(self.libdir)),
+                         ['app.py', 'bigdep'])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.libdir, 'bigdep/unused')))
+
+    def test_compile_time(self):
+        self.assertEqual(
+            kt.appackager.shaking.compile_time(sys.executable, []), 0.0)
+        self.assertGreater(
+            kt.appackager.shaking.compile_time(
+                sys.executable, [os.path.join(self.libdir, 'app.py')]),
+            0.0)
@@ -0,0 +1,84 @@
+"""\
+Tests for kt.appackager.stages.
+
+"""
+
+import threading
+import time
+import unittest
+
+import kt.appackager.stages
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = kt.appackager.stages.Scheduler()
+        self.order = []
+
+    def stage(self, name, result=None, delay=0):
+        def function():
+            time.sleep(delay)
+            self.order.append(name)
+            return result
+        return function
+
+    def test_dependencies_complete_first(self):
+        self.scheduler.add('a', self.stage('a', delay=0.05))
+        self.scheduler.add('b', self.stage('b'), ['a'])
+        self.scheduler.add('c', self.stage('c', 42), ['a', 'b'])
+        results = self.scheduler.run()
+        self.assertEqual(self.order, ['a', 'b', 'c'])
+        self.assertEqual(results, {'a': None, 'b': None, 'c': 42})
+        self.assertEqual(set(self.scheduler.durations), {'a', 'b', 'c'})
+
+    def test_independent_stages_overlap(self):
+        barrier = threading.Barrier(2, timeout=5)
+        self.scheduler.add('a', barrier.wait)
+        self.scheduler.add('b', barrier.wait)
+        # Would raise BrokenBarrierError if run one after the other.
+        self.scheduler.run()
+
+    def test_failure_stops_later_stages(self):
+        def fail():
+            raise RuntimeError('broken')
+
+        self.scheduler.add('a', fail)
+        self.scheduler.add('b', self.stage('b'), ['a'])
+        self.scheduler.add('c', self.stage('c', delay=0.05))
+        with self.assertRaises(RuntimeError):
+            self.scheduler.run()
+        # Stages already running are allowed to finish.
+        self.assertEqual(self.order, ['c'])
+        self.assertNotIn('b', self.scheduler.durations)
+
+    def test_finish_after_failure(self):
+        def fail():
+            raise RuntimeError('broken')
+
+        self.scheduler.add('a', fail)
+        self.scheduler.add('b', self.stage('b'), ['a'])
+        self.scheduler.add('c', self.stage('c', delay=0.05))
+        self.scheduler.add('d', self.stage('d'), ['c'])
+        self.scheduler.add('e', self.stage('e'), ['c'])
+        with self.assertRaises(RuntimeError):
+            self.scheduler.run(finish=['b', 'd'])
+        # Named stages that don't depend on the failed stage are run.
+        self.assertEqual(self.order, ['c', 'd'])
+
+    def test_critical_path(self):
+        self.scheduler.add('slow', self.stage('slow', delay=0.1))
+        self.scheduler.add('fast', self.stage('fast'))
+        self.scheduler.add('last', self.stage('last'), ['slow', 'fast'])
+        self.scheduler.run()
+        path = [stage.name for stage in self.scheduler.critical_path()]
+        self.assertEqual(path, ['slow', 'last'])
+
+    def test_unknown_requirement(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.add('b', self.stage('b'), ['a'])
+
+    def test_duplicate_stage(self):
+        self.scheduler.add('a', self.stage('a'))
+        with self.assertRaises(ValueError):
+            self.scheduler.add('a', self.stage('a'))
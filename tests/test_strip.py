@@ -0,0 +1,71 @@
+"""\
+Tests for kt.appackager.strip.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import kt.appackager.elf
+import kt.appackager.strip
+import tests.fixtures
+
+
+def setUpModule():
+    for tool in ('strip', 'objcopy'):
+        if shutil.which(tool) is None:
+            raise unittest.SkipTest(f'{tool} not available')
+
+
+class StripTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.libdir = os.path.join(self.tmpdir, 'lib')
+        os.makedirs(os.path.join(self.libdir, 'pkg'))
+        self.path = tests.fixtures.compile_shared_object(
+            os.path.join(self.libdir, 'pkg'), '_ext.so', debug=True)
+        with open(self.path, 'rb') as f:
+            self.build_id = kt.appackager.elf.open_elf(f).build_id()
+
+    def has_debug_info(self, path):
+        with open(path, 'rb') as f:
+            return kt.appackager.elf.open_elf(f).has_debug_info()
+
+    def test_strip(self):
+        before = os.path.getsize(self.path)
+        result = kt.appackager.strip.strip_shared_objects(
+            self.libdir, ['pkg/_ext.so'])
+        self.assertEqual(result.stripped, ['pkg/_ext.so'])
+        self.assertEqual(result.debug_files, [])
+        self.assertEqual(result.size_before, before)
+        self.assertEqual(result.size_after, os.path.getsize(self.path))
+        self.assertGreater(result.saved, 0)
+        self.assertFalse(self.has_debug_info(self.path))
+        self.assertIn('saved', str(result))
+
+    def test_already_stripped(self):
+        kt.appackager.strip.strip_shared_objects(self.libdir, ['pkg/_ext.so'])
+        result = kt.appackager.strip.strip_shared_objects(
+            self.libdir, ['pkg/_ext.so'])
+        self.assertEqual(result.stripped, [])
+        self.assertEqual(result.saved, 0)
+
+    def test_separate_debug_information(self):
+        self.assertIsNotNone(self.build_id)
+        debug_root = os.path.join(self.tmpdir, 'debug')
+        result = kt.appackager.strip.strip_shared_objects(
+            self.libdir, ['pkg/_ext.so'], debug_root)
+        debug_file = os.path.join(
+            '.build-id', self.build_id[:2], self.build_id[2:] + '.debug')
+        self.assertEqual(result.debug_files, [debug_file])
+        debug_path = os.path.join(debug_root, debug_file)
+        self.assertTrue(self.has_debug_info(debug_path))
+        self.assertFalse(self.has_debug_info(self.path))
+        with open(self.path, 'rb') as f:
+            elf = kt.appackager.elf.open_elf(f)
+            self.assertEqual(elf.build_id(), self.build_id)
+            self.assertIn('.gnu_debuglink', elf.section_names())
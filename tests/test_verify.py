@@ -0,0 +1,123 @@
+"""\
+Tests for kt.appackager.verify.
+
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import kt.appackager.verify
+
+
+class VerifyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.write('bin/myapp', '#!/usr/bin/python3\n')
+        self.write('lib/python3.11/myapp/__init__.py', 'answer = 42\n')
+        self.write('lib/python3.11/myapp/py.typed', '')
+        os.symlink('myapp', os.path.join(self.tmpdir, 'bin', 'alias'))
+        self.count = kt.appackager.verify.write_manifest(self.tmpdir)
+
+    def write(self, relpath, content):
+        path = os.path.join(self.tmpdir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def verify(self, fast=False):
+        manifest = kt.appackager.verify.load_manifest(self.tmpdir)
+        return [(problem.path, problem.kind)
+                for problem in kt.appackager.verify.verify_tree(
+                    self.tmpdir, manifest, fast=fast)]
+
+    def test_manifest(self):
+        self.assertEqual(self.count, 4)
+        manifest = kt.appackager.verify.load_manifest(self.tmpdir)
+        files = manifest['files']
+        self.assertEqual(sorted(files), [
+            'bin/alias', 'bin/myapp', 'lib/python3.11/myapp/__init__.py',
+            'lib/python3.11/myapp/py.typed'])
+        self.assertEqual(files['bin/alias'], {'link': 'myapp'})
+        entry = files['lib/python3.11/myapp/__init__.py']
+        self.assertEqual(entry['sha256'],
+                         hashlib.sha256(b'answer = 42\n').hexdigest())
+        self.assertEqual(entry['size'], 12)
+        self.assertEqual(files['lib/python3.11/myapp/py.typed']['sha256'],
+                         hashlib.sha256().hexdigest())
+
+    def test_unchanged(self):
+        self.assertEqual(self.verify(), [])
+        self.assertEqual(self.verify(fast=True), [])
+
+    def test_drift(self):
+        self.write('lib/python3.11/myapp/__init__.py', 'answer = 43\n')
+        self.write('lib/python3.11/myapp/extra.py', '')
+        os.unlink(os.path.join(self.tmpdir, 'bin', 'myapp'))
+        os.unlink(os.path.join(self.tmpdir, 'bin', 'alias'))
+        os.symlink('other', os.path.join(self.tmpdir, 'bin', 'alias'))
+        self.assertEqual(self.verify(), [
+            ('bin/alias', 'modified'),
+            ('bin/myapp', 'missing'),
+            ('lib/python3.11/myapp/__init__.py', 'modified'),
+            ('lib/python3.11/myapp/extra.py', 'extra'),
+        ])
+
+    def test_fast(self):
+        path = os.path.join(self.tmpdir, 'lib/python3.11/myapp/__init__.py')
+        st = os.stat(path)
+        # Same size and time, different content: only a full check
+        # notices.
+        self.write('lib/python3.11/myapp/__init__.py', 'answer = 43\n')
+        os.utime(path, (st.st_atime, st.st_mtime))
+        self.assertEqual(self.verify(fast=True), [])
+        self.assertEqual(self.verify(),
+                         [('lib/python3.11/myapp/__init__.py', 'modified')])
+        # Touched, not changed: only a fast check notices.
+        self.write('lib/python3.11/myapp/__init__.py', 'answer = 42\n')
+        os.utime(path, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.verify(), [])
+        self.assertEqual(self.verify(fast=True),
+                         [('lib/python3.11/myapp/__init__.py', 'modified')])
+
+    def main(self, *args):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(io.StringIO()):
+            status = kt.appackager.verify.main(list(args))
+        return status, stdout.getvalue()
+
+    def test_main_status(self):
+        status, output = self.main(self.tmpdir)
+        self.assertEqual(status, kt.appackager.verify.OK)
+        self.assertEqual(output, '')
+
+        self.write('bin/myapp', '#!/usr/bin/python3.11\n')
+        status, output = self.main(self.tmpdir)
+        self.assertEqual(status, kt.appackager.verify.DRIFTED)
+        self.assertIn('modified: ' + os.path.join(self.tmpdir, 'bin/myapp'),
+                      output)
+
+        status, output = self.main(self.tmpdir, os.path.join(self.tmpdir,
+                                                             'lib'))
+        self.assertEqual(status, kt.appackager.verify.ERROR)
+
+    def test_main_json(self):
+        self.write('bin/myapp', '#!/usr/bin/python3.11\n')
+        status, output = self.main('--json', self.tmpdir)
+        result = json.loads(output)
+        self.assertEqual(result['status'], kt.appackager.verify.DRIFTED)
+        tree, = result['trees']
+        self.assertEqual(tree['files'], 4)
+        self.assertEqual(tree['problems'], [{
+            'path': 'bin/myapp',
+            'problem': 'modified',
+            'detail': 'size 22, expected 19',
+        }])